@@ -78,10 +78,11 @@ __version__ = '$Id: archivebot.py 10831 2012-12-24 14:29:26Z xqt $'
 #
 import wikipedia as pywikibot
 from pywikibot import i18n
-import pagegenerators, query
+from pywikibot.tools import LRUCache
+import pagegenerators, query, date
 Site = pywikibot.getSite()
 
-import os, re, time, locale, traceback, string, urllib
+import os, re, time, datetime, locale, traceback, string, urllib
 
 try: #Get a constructor for the MD5 hash object
     import hashlib
@@ -174,6 +175,139 @@ def txt2timestamp(txt, format):
             pass
         return None
 
+# The signature timestamps recognized by TimestampParser, in the order they
+# were tried before they were combined. H, M, d, b (the month name) and Y
+# are the fields of the timestamp; the time zone is ignored.
+_timestampFormats = [
+    # enwiki: 16:36, 30 March 2008 (UTC); nnwiki: 19:42, 25 mars 2008 (CET)
+    r'(?P<H>\d\d):(?P<M>\d\d), (?P<d>\d\d?) (?P<b>\S+) (?P<Y>\d\d\d\d) \(.*?\)',
+    # 16:36, March 30, 2008 (UTC)
+    r'(?P<H>\d\d):(?P<M>\d\d), (?P<b>\S+) (?P<d>\d\d?), (?P<Y>\d\d\d\d) \(.*?\)',
+    # huwiki: 2007. december 8., 13:42 (CET)
+    r'(?P<Y>\d{4})\. (?P<b>\S+) (?P<d>\d\d?)\., (?P<H>\d\d):(?P<M>\d\d) \(.*?\)',
+    # 18. apr 2006 kl.18:39 (UTC); 4. nov 2006 kl. 20:46 (CET)
+    r'(?P<d>\d\d?)\. (?P<b>\S+) (?P<Y>\d\d\d\d) kl\.\W*(?P<H>\d\d):(?P<M>\d\d) \(.*?\)',
+    # fiwiki: 3. joulukuuta 2008 kello 16.26 (EET)
+    r'(?P<d>\d\d?)\. (?P<b>\S+) (?P<Y>\d\d\d\d) kello \W*(?P<H>\d\d).(?P<M>\d\d) \(.*?\)',
+    # dewiki: 14:23, 12. Jan. 2009 (UTC)
+    r'(?P<H>\d\d):(?P<M>\d\d), (?P<d>\d\d?)\. (?P<b>\S+)\.? (?P<Y>\d\d\d\d) \((?:UTC|CES?T)\)',
+    # rowiki: 4 august 2012 13:01 (EEST)
+    r'(?P<d>\d\d?) (?P<b>\S+) (?P<Y>\d\d\d\d) (?P<H>\d\d):(?P<M>\d\d) \(.*?\)',
+]
+
+_timestampRegex = None
+
+# Languages whose month names are inflected in signatures, e.g. the Finnish
+# "joulukuuta" for "joulukuu"; there any word beginning with a full month name
+# is taken as that month.
+_inflectedMonthLanguages = ['fi']
+
+
+class TimestampParser(object):
+    """Finds the signature timestamps in the lines of a discussion page.
+
+    All formats are recognized by a single regular expression. The month
+    names are those of the C locale and of the current locale (see the
+    --locale option), and the month names of the wiki's language from
+    date.py. In the languages of _inflectedMonthLanguages, names which only
+    begin with a full month name, like the Finnish "joulukuuta", are
+    recognized as well. The results are cached.
+    """
+
+    def __init__(self, lang):
+        global _timestampRegex
+        if _timestampRegex is None:
+            alternatives = []
+            for i, format in enumerate(_timestampFormats):
+                format = re.sub(r'\(\?P<(\w)>', r'(?P<\g<1>%i>' % i, format)
+                alternatives.append('(?P<format%i>%s)' % (i, format))
+            _timestampRegex = re.compile('|'.join(alternatives))
+        self.lang = lang
+        self.inflected = lang in _inflectedMonthLanguages
+        self.months = {}
+        self.fullMonths = []
+        english = ['january', 'february', 'march', 'april', 'may', 'june',
+                   'july', 'august', 'september', 'october', 'november',
+                   'december']
+        for num in range(1, 13):
+            self.addMonth(english[num - 1], num)
+            self.addMonth(english[num - 1][:3], num, False)
+            if hasattr(locale, 'nl_langinfo'):
+                try:
+                    self.addMonth(int2month(num), num)
+                    self.addMonth(int2month_short(num), num, False)
+                except UnicodeError:
+                    pass
+            try:
+                self.addMonth(date.monthName(lang, num), num)
+            except KeyError:
+                pass
+        # the longest names first, so that they are tried first
+        self.fullMonths.sort(key=lambda (name, num): -len(name))
+        self.cache = LRUCache(1000)
+
+    def addMonth(self, name, num, full=True):
+        name = name.lower()
+        if name:
+            self.months[name] = num
+            if full:
+                self.fullMonths.append((name, num))
+
+    def month(self, name):
+        name = name.rstrip('.,').lower()
+        num = self.months.get(name)
+        if num is None and self.inflected:
+            for fullName, num in self.fullMonths:
+                if name.startswith(fullName):
+                    break
+            else:
+                num = None
+            self.months[name] = num
+        return num
+
+    def timestamp(self, line):
+        """Return the time of the first signature in the line, in seconds
+        since the epoch, or None if the line has no signature.
+        """
+        if '(' not in line:
+            return None
+        match = _timestampRegex.search(line)
+        if not match:
+            return None
+        text = match.group(0)
+        result = self.cache.get(text, self)
+        if result is self:
+            result = self.parse(match)
+            self.cache.put(text, result)
+        return result
+
+    def parse(self, match):
+        for i in range(len(_timestampFormats)):
+            if match.group('format%i' % i) is not None:
+                break
+        month = self.month(match.group('b%i' % i))
+        day = int(match.group('d%i' % i))
+        hour = int(match.group('H%i' % i))
+        minute = int(match.group('M%i' % i))
+        if month is None:
+            return None
+        try:
+            # impossible dates like 31 February raise ValueError
+            stamp = datetime.datetime(int(match.group('Y%i' % i)), month, day,
+                                      hour, minute)
+            return time.mktime(stamp.timetuple())
+        except (OverflowError, ValueError):
+            return None
+
+_timestampParsers = {}
+
+def timestampParser(lang):
+    """Return the TimestampParser of the language."""
+    if lang not in _timestampParsers:
+        _timestampParsers[lang] = TimestampParser(lang)
+    return _timestampParsers[lang]
+
+
 def generateTransclusions(Site, template, namespaces=[]):
     pywikibot.output(u'Fetching template transclusions...')
     transclusionPage = pywikibot.Page(Site, template, defaultNamespace=10)
@@ -194,82 +328,36 @@ class DiscussionThread(object):
     :Reply, etc. ~~~~
     """
 
-    def __init__(self, title):
+    def __init__(self, title, parser=None):
         self.title = title
-        self.content = ""
+        # the lines are joined when the content is needed
+        self.lines = []
+        self.length = 0
         self.timestamp = None
+        if parser is None:
+            parser = timestampParser(language)
+        self.parser = parser
 
     def __repr__(self):
         return '%s("%s",%d bytes)' \
-               % (self.__class__.__name__,self.title,len(self.content))
+               % (self.__class__.__name__,self.title,self.length)
+
+    @property
+    def content(self):
+        return ''.join(self.lines)
 
     def feedLine(self, line):
-        if not self.content and not line:
+        if not self.lines and not line:
             return
-        self.content += line + '\n'
+        self.lines.append(line + '\n')
+        self.length += len(line) + 1
         #Update timestamp
-# nnwiki:
-# 19:42, 25 mars 2008 (CET)
-# enwiki
-# 16:36, 30 March 2008 (UTC)
-# huwiki
-# 2007. december 8., 13:42 (CET)
-        TM = re.search(r'(\d\d):(\d\d), (\d\d?) (\S+) (\d\d\d\d) \(.*?\)', line)
-        if not TM:
-            TM = re.search(r'(\d\d):(\d\d), (\S+) (\d\d?), (\d\d\d\d) \(.*?\)', line)
-        if not TM:
-            TM = re.search(r'(\d{4})\. (\S+) (\d\d?)\., (\d\d:\d\d) \(.*?\)', line)
-# 18. apr 2006 kl.18:39 (UTC)
-# 4. nov 2006 kl. 20:46 (CET)
-        if not TM:
-            TM = re.search(r'(\d\d?)\. (\S+) (\d\d\d\d) kl\.\W*(\d\d):(\d\d) \(.*?\)', line)
-#3. joulukuuta 2008 kello 16.26 (EET)
-        if not TM:
-            TM = re.search(r'(\d\d?)\. (\S+) (\d\d\d\d) kello \W*(\d\d).(\d\d) \(.*?\)', line)
-        if not TM:
-# 14:23, 12. Jan. 2009 (UTC)
-            pat = re.compile(r'(\d\d):(\d\d), (\d\d?)\. (\S+)\.? (\d\d\d\d) \((?:UTC|CES?T)\)')
-            TM = pat.search(line)
-# ro.wiki: 4 august 2012 13:01 (EEST)
-        if not TM:
-            TM = re.search(r'(\d\d?) (\S+) (\d\d\d\d) (\d\d):(\d\d) \(.*?\)', line)
-        if TM:
-            TIME = txt2timestamp(TM.group(0),"%d. %b %Y kl. %H:%M (%Z)")
-            if not TIME:
-                TIME = txt2timestamp(TM.group(0), "%Y. %B %d., %H:%M (%Z)")
-            if not TIME:
-                TIME = txt2timestamp(TM.group(0), "%d. %b %Y kl.%H:%M (%Z)")
-            if not TIME:
-                TIME = txt2timestamp(re.sub(' *\([^ ]+\) *', '', TM.group(0)),
-                                     "%H:%M, %d %B %Y")
-            if not TIME:
-                TIME = txt2timestamp(TM.group(0), "%H:%M, %d %b %Y (%Z)")
-            if not TIME:
-                TIME = txt2timestamp(re.sub(' *\([^ ]+\) *', '', TM.group(0)),
-                                     "%H:%M, %d %b %Y")
-            if not TIME:
-                TIME = txt2timestamp(TM.group(0), "%H:%M, %b %d %Y (%Z)")
-            if not TIME:
-                TIME = txt2timestamp(TM.group(0), "%H:%M, %B %d %Y (%Z)")
-            if not TIME:
-                TIME = txt2timestamp(TM.group(0), "%H:%M, %b %d, %Y (%Z)")
-            if not TIME:
-                TIME = txt2timestamp(TM.group(0), "%H:%M, %B %d, %Y (%Z)")
-            if not TIME:
-                TIME = txt2timestamp(TM.group(0),"%d. %Bta %Y kello %H.%M (%Z)")
-            if not TIME:
-                TIME = txt2timestamp(TM.group(0), "%d %B %Y %H:%M (%Z)")
-            if not TIME:
-                TIME = txt2timestamp(re.sub(' *\([^ ]+\) *', '', TM.group(0)),
-                                     "%H:%M, %d. %b. %Y")
-            if TIME:
-                self.timestamp = max(self.timestamp, time.mktime(TIME))
-##                pywikibot.output(u'Time to be parsed: %s' % TM.group(0))
-##                pywikibot.output(u'Parsed time: %s' % TIME)
-##                pywikibot.output(u'Newest timestamp in thread: %s' % TIME)
+        timestamp = self.parser.timestamp(line)
+        if timestamp is not None:
+            self.timestamp = max(self.timestamp, timestamp)
 
     def size(self):
-        return len(self.title) + len(self.content) + 12
+        return len(self.title) + self.length + 12
 
     def toText(self):
         return "== " + self.title + ' ==\n\n' + self.content
@@ -288,6 +376,9 @@ class DiscussionThread(object):
         return ''
 
 
+threadHeaderR = re.compile('^== *([^=].*?) *== *$')
+
+
 class DiscussionPage(pywikibot.Page):
     """A class that represents a single discussion page as well as an archive
     page. Feed threads to it and run an update() afterwards."""
@@ -313,22 +404,19 @@ class DiscussionPage(pywikibot.Page):
         self.archives = {}
         self.archivedThreads = 0
         lines = self.get().split('\n')
-        found = False #Reading header
+        header = []
+        parser = timestampParser(self.site().language())
         curThread = None
         for line in lines:
-            threadHeader = re.search('^== *([^=].*?) *== *$',line)
+            threadHeader = line.startswith('==') and threadHeaderR.match(line)
             if threadHeader:
-                found = True #Reading threads now
-                if curThread:
-                    self.threads.append(curThread)
-                curThread = DiscussionThread(threadHeader.group(1))
+                curThread = DiscussionThread(threadHeader.group(1), parser)
+                self.threads.append(curThread)
+            elif curThread:
+                curThread.feedLine(line)
             else:
-                if found:
-                    curThread.feedLine(line)
-                else:
-                    self.header += line + '\n'
-        if curThread:
-            self.threads.append(curThread)
+                header.append(line + '\n')
+        self.header = ''.join(header)
         pywikibot.output(u'%d Threads found on %s' % (len(self.threads), self))
 
     def feedThread(self, thread, maxArchiveSize=(250*1024,'B')):
@@ -349,9 +437,10 @@ class DiscussionPage(pywikibot.Page):
         if sortThreads:
             pywikibot.output(u'Sorting threads...')
             self.threads.sort(key = lambda t: t.timestamp)
-        newtext = re.sub('\n*$', '\n\n', self.header) #Fix trailing newlines
+        newtext = [re.sub('\n*$', '\n\n', self.header)] #Fix trailing newlines
         for t in self.threads:
-            newtext += t.toText()
+            newtext.append(t.toText())
+        newtext = ''.join(newtext)
         if self.full:
             summary += ' ' + message('archivebot-archive-full')
         self.put(newtext, comment=summary)
@@ -295,31 +295,8 @@ class CaseChecker( object ):
                              % self.site.lang)
 
     def RunQuery(self, params):
-        while True:
-            # Get data
-            data = query.GetData(params)
-
-            # Process received data
-            yield data
-
-            # Clear any continuations first
-            if 'clcontinue' in params: del params['clcontinue']
-            if 'plcontinue' in params: del params['plcontinue']
-
-            if 'query-continue' not in data:
-                if 'gapcontinue' in params: del params['gapcontinue']
-                break
-
-            qc = data['query-continue']
-            # First continue properties only, once done, continue with allpages
-            if 'categories' in qc or 'links' in qc:
-                if 'categories' in qc: params.update(qc['categories'])
-                if 'links' in qc: params.update(qc['links'])
-            elif 'allpages' in qc:
-                params.update(qc['allpages'])
-            else:
-                raise ValueError(u'Unexpected query-continue values: %s' % qc)
-            continue
+        # The properties are continued first, then the allpages generator
+        return query.QueryIterator(self.site, params)
 
     def Run(self):
         try:
@@ -63,9 +63,9 @@ Options for several actions:
                   move and remove actions).
 
 For the actions tidy and tree, the bot will store the category structure
-locally in category.dump. This saves time and server load, but if it uses
-these data later, they may be outdated; use the -rebuild parameter in this
-case.
+locally in category.db. This saves time and server load, but if it uses
+these data later, they may be outdated; categories are loaded again after
+config.category_db_max_age days, or use the -rebuild parameter.
 
 For example, to create a new category from a list of persons, type:
 
@@ -96,7 +96,8 @@ __version__ = '$Id: category.py 10897 2013-01-12 18:51:22Z multichill $'
 # Distributed under the terms of the MIT license.
 #
 
-import os, re, pickle, bz2
+import os, re, time
+import sqlite3
 import wikipedia as pywikibot
 import catlib, config, pagegenerators
 from pywikibot import i18n
@@ -125,31 +126,110 @@ class CategoryDatabase:
     subcategories and articles, so that category pages do not need to be loaded
     over and over again
 
+    The knowledge base is an SQLite database (category.db in the data
+    directory), which holds a row for every member and every supercategory
+    of the categories loaded so far. Only the lists which are asked for are
+    read from it. A category is loaded from the wiki again when it was
+    loaded more than config.category_db_max_age days ago.
+
     '''
-    def __init__(self, rebuild = False, filename = 'category.dump.bz2'):
+    # the kinds of rows in the members table
+    SUBCAT, ARTICLE, SUPERCAT = 0, 1, 2
+
+    def __init__(self, rebuild = False, filename = 'category.db'):
+        if not os.path.isabs(filename):
+            filename = pywikibot.config.datafilepath(filename)
+        self.filename = filename
+        try:
+            self._connect()
+        except sqlite3.DatabaseError, error:
+            # If the file is damaged, start with an empty database
+            pywikibot.output(u'Cannot read %s (%s), rebuilding it'
+                             % (pywikibot.config.shortpath(filename), error))
+            os.remove(filename)
+            self._connect()
+        pywikibot.output(u'Using category database %s'
+                         % pywikibot.config.shortpath(filename))
         if rebuild:
             self.rebuild()
-        else:
-            try:
-                if not os.path.isabs(filename):
-                    filename = pywikibot.config.datafilepath(filename)
-                f = bz2.BZ2File(filename, 'r')
-                pywikibot.output(u'Reading dump from %s'
-                                 % pywikibot.config.shortpath(filename))
-                databases = pickle.load(f)
-                f.close()
-                # keys are categories, values are 2-tuples with lists as entries.
-                self.catContentDB = databases['catContentDB']
-                # like the above, but for supercategories
-                self.superclassDB = databases['superclassDB']
-                del databases
-            except:
-                # If something goes wrong, just rebuild the database
-                self.rebuild()
+
+    def _connect(self):
+        self.db = sqlite3.connect(self.filename)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS categories (
+                site TEXT, title TEXT,
+                -- when the members and the supercategories were loaded
+                contentsLoaded REAL, supercatsLoaded REAL,
+                PRIMARY KEY (site, title));
+            CREATE TABLE IF NOT EXISTS members (
+                site TEXT, category TEXT, kind INTEGER, position INTEGER,
+                title TEXT,
+                PRIMARY KEY (site, category, kind, position));
+            CREATE INDEX IF NOT EXISTS members_title
+                ON members (site, title, kind);
+            ''')
+        self.db.commit()
 
     def rebuild(self):
-        self.catContentDB={}
-        self.superclassDB={}
+        self.db.execute('DELETE FROM members')
+        self.db.execute('DELETE FROM categories')
+        self.db.commit()
+
+    def _loaded(self, cat, column):
+        """Return True if the database has the lists of cat which are
+        loaded into the column and they are not too old.
+
+        """
+        row = self.db.execute('SELECT %s FROM categories WHERE site = ? AND '
+                              'title = ?' % column,
+                              (repr(cat.site()), cat.title())).fetchone()
+        if row is None or row[0] is None:
+            return False
+        maxAge = pywikibot.config.category_db_max_age
+        return not maxAge or time.time() - row[0] < maxAge * 86400
+
+    def _store(self, cat, column, lists):
+        """Replace the lists of cat by lists, a dictionary of kinds of rows
+        to lists of pages, and mark them as loaded into column now.
+
+        """
+        site = repr(cat.site())
+        title = cat.title()
+        for kind, pages in lists.iteritems():
+            self.db.execute('DELETE FROM members WHERE site = ? AND '
+                            'category = ? AND kind = ?', (site, title, kind))
+            self.db.executemany(
+                'INSERT INTO members VALUES (?, ?, ?, ?, ?)',
+                [(site, title, kind, position, page.title())
+                 for position, page in enumerate(pages)])
+        self.db.execute('INSERT OR IGNORE INTO categories (site, title) '
+                        'VALUES (?, ?)', (site, title))
+        self.db.execute('UPDATE categories SET %s = ? WHERE site = ? AND '
+                        'title = ?' % column, (time.time(), site, title))
+        self.db.commit()
+
+    def _members(self, cat, kind):
+        """Return the pages of a kind of rows of cat."""
+        site = cat.site()
+        pages = []
+        for title, in self.db.execute(
+                'SELECT title FROM members WHERE site = ? AND category = ? '
+                'AND kind = ? ORDER BY position',
+                (repr(site), cat.title(), kind)):
+            if kind != self.ARTICLE:
+                pages.append(catlib.Category(site, title))
+            else:
+                page = pywikibot.Page(site, title)
+                if page.namespace() == 6:
+                    page = pywikibot.ImagePage(site, title)
+                pages.append(page)
+        return pages
+
+    def _loadContents(self, cat):
+        if not self._loaded(cat, 'contentsLoaded'):
+            self._store(cat, 'contentsLoaded',
+                        {self.SUBCAT: cat.subcategoriesList(),
+                         self.ARTICLE: cat.articlesList()})
 
     def getSubcats(self, supercat):
         '''For a given supercategory, return a list of Categorys for all its
@@ -157,15 +237,8 @@ class CategoryDatabase:
         be loaded from the server next time it's required.
 
         '''
-        # if we already know which subcategories exist here
-        if supercat in self.catContentDB:
-            return self.catContentDB[supercat][0]
-        else:
-            subcatlist = supercat.subcategoriesList()
-            articlelist = supercat.articlesList()
-            # add to dictionary
-            self.catContentDB[supercat] = (subcatlist, articlelist)
-            return subcatlist
+        self._loadContents(supercat)
+        return self._members(supercat, self.SUBCAT)
 
     def getArticles(self, cat):
         '''For a given category, return a list of Pages for all its articles.
@@ -173,55 +246,73 @@ class CategoryDatabase:
         server next time it's required.
 
         '''
-        # if we already know which articles exist here
-        if cat in self.catContentDB:
-            return self.catContentDB[cat][1]
-        else:
-            subcatlist = cat.subcategoriesList()
-            articlelist = cat.articlesList()
-            # add to dictionary
-            self.catContentDB[cat] = (subcatlist, articlelist)
-            return articlelist
+        self._loadContents(cat)
+        return self._members(cat, self.ARTICLE)
 
     def getSupercats(self, subcat):
-        # if we already know which subcategories exist here
-        if subcat in self.superclassDB:
-            return self.superclassDB[subcat]
-        else:
-            supercatlist = subcat.supercategoriesList()
-            # add to dictionary
-            self.superclassDB[subcat] = supercatlist
-            return supercatlist
+        if not self._loaded(subcat, 'supercatsLoaded'):
+            self._store(subcat, 'supercatsLoaded',
+                        {self.SUPERCAT: subcat.supercategoriesList()})
+        return self._members(subcat, self.SUPERCAT)
 
-    def dump(self, filename = 'category.dump.bz2'):
-        '''Saves the contents of the dictionaries superclassDB and catContentDB
-        to disk.
+    def getSubtree(self, cat, maxDepth = None):
+        '''Return a list of (Category, depth) tuples of all the categories
+        below cat, down to maxDepth levels (or all levels), each with the
+        smallest depth at which it is found, sorted by depth and title.
+
+        The tree is searched in the database, a level at a time; the
+        categories of a level which have not been loaded yet (or are too old)
+        are loaded from the wiki before the next level is searched.
 
         '''
-        if not os.path.isabs(filename):
-            filename = pywikibot.config.datafilepath(filename)
-        if self.catContentDB or self.superclassDB:
-            pywikibot.output(u'Dumping to %s, please wait...'
-                             % pywikibot.config.shortpath(filename))
-            f = bz2.BZ2File(filename, 'w')
-            databases = {
-                'catContentDB': self.catContentDB,
-                'superclassDB': self.superclassDB
-            }
-            # store dump to disk in binary format
-            try:
-                pickle.dump(databases, f, protocol=pickle.HIGHEST_PROTOCOL)
-            except pickle.PicklingError:
-                pass
-            f.close()
+        site = repr(cat.site())
+        self.db.execute('CREATE TEMP TABLE IF NOT EXISTS subtree ('
+                        'title TEXT PRIMARY KEY, depth INTEGER)')
+        self.db.execute('DELETE FROM subtree')
+        self.db.execute('INSERT INTO subtree VALUES (?, 0)', (cat.title(),))
+        maxAge = pywikibot.config.category_db_max_age
+        if maxAge:
+            loadedAfter = time.time() - maxAge * 86400
         else:
+            loadedAfter = 0
+        depth = 0
+        while maxDepth is None or depth < maxDepth:
+            for title, in self.db.execute(
+                    'SELECT subtree.title FROM subtree LEFT JOIN categories '
+                    'ON categories.site = ? AND '
+                    'categories.title = subtree.title WHERE depth = ? AND '
+                    'IFNULL(contentsLoaded, -1) <= ?',
+                    (site, depth, loadedAfter)).fetchall():
+                self._loadContents(catlib.Category(cat.site(), title))
+            # categories which were found on a higher level are ignored
+            found = self.db.execute(
+                'INSERT OR IGNORE INTO subtree SELECT members.title, ? '
+                'FROM subtree JOIN members ON members.site = ? AND '
+                'members.category = subtree.title AND members.kind = ? '
+                'WHERE subtree.depth = ?',
+                (depth + 1, site, self.SUBCAT, depth)).rowcount
+            if not found:
+                break
+            depth += 1
+        return [(catlib.Category(cat.site(), title), depth)
+                for title, depth in self.db.execute(
+                    'SELECT title, depth FROM subtree WHERE depth > 0 '
+                    'ORDER BY depth, title')]
+
+    def dump(self, filename = None):
+        '''Saves the database to disk and closes it.'''
+        self.db.commit()
+        empty = not self.db.execute('SELECT 1 FROM categories '
+                                    'LIMIT 1').fetchone()
+        self.db.close()
+        if empty:
             try:
-                os.remove(filename)
+                os.remove(self.filename)
             except EnvironmentError:
                 pass
             else:
                 pywikibot.output(u'Database is empty. %s removed'
-                                 % pywikibot.config.shortpath(filename))
+                                 % pywikibot.config.shortpath(self.filename))
 
 
 class AddCategory:
@@ -843,6 +934,10 @@ class CategoryTreeRobot:
 
         """
         cat = catlib.Category(self.site, 'Category:' + self.catTitle)
+        # load the categories of the tree a level at a time (those on the
+        # last level too, to know whether they have subcategories), so that
+        # treeview finds them all in the database
+        self.catDB.getSubtree(cat, self.maxDepth + 1)
         tree = self.treeview(cat)
         if self.filename:
             pywikibot.output(u'Saving results in %s' % self.filename)
@@ -15,7 +15,8 @@ Library to work with category pages on Wikipedia
 #
 __version__ = '$Id: catlib.py 11334 2013-04-04 06:30:35Z xqt $'
 #
-import re, time, urllib, query
+import re, sys, time, urllib, query
+import threading, Queue
 import wikipedia
 try:
     set # introduced in Python 2.4: faster and future
@@ -61,6 +62,68 @@ def unique(l):
     l.sort()
     return l
 
+# marks the end of the members of a category in the queue of _fetch()
+_DONE = object()
+
+class _Failure(object):
+    """An exception raised by a _fetch() thread, to be raised again by the
+    thread which uses the members."""
+    def __init__(self, excInfo):
+        self.excInfo = excInfo
+
+def _fetch(fetch, item, queue, stop):
+    try:
+        try:
+            for member in fetch(item):
+                if stop.isSet():
+                    break
+                queue.put(member)
+        except Exception:
+            queue.put(_Failure(sys.exc_info()))
+    finally:
+        queue.put(_DONE)
+
+def _prefetch(items, fetch, workers, stop):
+    """Yield (item, member) for every member yielded by fetch(item), for the
+    items in their order.
+
+    fetch() runs for up to workers items at the same time, each in its own
+    thread, so that the members of the next items are loaded while those of
+    the first one are used. The threads stop when the Event stop is set.
+
+    """
+    items = list(items)
+    if workers <= 1 or len(items) == 1:
+        # nothing to load meanwhile
+        for item in items:
+            for member in fetch(item):
+                yield item, member
+        return
+    queues = {}
+    def start(i):
+        queue = queues[i] = Queue.Queue()
+        thread = threading.Thread(target=_fetch,
+                                  args=(fetch, items[i], queue, stop))
+        thread.setDaemon(True)
+        thread.start()
+    for i in range(min(workers, len(items))):
+        start(i)
+    for i, item in enumerate(items):
+        queue = queues.pop(i)
+        while True:
+            try:
+                # with a timeout, so that KeyboardInterrupt gets through
+                member = queue.get(True, 1)
+            except Queue.Empty:
+                continue
+            if member is _DONE:
+                break
+            if isinstance(member, _Failure):
+                raise member.excInfo[0], member.excInfo[1], member.excInfo[2]
+            yield item, member
+        if i + workers < len(items):
+            start(i + workers)
+
 
 class Category(wikipedia.Page):
     """Subclass of Page that has some special tricks that only work for
@@ -106,88 +169,91 @@ class Category(wikipedia.Page):
         else:
             return '[[%s]]' % titleWithSortKey
 
-    def _getAndCacheContents(self, recurse=False, purge=False, startFrom=None,
-                             cache=None, sortby=None, sortdir=None,
-                             endsort=None):
+    def walk(self, recurse=True, startFrom=None, cacheResults=False,
+             sortby=None, sortdir=None, endsort=None):
         """
-        Cache results of _parseCategory for a second call.
-
-        If recurse is a bool, and value is True, then recursively retrieves
-        contents of all subcategories without limit. If recurse is an int,
-        recursively retrieves contents of subcategories to that depth only.
-
-        Other parameters are analogous to _parseCategory(). If purge is True,
-        cached results will be discarded. If startFrom is used, nothing
-        will be cached.
+        Yields all articles and subcategories of the category, each of them
+        once, as tuples (tag, page) where tag is ARTICLE or SUBCATEGORY.
+
+        If recurse is True, the contents of all subcategories are yielded as
+        well, breadth first: the contents of the subcategories follow those
+        of the category, the contents of their subcategories follow those of
+        the subcategories, and so on. If recurse is a number, subcategories
+        are only included to that depth (recurse = 1 gives the contents of
+        the subcategories, but not of their subcategories). A subcategory
+        which has been found before is not loaded again, so that cycles in
+        the category tree are harmless.
+
+        The contents of config.category_walk_threads subcategories of the
+        same depth are loaded at the same time.
+
+        startFrom only applies to the category itself. If cacheResults is
+        True, the contents of the categories are kept in their Category
+        objects, and the next call uses them instead of loading them again.
+        """
+        if recurse is True:
+            maxDepth = None
+        else:
+            maxDepth = int(recurse or 0)
+        def fetch(cat):
+            if cat is self:
+                return cat._contents(cacheResults, startFrom, sortby, sortdir,
+                                     endsort)
+            return cat._contents(cacheResults, None, sortby, sortdir, endsort)
+        seen = set([self])
+        stop = threading.Event()
+        level = [self]
+        depth = 0
+        try:
+            while level:
+                subcats = []
+                for cat, (tag, page) in _prefetch(
+                        level, fetch, wikipedia.config.category_walk_threads,
+                        stop):
+                    if page in seen:
+                        continue
+                    seen.add(page)
+                    yield tag, page
+                    if tag == SUBCATEGORY and (maxDepth is None
+                                               or depth < maxDepth):
+                        subcats.append(page)
+                level = subcats
+                depth += 1
+        finally:
+            # the threads loading the next categories are not needed anymore
+            stop.set()
+
+    def _contents(self, cacheResults=False, startFrom=None, sortby=None,
+                  sortdir=None, endsort=None):
+        """
+        Yields the articles and subcategories of this category like
+        _parseCategory(), or from the cache if cacheResults is True and the
+        contents have been cached before. If cacheResults is True and
+        neither startFrom nor endsort are used, the contents are cached.
 
         This should not be used outside of this module.
         """
-        if cache is None:
-            cache = []
-        if purge:
-            self.completelyCached = False
-        if recurse:
-            if type(recurse) is int:
-                newrecurse = recurse - 1
-            else:
-                newrecurse = recurse
-        if self.completelyCached:
+        if cacheResults and self.completelyCached:
             for article in self.articleCache:
-                if article not in cache:
-                    cache.append(article)
-                    yield ARTICLE, article
+                yield ARTICLE, article
             for subcat in self.subcatCache:
-                if subcat not in cache:
-                    cache.append(subcat)
-                    yield SUBCATEGORY, subcat
-                    if recurse:
-                        # contents of subcategory are cached by calling
-                        # this method recursively; therefore, do not cache
-                        # them again
-                        for item in subcat._getAndCacheContents(
-                                newrecurse, purge, cache=cache, sortby=sortby,
-                                sortdir=sortdir, endsort=endsort):
-                            yield item
-        else:
-            for tag, page in self._parseCategory(purge, startFrom, sortby,
-                                                 sortdir, endsort):
-                if tag == ARTICLE:
-                    self.articleCache.append(page)
-                    if not page in cache:
-                        cache.append(page)
-                        yield ARTICLE, page
-                elif tag == SUBCATEGORY:
-                    self.subcatCache.append(page)
-                    if not page in cache:
-                        cache.append(page)
-                        yield SUBCATEGORY, page
-                        if recurse:
-                            # contents of subcategory are cached by calling
-                            # this method recursively; therefore, do not cache
-                            # them again
-                            for item in page._getAndCacheContents(
-                                    newrecurse, purge, cache=cache,
-                                    sortby=sortby, sortdir=sortdir):
-                                yield item
-            if not startFrom:
-                self.completelyCached = True
-
-    def _getContentsNaive(self, recurse=False, startFrom=None, sortby=None,
-                          sortdir=None, endsort=None):
-        """
-        Simple category content yielder. Naive, do not attempts to
-        cache anything
-        """
+                yield SUBCATEGORY, subcat
+            return
+        articles = []
+        subcats = []
         for tag, page in self._parseCategory(startFrom=startFrom,
                                              sortby=sortby, sortdir=sortdir,
                                              endsort=endsort):
+            if cacheResults:
+                if tag == ARTICLE:
+                    articles.append(page)
+                else:
+                    subcats.append(page)
             yield tag, page
-            if tag == SUBCATEGORY and recurse:
-                for item in page._getContentsNaive(recurse=True,
-                                                   sortby=sortby,
-                                                   sortdir=sortdir,
-                                                   endsort=endsort):
-                    yield item
+        if cacheResults and not startFrom and not endsort:
+            self.articleCache = articles
+            self.subcatCache = subcats
+            self.completelyCached = True
 
     def _parseCategory(self, purge=False, startFrom=None, sortby=None,
                        sortdir=None, endsort=None):
@@ -209,7 +275,6 @@ class Category(wikipedia.Page):
                 yield tag, page
             return
 
-        currentPageOffset = None
         params = {
             'action': 'query',
             'list': 'categorymembers',
@@ -223,61 +288,37 @@ class Category(wikipedia.Page):
             params['cmsort'] = sortby
         if sortdir:
             params['cmdir'] = sortdir
-        while True:
-            if wikipedia.config.special_page_limit > 500:
-                params['cmlimit'] = 500
-            else:
-                params['cmlimit'] = wikipedia.config.special_page_limit
-
-            if currentPageOffset:
-                params.update(currentPageOffset)
-                wikipedia.output('Getting [[%s]] list from %s...'
-                                 % (self.title(),
-                                    "%s=%s" % currentPageOffset.popitem()))
-            else:
-                msg = 'Getting [[%s]] list' % self.title()
-                # category sort keys are uppercase
-                if startFrom:
-                    startFrom = startFrom.upper()
-                    params['cmstartsortkey'] = startFrom
-                    msg += ' starting at %s' % startFrom
-                if endsort:
-                    endsort = endsort.upper()
-                    params['cmendsortkey'] = endsort
-                    msg += ' ending at %s' % endsort
-                wikipedia.output(msg + u'...')
-
-            wikipedia.get_throttle()
-            data = query.GetData(params, self.site())
-            if 'error' in data:
-                raise RuntimeError("%s" % data['error'])
-            count = 0
-
-            for memb in data['query']['categorymembers']:
-                count += 1
-                # For MediaWiki versions where subcats look like articles
-                if memb['ns'] == 14:
-                    if 'sortkeyprefix' in memb:
-                        sortKeyPrefix = memb['sortkeyprefix']
-                    else:
-                        sortKeyPrefix = None
-                    yield SUBCATEGORY, \
-                          Category(self.site(), memb['title'],
-                                   sortKey=memb['sortkey'],
-                                   sortKeyPrefix=sortKeyPrefix)
-                elif memb['ns'] == 6:
-                    yield ARTICLE, wikipedia.ImagePage(self.site(),
-                                                       memb['title'])
+        msg = 'Getting [[%s]] list' % self.title()
+        # category sort keys are uppercase
+        if startFrom:
+            startFrom = startFrom.upper()
+            params['cmstartsortkey'] = startFrom
+            msg += ' starting at %s' % startFrom
+        if endsort:
+            endsort = endsort.upper()
+            params['cmendsortkey'] = endsort
+            msg += ' ending at %s' % endsort
+        wikipedia.output(msg + u'...')
+
+        for memb in query.QueryIterator(
+                self.site(), params, 'categorymembers', 'cmlimit',
+                requestLimit=min(wikipedia.config.special_page_limit, 500),
+                throttle=True):
+            # For MediaWiki versions where subcats look like articles
+            if memb['ns'] == 14:
+                if 'sortkeyprefix' in memb:
+                    sortKeyPrefix = memb['sortkeyprefix']
                 else:
-                    yield ARTICLE, wikipedia.Page(self.site(), memb['title'],
-                                                  defaultNamespace=memb['ns'])
-                if count >= params['cmlimit']:
-                    break
-            # try to find a link to the next list page
-            if 'query-continue' in data and count < params['cmlimit']:
-                currentPageOffset = data['query-continue']['categorymembers']
+                    sortKeyPrefix = None
+                yield SUBCATEGORY, \
+                      Category(self.site(), memb['title'],
+                               sortKey=memb['sortkey'],
+                               sortKeyPrefix=sortKeyPrefix)
+            elif memb['ns'] == 6:
+                yield ARTICLE, wikipedia.ImagePage(self.site(), memb['title'])
             else:
-                break
+                yield ARTICLE, wikipedia.Page(self.site(), memb['title'],
+                                              defaultNamespace=memb['ns'])
 
     def _oldParseCategory(self, purge=False, startFrom=None):
         """
@@ -400,14 +441,12 @@ class Category(wikipedia.Page):
         system is *not* meant to be memory or cpu efficient for large
         categories
 
-        Results a sorted (as sorted by MediaWiki), but need not be unique.
+        Results are sorted (as sorted by MediaWiki) within each category,
+        and unique. See walk() for the order of recursive results.
         """
-        if cacheResults:
-            gen = self._getAndCacheContents
-        else:
-            gen = self._getContentsNaive
-        for tag, subcat in gen(recurse=recurse, startFrom=startFrom, sortby=sortby,
-                               sortdir=sortdir):
+        for tag, subcat in self.walk(recurse=recurse, startFrom=startFrom,
+                                     cacheResults=cacheResults, sortby=sortby,
+                                     sortdir=sortdir):
             if tag == SUBCATEGORY:
                 yield subcat
 
@@ -439,15 +478,12 @@ class Category(wikipedia.Page):
         system is *not* meant to be memory or cpu efficient for large
         categories
 
-        Results are unsorted (except as sorted by MediaWiki), and need not
-        be unique.
+        Results are unsorted (except as sorted by MediaWiki), and unique.
+        See walk() for the order of recursive results.
         """
-        if cacheResults:
-            gen = self._getAndCacheContents
-        else:
-            gen = self._getContentsNaive
-        for tag, page in gen(recurse=recurse, startFrom=startFrom,
-                             sortby=sortby, sortdir=sortdir, endsort=endsort):
+        for tag, page in self.walk(recurse=recurse, startFrom=startFrom,
+                                   cacheResults=cacheResults, sortby=sortby,
+                                   sortdir=sortdir, endsort=endsort):
             if tag == ARTICLE:
                 yield page
 
@@ -682,11 +718,9 @@ def change_category(article, oldCat, newCat, comment=None, sortKey=None,
             wikipedia.output(u"Saving page %s failed: %s"
                              % (article.title(asLink=True), error.message))
 
-def categoryAllElementsAPI(CatName, cmlimit = 5000, categories_parsed = [], site = None):
+def _categoryMembersAPI(CatName, cmlimit, site):
+    """Load the members of one category for categoryAllElementsAPI()."""
     #action=query&list=categorymembers&cmlimit=500&cmtitle=Category:License_tags
-    """
-    Category to load all the elements in a category using the APIs. Limit: 5000 elements.
-    """
     wikipedia.output("Loading %s..." % CatName)
 
     params = {
@@ -697,36 +731,55 @@ def categoryAllElementsAPI(CatName, cmlimit = 5000, categories_parsed = [], site
         }
 
     data = query.GetData(params, site)
-    categories_parsed.append(CatName)
     try:
         members = data['query']['categorymembers']
     except KeyError:
         if int(cmlimit) != 500:
             wikipedia.output(u'An Error occured, trying to reload the category.')
-            return categoryAllElementsAPI(CatName, cmlimit = 500)
+            return _categoryMembersAPI(CatName, 500, site)
         else:
             raise wikipedia.Error(data)
     if len(members) == int(cmlimit):
         raise wikipedia.Error(u'The category selected has >= %s elements, limit reached.' % cmlimit)
-    allmembers = members
-    results = list()
-    for subcat in members:
-        ns = subcat['ns']
-        pageid = subcat['pageid']
-        title = subcat['title']
-        if ns == 14:
-            if title not in categories_parsed:
-                categories_parsed.append(title)
-                (results_part, categories_parsed) = categoryAllElementsAPI(title, 5000, categories_parsed)
-                allmembers.extend(results_part)
-    for member in allmembers:
-        ns = member['ns']
-        pageid = member['pageid']
-        title = member['title']
-        results.append(member)
+    return members
+
+def categoryAllElementsAPI(CatName, cmlimit = 5000, categories_parsed = None, site = None):
+    """
+    Category to load all the elements in a category and its subcategories
+    using the APIs. Limit: 5000 elements per category.
+
+    Returns the members, as dictionaries with the keys 'ns', 'pageid' and
+    'title', and the titles of the categories which were loaded, which are
+    added to categories_parsed if it is given. Categories in
+    categories_parsed are not loaded. The subcategories are loaded breadth
+    first, config.category_walk_threads of them at the same time.
+    """
+    if categories_parsed is None:
+        categories_parsed = []
+    parsed = set(categories_parsed)
+    parsed.add(CatName)
+    categories_parsed.append(CatName)
+    results = []
+    level = [CatName]
+    stop = threading.Event()
+    try:
+        while level:
+            subcats = []
+            for cat, member in _prefetch(
+                    level, lambda title: _categoryMembersAPI(title, cmlimit,
+                                                             site),
+                    wikipedia.config.category_walk_threads, stop):
+                results.append(member)
+                if member['ns'] == 14 and member['title'] not in parsed:
+                    parsed.add(member['title'])
+                    categories_parsed.append(member['title'])
+                    subcats.append(member['title'])
+            level = subcats
+    finally:
+        stop.set()
     return (results, categories_parsed)
 
-def categoryAllPageObjectsAPI(CatName, cmlimit = 5000, categories_parsed = [], site = None):
+def categoryAllPageObjectsAPI(CatName, cmlimit = 5000, categories_parsed = None, site = None):
     """
     From a list of dictionaries, return a list of page objects.
     """
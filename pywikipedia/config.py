@@ -233,6 +233,11 @@ interwiki_graph = False
 # once.
 interwiki_min_subjects = 100
 
+# Number of sites from which interwiki.py loads pages at the same time, in
+# separate threads (see the -parallel parameter). With 1, the sites are
+# queried one after another.
+interwiki_parallel_sites = 1
+
 # If interwiki graphs are enabled, which format(s) should be used?
 # Supported formats include png, jpg, ps, and svg. See:
 # http://www.graphviz.org/doc/info/output.html
@@ -261,6 +266,22 @@ without_interwiki = False
 # them in RAM.
 interwiki_contents_on_disk = False
 
+# How many of the page texts stored on disk by interwiki_contents_on_disk
+# are kept in RAM as well (those used last).
+interwiki_contents_in_memory = 100
+
+############## CATEGORY SETTINGS ##############
+# category.py keeps the members and supercategories of the categories it has
+# loaded in category.db. Those which were loaded more than this many days
+# ago are loaded from the wiki again when they are used; 0 keeps them until
+# the -rebuild parameter is given.
+category_db_max_age = 30
+
+# When the contents of the subcategories of a category are loaded, e.g. by
+# the -catr parameter, this many subcategories are loaded at the same time.
+# The throttle still limits how many requests are sent per second.
+category_walk_threads = 4
+
 ############## SOLVE_DISAMBIGUATION SETTINGS ############
 #
 # Set disambiguation_comment[FAMILY][LANG] to a non-empty string to override
@@ -292,6 +313,12 @@ maxthrottle = 60
 # 'put_throttle' seconds.
 put_throttle = 10
 
+# The throttle keeps a "bucket" per host which allows one read every
+# 'minthrottle' seconds. After a pause, up to 'throttle_burst' reads may be
+# made without waiting. All bot processes of this user share the buckets,
+# so the rate per host does not grow with the number of processes.
+throttle_burst = 1
+
 # Sometimes you want to know when a delay is inserted. If a delay is larger
 # than 'noisysleep' seconds, it is logged on the screen.
 noisysleep = 3.0
@@ -332,6 +359,12 @@ table2wikiSkipWarnings = False
 # that slow servers won't slow you down.
 max_external_links = 50
 
+# How many of these links may point to the same host, and how many seconds
+# should pass between two requests to the same host? Links to other hosts
+# are checked in the meantime.
+max_external_links_per_host = 2
+external_links_host_delay = 0.5
+
 report_dead_links_on_talk = False
 
 ############## DATABASE SETTINGS ##############
@@ -442,6 +475,15 @@ copyright_economize_query = True
 # Default socket timeout. Set to None to disable timeouts.
 socket_timeout = 120  # set a pretty long timeout just in case...
 
+# Keep the connections to the wikis open and use them again for the next
+# requests (HTTP keep-alive), instead of connecting for every request.
+http_keepalive = True
+# Maximum number of idle connections which are kept open per host.
+http_pool_size = 4
+# Idle connections older than this number of seconds are not used again,
+# as the server has probably closed them.
+http_idle_timeout = 30
+
 
 ############## COSMETIC CHANGES SETTINGS ##############
 # The bot can make some additional changes to each page it edits, e.g. fix
@@ -476,9 +518,30 @@ cosmetic_changes_disable = {}
 
 ############## FURTHER SETTINGS ##############
 
+# If True, replaceExcept() computes the parts of the text protected by the
+# exceptions once and replaces in the gaps between them, which is much faster
+# on long texts. The default engine searches the already replaced text again
+# after every match, and the masking engine does not, so some patterns give
+# different results:
+# * lookbehinds and anchors see the original text, e.g. (?<=x)x -> y turns
+#   xxx into xyy instead of xyx, and ^a -> '' turns aaaa into aaa instead of '';
+# * the exceptions are found in the original text, e.g. a replacement which
+#   creates a line starting with a space does not protect that line
+#   ('startspace').
+replace_masking = False
+
+# Number of worker processes which search XML dumps in replace.py and
+# redirect.py (see the -xmlprocesses parameter). 1 searches the dump in the
+# bot's own process.
+xml_processes = 1
+
 # Use the experimental disk cache to prevent huge memory usage
 use_diskcache = False
 
+# Store the messages of the i18n files in the cache/i18n directory, one
+# block per language, so that bots only load the languages they use.
+i18n_catalogs = True
+
 # Retry loading a page on failure (back off 1 minute, 2 minutes, 4 minutes
 # up to 30 minutes)
 retry_on_fail = True
@@ -497,6 +560,46 @@ actions_to_block = ['edit', 'watch', 'move', 'delete', 'undelete', 'protect',
 # processing. As higher this value this effect will decrease.
 max_queue_size = 64
 
+# How many threads per site should save the pages put asynchronously. The
+# pages of a site are started in the order in which they were put; with more
+# than one thread, several of them may be saved at the same time, but not
+# faster than put_throttle allows.
+put_async_workers = 1
+
+# Keep a journal of the pages put asynchronously in the put-journal
+# directory, so that the pages which were still in the queue when the bot
+# stopped (e.g. because it crashed) are saved when the same script puts a
+# page asynchronously the next time.
+put_async_journal = False
+
+# How many parsed page titles to keep in memory, so that creating a Page for
+# a title which has been seen before is fast. 0 disables the cache.
+page_title_cache_size = 20000
+
+# If True, creating a Page for a title returns the existing Page object for
+# that title if there is one still in use, so that the contents loaded for
+# one of them are known to all.
+page_intern_pool = False
+
+# Keep the texts of the pages which have been loaded in the cache directory,
+# and load only the texts of those which have changed since from the wiki
+# (see pywikibot/contentcache.py). Needs the API.
+page_content_cache = False
+
+# The maximum size of the texts kept by page_content_cache, in megabytes
+# (compressed). The pages used least recently are removed first.
+page_content_cache_size = 200
+
+# How many batches of pages PreloadingGenerator should load in advance in a
+# background thread. If this is 0, every batch is loaded only when the
+# previous one has been consumed.
+preload_prefetch = 0
+
+# Whether query.QueryIterator, which loads long lists like Special:Allpages or
+# the members of a category from the API, should request the next part of
+# the list in a background thread while the current one is being processed.
+api_prefetch = True
+
 # Define the line separator. Pages retrieved via API have "\n" whereas
 # pages fetched from screen (mostly) have "\r\n". Interwiki and category
 # separator settings in family files should use multiplied of this.
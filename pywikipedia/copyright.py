@@ -85,6 +85,7 @@ You can include also the text to examine directly on the command line:
 import re, codecs, os, time, urllib, urllib2, httplib
 import wikipedia as pywikibot
 import pagegenerators, config
+from pywikibot.tools import MultiMatcher
 
 __version__='$Id: copyright.py 10831 2012-12-24 14:29:26Z xqt $'
 
@@ -311,6 +312,7 @@ def cut_section(text, sectC):
 class URLExclusion:
     def __init__(self):
         self.URLlist = set()
+        self._matcher = None
         self.scan()
 
     def pages_list(self):
@@ -360,13 +362,19 @@ class URLExclusion:
         self.scan()
 
     def check(self, url, verbose = False):
-        for entry in self.URLlist:
-           if entry in url:
-               if verbose > 1:
-                   warn('URL Excluded: %s\nReason: %s' % (url, entry))
-               elif verbose:
-                   warn('URL Excluded: %s' % url)
-               return True
+        # URLs are only ever added to the list (also by WebPage), so the
+        # matcher is outdated if the size of the list has changed
+        if self._matcher is None or self._matcherSize != len(self.URLlist):
+            self._matcherSize = len(self.URLlist)
+            self._matcher = MultiMatcher(self.URLlist)
+        match = self._matcher.search(url)
+        if match:
+            entry = match[2]
+            if verbose > 1:
+                warn('URL Excluded: %s\nReason: %s' % (url, entry))
+            elif verbose:
+                warn('URL Excluded: %s' % url)
+            return True
         return False
 
     def scan(self):
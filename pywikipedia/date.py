@@ -19,6 +19,7 @@ __version__='$Id: date.py 10461 2012-07-22 16:33:39Z xqt $'
 # used for date recognition
 import types
 import re
+import threading
 import wikipedia as pywikibot
 
 #
@@ -166,6 +167,8 @@ def slh( value, lst ):
 
     """
     if type(value) in _stringTypes:
+        if _probed is not None:
+            _probed.extend([(None, item) for item in lst])
         return lst.index(value)+1
     else:
         return lst[value-1]
@@ -181,6 +184,8 @@ def dh_constVal( value, ind, match ):
 
     """
     if type(value) in _stringTypes:
+        if _probed is not None:
+            _probed.append((None, match))
         if value == match:
             return ind
         else:
@@ -287,6 +292,13 @@ _reParameters = re.compile(u'|'.join([ u'(%%[1-9]?%s)' % s for s in _digitDecode
 # A map of   sitecode+pattern  to  (re matching object and corresponding
 # decoders)
 _escPtrnCache2 = {}
+# A map of   pattern  to  (text before the first value, text after the last
+# value), or (whole text, None) if the pattern has no values
+_escPtrnAffixes = {}
+
+# While getAutoFormat() builds the table of a language, the patterns and
+# constant strings the decoders use are recorded here
+_probed = None
 
 # Allow both unicode and single-byte strings
 _stringTypes = [unicode, str]
@@ -299,10 +311,15 @@ def escapePattern2( pattern ):
 
     """
 
+    if _probed is not None:
+        _probed.append((pattern, None))
     if pattern not in _escPtrnCache2:
         newPattern = u'^' # begining of the string
         strPattern = u''
         decoders = []
+        # literal text since the last value
+        text = u''
+        prefix = None
         for s in _reParameters.split(pattern):
             if s is None:
                 pass
@@ -314,6 +331,7 @@ def escapePattern2( pattern ):
                     if len(s) == 3: raise AssertionError("Invalid pattern %s: Cannot use zero padding size in %s!" % (pattern, s))
                     newPattern += re.escape( dec )
                     strPattern += s         # Keep the original text
+                    text += dec
                 else:
                     if len(s) == 3:
                         # enforce mandatory field size
@@ -328,13 +346,21 @@ def escapePattern2( pattern ):
                     # this causes problem with the zero padding.
                     # Need to rethink
                     strPattern += u'%s'
+                    if prefix is None:
+                        prefix = text
+                    text = u''
             else:
                 newPattern += re.escape( s )
                 strPattern += s
+                text += s
 
         newPattern += u'$' # end of the string
         compiledPattern = re.compile( newPattern )
         _escPtrnCache2[pattern] = (compiledPattern, strPattern, decoders)
+        if prefix is None:
+            _escPtrnAffixes[pattern] = (text, None)
+        else:
+            _escPtrnAffixes[pattern] = (prefix, text)
 
     return _escPtrnCache2[pattern]
 
@@ -1737,11 +1763,91 @@ def getNumberOfDaysInMonth(month):
     """Returns the number of days in a given month, 1 being January, etc."""
     return formatLimits[dayMnthFmts[month-1]][2]-1
 
+# lang -> the table getAutoFormat() uses to find the formats a title may have
+_autoFormatTables = {}
+_autoFormatLock = threading.Lock()
+
+def _autoFormatTable(lang):
+    """Returns the table of the formats of lang for getAutoFormat().
+
+    The table is built when it is needed for the first time: every decoder of
+    lang is called with a title no format has, and the patterns, month names
+    and other constant strings it tries are recorded. The table has:
+      * the format names in the order of the formats map
+      * a map of the constant strings to the names of the formats using them
+      * a map of the first character of the pattern prefixes (the text before
+        the first value) to a list of (prefix, suffix, format name)
+      * a map of the last character of the suffixes of the patterns which
+        start with a value to a list of (suffix, format name)
+      * the names of the formats with patterns that are only a value
+
+    """
+    global _probed
+    table = _autoFormatTables.get(lang)
+    if table is not None:
+        return table
+    names = []
+    constants = {}
+    prefixes = {}
+    suffixes = {}
+    bare = []
+    _autoFormatLock.acquire()
+    try:
+        for dictName, dict in formats.iteritems():
+            if lang not in dict:
+                continue
+            names.append(dictName)
+            _probed = probed = []
+            try:
+                dict[lang](u'\uffff')
+            except:
+                pass
+            _probed = None
+            for pattern, constant in probed:
+                if pattern is None:
+                    constants.setdefault(constant, []).append(dictName)
+                    continue
+                prefix, suffix = _escPtrnAffixes[pattern]
+                if suffix is None:
+                    constants.setdefault(prefix, []).append(dictName)
+                elif prefix:
+                    prefixes.setdefault(prefix[0], []).append(
+                        (prefix, suffix, dictName))
+                elif suffix:
+                    suffixes.setdefault(suffix[-1], []).append(
+                        (suffix, dictName))
+                else:
+                    bare.append(dictName)
+    finally:
+        _probed = None
+        _autoFormatLock.release()
+    table = (names, constants, prefixes, suffixes, bare)
+    _autoFormatTables[lang] = table
+    return table
+
+def _autoFormatCandidates(lang, title):
+    """Returns the names of the formats of lang which may match title, in the
+    order of the formats map.
+
+    """
+    names, constants, prefixes, suffixes, bare = _autoFormatTable(lang)
+    candidates = set(bare)
+    candidates.update(constants.get(title, ()))
+    for prefix, suffix, dictName in prefixes.get(title[:1], ()):
+        if title.startswith(prefix) and title.endswith(suffix) \
+           and len(title) > len(prefix) + len(suffix):
+            candidates.add(dictName)
+    for suffix, dictName in suffixes.get(title[-1:], ()):
+        if title.endswith(suffix) and len(title) > len(suffix):
+            candidates.add(dictName)
+    return [dictName for dictName in names if dictName in candidates]
+
 def getAutoFormat( lang, title, ignoreFirstLetterCase = True ):
     """Returns (dictName,value), where value can be a year, date, etc, and dictName is 'YearBC', 'December', etc."""
-    for dictName, dict in formats.iteritems():
+    # only the formats whose patterns fit the title are tried
+    for dictName in _autoFormatCandidates(lang, title):
         try:
-            year = dict[ lang ]( title )
+            year = formats[dictName][ lang ]( title )
             return dictName, year
         except:
             pass
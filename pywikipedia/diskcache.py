@@ -2,82 +2,185 @@
 
 __version__ = '$Id: diskcache.py 10122 2012-04-16 14:27:09Z xqt $'
 
-import random
-import config
+import glob
+import marshal
+import mmap
 import os
-
-# http://mail.python.org/pipermail/python-list/2006-March/375280.html
+import struct
+import zlib
 try:
-     os.SEEK_SET
-except AttributeError:
-     os.SEEK_SET, os.SEEK_CUR, os.SEEK_END = range(3)
+    from hashlib import md5
+except ImportError:             # Python 2.4 compatibility
+    from md5 import new as md5
+
+import config
+from pywikibot.tools import LRUCache
 
 ## Dictionary like disk caching module
 ## (c) Copyright 2008 - Bryan Tong Minh / The Pywikipediabot team
 ## Licensed under the terms of the MIT license
 
+# The cache file starts with a header: the magic string, the number of
+# items and the number of slots of the hash table. The table follows; every
+# slot holds the CRC-32 of a key and the offset of its record, or 0 if it is
+# empty. Each record holds the lengths of the key and the value, the key
+# in UTF-8 and the marshalled value.
+_MAGIC = 'PWBDC2'
+_HEADER = struct.Struct('<6sII')
+_SLOT = struct.Struct('<II')
+_RECORD = struct.Struct('<II')
+
+
+def _hash(key):
+    return zlib.crc32(key) & 0xFFFFFFFF
+
+
+def _key(key):
+    """Return key lowercased and encoded in UTF-8."""
+    if type(key) is str:
+        try:
+            key = key.decode('utf-8')
+        except UnicodeDecodeError:
+            return key.lower()
+    elif type(key) is not unicode:
+        key = unicode(key)
+    # lowercase before encoding, str.lower() changes only ASCII letters
+    return key.lower().encode('utf-8')
+
+
 class CachedReadOnlyDictI(object):
-    """A cached readonly dict with case insensitive keys."""
+    """A cached readonly dict with case insensitive keys.
+
+    The items are written to a file in the cache directory, which is mapped
+    into memory and indexed by a hash table. Only the values which are
+    looked up are loaded; the last max_size of them are kept in memory.
+
+    The name of the file is made from prefix and a digest of the items, so
+    that a later run with the same items uses the file again instead of
+    writing it.
+
+    """
     def __init__(self, data, prefix = "", max_size = 10, cache_base = 'cache'):
-        self.max_size = max_size
-        while True:
-            self.cache_path = config.datafilepath(cache_base, prefix + ''.join(
-                [random.choice('abcdefghijklmnopqrstuvwxyz')
-                    for i in xrange(16)]))
-            if not os.path.exists(self.cache_path): break
-        self.cache_file = open(self.cache_path, 'wb+')
-
-        lookup = [-1] * 36
-        data.sort(key = lambda i: i[0])
+        items = {}
         for key, value in data:
-            if type(key) is unicode:
-                key = key.encode('utf-8')
-            elif type(key) != str:
-                key = str(key)
-            key = key.lower()
-            index = key[0]
-            if not ((index >= 'a' and index <= 'z') or (index >= '0' and index <= '9')) or '\t' in key:
-                raise RuntimeError('Only alphabetic keys are supported', key)
-
-            if index < 'a':
-                index = ord(index) - 48 + 26 # Numeric
-            else:
-                index = ord(index) - 97
-            if lookup[index] == -1:
-                lookup[index] = self.cache_file.tell()
-
-            if type(value) is unicode:
-                value = value.encode('utf-8')
-            elif type(value) != str:
-                value = str(value)
-
-            if len(key) > 0xFF:
-                raise RuntimeError('Key length must be smaller than %i' % 0xFF)
-            if len(value) > 0xFFFFFF:
-                raise RuntimeError('Value length must be smaller than %i' % 0xFFFFFF)
-
-            self.cache_file.write('%02x%s%06x%s' % (len(key), key, len(value), value))
-
-        self.lookup = lookup
-
-        self.cache_file.close()
-        self.cache_file = open(self.cache_path, 'rb')
-        self.cache_file.seek(0)
-        self.cache = []
+            items[_key(key)] = marshal.dumps(value)
+        keys = sorted(items)
+        digest = md5()
+        for key in keys:
+            digest.update(_RECORD.pack(len(key), len(items[key])))
+            digest.update(key)
+            digest.update(items[key])
+        self.cache_path = config.datafilepath(
+            cache_base, prefix + digest.hexdigest()[:16])
+        self.cache = LRUCache(max_size)
+        self.cache_file = None
+        self.mmap = None
+        if not self._open():
+            self._write(keys, items)
+            self._removeOld(prefix, cache_base)
+            if not self._open():
+                raise RuntimeError('Cannot read cache file %s'
+                                   % self.cache_path)
+
+    def _write(self, keys, items):
+        """Write the cache file under a temporary name and rename it, so
+        that other bots never read a half-written file.
+
+        """
+        size = 8
+        while size < 2 * len(keys):
+            size *= 2
+        table = [0] * (2 * size)
+        records = []
+        offset = _HEADER.size + _SLOT.size * size
+        for key in keys:
+            value = items[key]
+            h = _hash(key)
+            slot = h & (size - 1)
+            while table[2 * slot + 1]:
+                slot = (slot + 1) & (size - 1)
+            table[2 * slot] = h
+            table[2 * slot + 1] = offset
+            records.append(_RECORD.pack(len(key), len(value)))
+            records.append(key)
+            records.append(value)
+            offset += _RECORD.size + len(key) + len(value)
+        tmpname = '%s.%i' % (self.cache_path, os.getpid())
+        f = open(tmpname, 'wb')
+        try:
+            f.write(_HEADER.pack(_MAGIC, len(keys), size))
+            f.write(struct.pack('<%iI' % len(table), *table))
+            f.write(''.join(records))
+        finally:
+            f.close()
+        if os.name == 'nt' and os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+        os.rename(tmpname, self.cache_path)
+
+    def _open(self):
+        """Map the cache file into memory. Return False if there is no valid
+        cache file.
+
+        """
+        try:
+            f = open(self.cache_path, 'rb')
+        except IOError:
+            return False
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError):
+            f.close()
+            return False
+        if data.size() < _HEADER.size:
+            magic = None
+        else:
+            magic, count, size = _HEADER.unpack_from(data)
+        if magic != _MAGIC or data.size() < _HEADER.size + _SLOT.size * size:
+            data.close()
+            f.close()
+            return False
+        self.cache_file = f
+        self.mmap = data
+        self.count = count
+        self.size = size
+        return True
+
+    def _removeOld(self, prefix, cache_base):
+        """Remove the cache files of earlier runs with other items."""
+        pattern = config.datafilepath(cache_base, prefix + '*')
+        for filename in glob.glob(pattern):
+            name = os.path.basename(filename)[len(prefix):]
+            if len(name) == 16 and filename != self.cache_path:
+                try:
+                    os.unlink(filename)
+                except OSError:
+                    # it is still used by another bot (on Windows)
+                    pass
+
+    def close(self):
+        """Close the cache file. It is kept for the next run with the same
+        items.
+
+        """
+        try:
+            if self.mmap is not None:
+                self.mmap.close()
+            if self.cache_file is not None:
+                self.cache_file.close()
+        except (IOError, ValueError):
+            pass
 
     def delete(self):
         """
-        Method is called from wikipedia._flush, on Python exit
+        Close and remove the cache file.
+        Method may be called on Python exit:
         Some modules might already have been unloaded, and some
         objects might already have been freed:
         1) We have to reload all modules used
         2) We have to dereference the loaded modules after usage
         3) Strange errors can be raised here, we don't care.
         """
-        try:
-            self.cache_file.close()
-        except IOError:
-            pass
+        self.close()
         try:
             try:
                 import os
@@ -87,55 +190,38 @@ class CachedReadOnlyDictI(object):
         finally:
             os = None
 
-    def __getitem__(self, key):
-        key = key.lower()
-        if type(key) is unicode:
-            key = key.encode('utf-8')
+    def __len__(self):
+        return self.count
 
+    def __contains__(self, key):
         try:
-            index = key[0]
-        except IndexError:
-            raise KeyError(key)
-        if not ((index >= 'a' and index <= 'z') or (index >= '0' and index <= '9')):
-            raise KeyError(key)
-
-        if index < 'a':
-            i = ord(index) - 48 + 26 # Numeric
-        else:
-            i = ord(index) - 97
+            self[key]
+        except KeyError:
+            return False
+        return True
 
-        for k, v in self.cache:
-            if k == key:
-                self.cache.remove((k, v))
-                self.cache.append((k, v))
+    def __getitem__(self, key):
+        key = _key(key)
 
-        try:
-            k, v = self.cache[-1]
-            if k == key:
-                return v
-        except IndexError:
-            pass
+        value = self.cache.get(key, self)
+        if value is not self:
+            return value
 
-        self.cache_file.seek(self.lookup[i])
+        data = self.mmap
+        h = _hash(key)
+        mask = self.size - 1
+        slot = h & mask
         while True:
-            length = int(self.read(2, key), 16)
-            k = self.read(length, key)
-            if k == key:
-                length = int(self.read(6, key), 16)
-                value = self.read(length, key).decode('utf-8')
-                if len(self.cache) > self.max_size:
-                    del self.cache[0]
-                self.cache.append((key, value))
-                return value
-
-            elif k[0] != index:
+            slotHash, offset = _SLOT.unpack_from(data,
+                                                 _HEADER.size + _SLOT.size * slot)
+            if not offset:
                 raise KeyError(key)
-
-            length = int(self.read(6, key), 16)
-            self.cache_file.seek(length, os.SEEK_CUR)
-
-
-    def read(self, length, key = ''):
-        s = self.cache_file.read(length)
-        if not s: raise KeyError(key)
-        return s
+            if slotHash == h:
+                keyLength, valueLength = _RECORD.unpack_from(data, offset)
+                start = offset + _RECORD.size
+                if data[start:start + keyLength] == key:
+                    start += keyLength
+                    value = marshal.loads(data[start:start + valueLength])
+                    self.cache.put(key, value)
+                    return value
+            slot = (slot + 1) & mask
@@ -3866,6 +3866,8 @@ class Family(object):
         self.langs[code] = location
         for num, val in namespaces.iteritems():
             self.namespaces[num][code] = val
+        self.__dict__.pop('_namespaceCache', None)
+        self.__dict__.pop('_namespaceIndex', None)
 
     def get_known_families(self, site):
         return self.known_families
@@ -3881,6 +3883,20 @@ class Family(object):
                 % {'language_code': code})
 
     def namespace(self, code, ns_number, fallback='_default', all=False):
+        # the namespace tables do not change after the constructor, so the
+        # names are looked up once for every language
+        key = (code, ns_number, fallback, all)
+        try:
+            return self._namespaceCache[key]
+        except AttributeError:
+            self._namespaceCache = {}
+        except KeyError:
+            pass
+        result = self._namespace(code, ns_number, fallback, all)
+        self._namespaceCache[key] = result
+        return result
+
+    def _namespace(self, code, ns_number, fallback, all):
         if not self.isDefinedNS(ns_number):
             raise KeyError('ERROR: Unknown namespace %d for %s:%s'
                            % (ns_number, code, self.name))
@@ -3985,24 +4001,42 @@ class Family(object):
 
         """
         namespace = namespace.lower()
+        index = self._namespaceIndexOf(lang)
+        if namespace in index:
+            return index[namespace]
+        if lang != '_default':
+            # This is not a localized namespace. Try if it
+            # is a default (English) namespace.
+            return self._namespaceIndexOf('_default').get(namespace)
+        else:
+            # give up
+            return None
+
+    def _namespaceIndexOf(self, lang):
+        """Return a dictionary of the lowercased namespace names of lang
+        to their numbers, which is built when it is first needed.
+
+        """
+        try:
+            return self._namespaceIndex[lang]
+        except AttributeError:
+            self._namespaceIndex = {}
+        except KeyError:
+            pass
+        index = {}
         for n in self.namespaces.keys():
             try:
                 nslist = self.namespaces[n][lang]
                 if type(nslist) is not list:
                     nslist = [nslist]
                 for ns in nslist:
-                    if ns.lower() == namespace:
-                        return n
+                    # the first namespace with this name wins
+                    index.setdefault(ns.lower(), n)
             except (KeyError, AttributeError):
                 # The namespace has no localized name defined
                 pass
-        if lang != '_default':
-            # This is not a localized namespace. Try if it
-            # is a default (English) namespace.
-            return self.getNamespaceIndex('_default', namespace)
-        else:
-            # give up
-            return None
+        self._namespaceIndex[lang] = index
+        return index
 
     def category_redirects(self, code, fallback="_default"):
         if code in self.category_redirect_templates:
@@ -304,11 +304,18 @@ The following arguments influence how many pages the bot works on at once:
     -query:        The maximum number of pages that the bot will load at once.
                    Default value is 60.
 
+    -parallel:     The number of sites from which the bot loads pages at the
+                   same time. The default is 1, but can be changed in the
+                   config variable interwiki_parallel_sites
+
 Some configuration option can be used to change the working of this robot:
 
 interwiki_min_subjects: the minimum amount of subjects that should be processed
                     at the same time.
 
+interwiki_parallel_sites: the number of sites from which pages are loaded at
+                    the same time.
+
 interwiki_backlink: if set to True, all problems in foreign wikis will
                     be reported
 
@@ -348,14 +355,19 @@ import copy
 import re
 import os
 import time
+import zlib
 import codecs
+import hashlib
 import socket
+import threading
+import Queue
 import webbrowser
 import wikipedia as pywikibot
 import config
 import catlib
 import pagegenerators
 from pywikibot import i18n
+from pywikibot.tools import LRUCache
 import interwiki_graph
 import titletranslate
 
@@ -486,6 +498,7 @@ class Global(object):
     rememberno = False
     followinterwiki = True
     minsubjects = config.interwiki_min_subjects
+    parallel = config.interwiki_parallel_sites
     nobackonly = False
     askhints = False
     hintnobracket = False
@@ -596,6 +609,8 @@ class Global(object):
             self.minsubjects = int(arg[7:])
         elif arg.startswith('-query:'):
             self.maxquerysize = int(arg[7:])
+        elif arg.startswith('-parallel:'):
+            self.parallel = int(arg[10:])
         elif arg == '-back':
             self.nobackonly = True
         elif arg == '-quiet':
@@ -620,6 +635,170 @@ class Global(object):
         return True
 
 
+class SpillStore(object):
+    """
+    The texts of the StoredPage objects.
+
+    The texts are compressed and appended to a file. Each different text is
+    stored once, however many pages have it (e.g. identical redirects or
+    stubs on many wikis); the pages refer to it by its SHA-1 digest. The
+    texts which were used last are also kept in memory (as many as
+    config.interwiki_contents_in_memory).
+
+    New texts are collected and written at once when flush() is called,
+    which Subject.batchLoaded() does after every batch of pages, or when
+    more than maxPending bytes have been collected. When more than half of
+    the file is taken by texts which are not used any more, it is
+    rewritten without them.
+
+    The store may be used by several threads (see -parallel).
+    """
+
+    maxPending = 1 << 20
+
+    def __init__(self, path, memory=100):
+        self.path = path
+        self.file = open(path, 'w+b')
+        self.end = 0
+        # key -> digest
+        self.keys = {}
+        # digest -> [offset, length, references]; the offset is None while
+        # the text is still in self.pending
+        self.blobs = {}
+        # digest -> compressed text, not yet written
+        self.pending = {}
+        self.pendingSize = 0
+        self.live = 0
+        self.dead = 0
+        self.memory = LRUCache(max(memory, 1))
+        # reentrant, since e.g. __setitem__ calls flush
+        self.lock = threading.RLock()
+
+    def __getitem__(self, key):
+        self.lock.acquire()
+        try:
+            return self._get(key)
+        finally:
+            self.lock.release()
+
+    def _get(self, key):
+        digest = self.keys[key]
+        text = self.memory.get(digest)
+        if text is None:
+            if digest in self.pending:
+                data = self.pending[digest]
+            else:
+                offset, length = self.blobs[digest][:2]
+                self.file.seek(offset)
+                data = self.file.read(length)
+            text = zlib.decompress(data).decode('utf-8')
+            self.memory.put(digest, text)
+        return text
+
+    def __setitem__(self, key, text):
+        self.lock.acquire()
+        try:
+            self._set(key, text)
+        finally:
+            self.lock.release()
+
+    def _set(self, key, text):
+        if key in self.keys:
+            del self[key]
+        digest = hashlib.sha1(text.encode('utf-8')).digest()
+        self.keys[key] = digest
+        if digest in self.blobs:
+            self.blobs[digest][2] += 1
+        else:
+            data = zlib.compress(text.encode('utf-8'), 1)
+            self.blobs[digest] = [None, len(data), 1]
+            self.pending[digest] = data
+            self.pendingSize += len(data)
+            if self.pendingSize > self.maxPending:
+                self.flush()
+        self.memory.put(digest, text)
+
+    def __delitem__(self, key):
+        self.lock.acquire()
+        try:
+            self._del(key)
+        finally:
+            self.lock.release()
+
+    def _del(self, key):
+        digest = self.keys.pop(key)
+        blob = self.blobs[digest]
+        blob[2] -= 1
+        if blob[2] == 0:
+            del self.blobs[digest]
+            if digest in self.pending:
+                self.pendingSize -= len(self.pending.pop(digest))
+            else:
+                self.live -= blob[1]
+                self.dead += blob[1]
+
+    def flush(self):
+        """Write the texts which were added since the last flush."""
+        self.lock.acquire()
+        try:
+            self._flush()
+        finally:
+            self.lock.release()
+
+    def _flush(self):
+        if self.dead > self.maxPending and self.dead > self.live:
+            self.compact()
+        if not self.pending:
+            return
+        chunks = []
+        offset = self.end
+        for digest, data in self.pending.iteritems():
+            self.blobs[digest][0] = offset
+            offset += len(data)
+            chunks.append(data)
+        self.file.seek(self.end)
+        self.file.write(''.join(chunks))
+        self.file.flush()
+        self.live += offset - self.end
+        self.end = offset
+        self.pending = {}
+        self.pendingSize = 0
+
+    def compact(self):
+        """Rewrite the file without the texts which are not used any more."""
+        self.lock.acquire()
+        try:
+            self._compact()
+        finally:
+            self.lock.release()
+
+    def _compact(self):
+        newFile = open(self.path + '.new', 'w+b')
+        offset = 0
+        for blob in self.blobs.itervalues():
+            if blob[0] is None:
+                continue
+            self.file.seek(blob[0])
+            newFile.write(self.file.read(blob[1]))
+            blob[0] = offset
+            offset += blob[1]
+        self.file.close()
+        newFile.close()
+        if sys.platform == 'win32':
+            os.remove(self.path)
+        os.rename(self.path + '.new', self.path)
+        self.file = open(self.path, 'r+b')
+        self.end = self.live = offset
+        self.dead = 0
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self.file.close()
+        finally:
+            self.lock.release()
+
+
 class StoredPage(pywikibot.Page):
     """
     Store the Page contents on disk to avoid sucking too much
@@ -630,10 +809,12 @@ class StoredPage(pywikibot.Page):
     # Please prefix the class members names by SP
     # to avoid possible name clashes with pywikibot.Page
 
-    # path to the shelve
+    # path to the SpillStore
     SPpath = None
-    # shelve
+    # SpillStore
     SPstore = None
+    # guards the creation of SPstore
+    SPlock = threading.Lock()
 
     # attributes created by pywikibot.Page.__init__
     SPcopy = ['_editrestriction',
@@ -653,6 +834,7 @@ class StoredPage(pywikibot.Page):
 
     def SPdeleteStore():
         if StoredPage.SPpath:
+            StoredPage.SPstore.close()
             del StoredPage.SPstore
             os.unlink(StoredPage.SPpath)
     SPdeleteStore = staticmethod(SPdeleteStore)
@@ -661,15 +843,20 @@ class StoredPage(pywikibot.Page):
         for attr in StoredPage.SPcopy:
             setattr(self, attr, getattr(page, attr))
 
-        if not StoredPage.SPpath:
-            import shelve
-            index = 1
-            while True:
-                path = config.datafilepath('cache', 'pagestore' + str(index))
-                if not os.path.exists(path): break
-                index += 1
-            StoredPage.SPpath = path
-            StoredPage.SPstore = shelve.open(path)
+        StoredPage.SPlock.acquire()
+        try:
+            if not StoredPage.SPpath:
+                index = 1
+                while True:
+                    path = config.datafilepath('cache',
+                                               'pagestore' + str(index))
+                    if not os.path.exists(path): break
+                    index += 1
+                StoredPage.SPstore = SpillStore(
+                    path, config.interwiki_contents_in_memory)
+                StoredPage.SPpath = path
+        finally:
+            StoredPage.SPlock.release()
 
         self.SPkey = str(self)
         self.SPcontentSet = False
@@ -956,10 +1143,12 @@ class Subject(object):
         preload all the 'site' Pages that are in the todo list.
 
         This routine will return a list of pages that can be treated.
+
+        Several sites can be in progress at the same time (see
+        InterwikiBot.parallelQuery), but only one batch per site.
         """
-        # Bug-check: Isn't there any work still in progress? We can't work on
-        # different sites at a time!
-        if len(self.pending) > 0:
+        # Bug-check: Isn't there any work still in progress on this site?
+        if list(self.pending.filter(site)):
             raise "BUG: Can't start to work on %s; still working on %s" \
                   % (site, self.pending)
         # Prepare a list of suitable pages
@@ -1244,19 +1433,26 @@ u'WARNING: %s is in namespace %i, but %s is in namespace %i. Follow it anyway?'
                             if globalvar.hintsareright:
                                 self.hintedsites.add(page.site)
 
-    def batchLoaded(self, counter):
+    def batchLoaded(self, counter, site=None):
         """
         This is called by a worker to tell us that the promised batch of
         pages was loaded.
         In other words, all the pages in self.pending have already
-        been preloaded.
+        been preloaded, or, if site is given, all its pages in self.pending.
 
-        The only argument is an instance of a counter class, that has methods
-        minus() and plus() to keep counts of the total work todo.
+        The counter argument is an instance of a counter class, that has
+        methods minus() and plus() to keep counts of the total work todo.
 
         """
+        if globalvar.contentsondisk and StoredPage.SPstore is not None:
+            # write the texts of the batch to the disk at once
+            StoredPage.SPstore.flush()
+        if site is None:
+            pages = list(self.pending)
+        else:
+            pages = list(self.pending.filter(site))
         # Loop over all the pages that should have been taken care of
-        for page in self.pending:
+        for page in pages:
             if page.title == None:  ### seems a DataPage
                 page.get()  ### get it's title (and content)
             # Mark the page as done
@@ -1479,7 +1675,13 @@ u'WARNING: %s is in namespace %i, but %s is in namespace %i. Follow it anyway?'
                 if self.forcedStop:
                     break
         # These pages are no longer 'in progress'
-        self.pending = PageTree()
+        if site is None:
+            self.pending = PageTree()
+        else:
+            self.pending.removeSite(site)
+            if len(self.pending) > 0:
+                # Wait for the batches of the other sites
+                return
         # Check whether we need hints and the user offered to give them
         if self.untranslated and not self.hintsAsked:
             self.reportInterwikilessPage(page)
@@ -1487,7 +1689,7 @@ u'WARNING: %s is in namespace %i, but %s is in namespace %i. Follow it anyway?'
 
     def isDone(self):
         """Return True if all the work for this subject has completed."""
-        return len(self.todo) == 0
+        return len(self.todo) == 0 and len(self.pending) == 0
 
     def problem(self, txt, createneed = True):
         """Report a problem with the resolution of this subject."""
@@ -2140,6 +2342,8 @@ class InterwikiBot(object):
         self.counts = {}
         self.pageGenerator = None
         self.generated = 0
+        # loads the batches of parallelQuery()
+        self.fetcher = None
 
     def add(self, page, hints=None):
         """Add a single subject to the list"""
@@ -2242,11 +2446,11 @@ class InterwikiBot(object):
         if self.subjects:
             return self.subjects[0]
 
-    def maxOpenSite(self):
+    def maxOpenSite(self, exclude=()):
         """Return the site that has the most
            open queries plus the number. If there is nothing left, return
            None. Only languages that are TODO for the first Subject
-           are returned."""
+           are returned, and none of the sites in exclude."""
         max = 0
         maxlang = None
         if not self.firstSubject():
@@ -2257,17 +2461,20 @@ class InterwikiBot(object):
             # because we have to wait before submitting another modification to
             # go live. Select any language from counts.
             oc = self.counts
-        if pywikibot.getSite() in oc:
+        if pywikibot.getSite() in oc and pywikibot.getSite() not in exclude:
             return pywikibot.getSite()
         for lang in oc:
+            if lang in exclude:
+                continue
             count = self.counts[lang]
             if count > max:
                 max = count
                 maxlang = lang
         return maxlang
 
-    def selectQuerySite(self):
-        """Select the site the next query should go out for."""
+    def selectQuerySite(self, exclude=()):
+        """Select the site the next query should go out for, if it is not
+           one of the sites in exclude."""
         # How many home-language queries we still have?
         mycount = self.counts.get(pywikibot.getSite(), 0)
         # Do we still have enough subjects to work on for which the
@@ -2290,7 +2497,8 @@ class InterwikiBot(object):
                     else:
                         break
             # If we have a few, getting the home language is a good thing.
-            if not globalvar.restoreAll:
+            if not globalvar.restoreAll \
+                    and pywikibot.getSite() not in exclude:
                 try:
                     if self.counts[pywikibot.getSite()] > 4:
                         return pywikibot.getSite()
@@ -2298,21 +2506,15 @@ class InterwikiBot(object):
                     pass
         # If getting the home language doesn't make sense, see how many
         # foreign page queries we can find.
-        return self.maxOpenSite()
+        return self.maxOpenSite(exclude)
 
-    def oneQuery(self):
+    def assembleBatch(self, site):
         """
-        Perform one step in the solution process.
+        Promise the subjects to load their next pages from site.
 
-        Returns True if pages could be preloaded, or false
-        otherwise.
+        Returns the subjects and the list of their pages to load, which is
+        about globalvar.maxquerysize pages long.
         """
-        # First find the best language to work on
-        site = self.selectQuerySite()
-        if site is None:
-            pywikibot.output(u"NOTE: Nothing left to do")
-            return False
-        # Now assemble a reasonable list of pages to get
         subjectGroup = []
         pageGroup = []
         for subject in self.subjects:
@@ -2325,6 +2527,22 @@ class InterwikiBot(object):
                 if len(pageGroup) >= globalvar.maxquerysize:
                     # We have found enough pages to fill the bandwidth.
                     break
+        return subjectGroup, pageGroup
+
+    def oneQuery(self):
+        """
+        Perform one step in the solution process.
+
+        Returns True if pages could be preloaded, or false
+        otherwise.
+        """
+        # First find the best language to work on
+        site = self.selectQuerySite()
+        if site is None:
+            pywikibot.output(u"NOTE: Nothing left to do")
+            return False
+        # Now assemble a reasonable list of pages to get
+        subjectGroup, pageGroup = self.assembleBatch(site)
         if len(pageGroup) == 0:
             pywikibot.output(u"NOTE: Nothing left to do 2")
             return False
@@ -2339,8 +2557,42 @@ class InterwikiBot(object):
             subject.batchLoaded(self)
         return True
 
+    def parallelQuery(self):
+        """
+        Perform one step in the solution process, loading pages from up to
+        globalvar.parallel sites at the same time.
+
+        Starts loading a batch of pages from as many sites as allowed, then
+        waits until one of the running batches is loaded and tells its
+        subjects. Returns False if there is nothing left to do.
+        """
+        if self.fetcher is None:
+            self.fetcher = BatchFetcher()
+        # Sites which already have a running batch, or nothing to load
+        exclude = set(self.fetcher.sites())
+        while len(self.fetcher) < globalvar.parallel:
+            site = self.selectQuerySite(exclude)
+            if site is None:
+                break
+            exclude.add(site)
+            subjectGroup, pageGroup = self.assembleBatch(site)
+            if pageGroup:
+                self.fetcher.start(site, subjectGroup, pageGroup)
+        if len(self.fetcher) == 0:
+            pywikibot.output(u"NOTE: Nothing left to do")
+            return False
+        # Tell the subjects of the first loaded batch that the promised
+        # work is done
+        site, subjectGroup = self.fetcher.wait()
+        for subject in subjectGroup:
+            subject.batchLoaded(self, site)
+        return True
+
     def queryStep(self):
-        self.oneQuery()
+        if globalvar.parallel > 1:
+            self.parallelQuery()
+        else:
+            self.oneQuery()
         # Delete the ones that are done now.
         for i in xrange(len(self.subjects) - 1, -1, -1):
             subj = self.subjects[i]
@@ -2373,6 +2625,61 @@ class InterwikiBot(object):
         return len(self.subjects)
 
 
+class BatchFetcher(object):
+    """
+    Loads batches of pages from several sites at the same time.
+
+    Every batch is loaded by a PreloadingGenerator in its own thread, and
+    there is at most one batch per site, so a site is never asked for more
+    than one batch at a time; get_throttle still applies to every request.
+    """
+    def __init__(self):
+        # sites with a running batch -> subjects of the batch
+        self.running = {}
+        # (site, exception info or None) of the loaded batches
+        self.loaded = Queue.Queue()
+
+    def __len__(self):
+        return len(self.running)
+
+    def sites(self):
+        return self.running.keys()
+
+    def start(self, site, subjectGroup, pageGroup):
+        """Start loading pageGroup from site, for the subjects."""
+        self.running[site] = subjectGroup
+        thread = threading.Thread(target=self._load, args=(site, pageGroup))
+        thread.setDaemon(True)
+        thread.start()
+
+    def _load(self, site, pageGroup):
+        try:
+            for page in pagegenerators.PreloadingGenerator(iter(pageGroup)):
+                # The page contents will be read via the Subject class.
+                pass
+        except:
+            self.loaded.put((site, sys.exc_info()))
+        else:
+            self.loaded.put((site, None))
+
+    def wait(self):
+        """
+        Wait until a batch has been loaded and return its site and its
+        subjects. If loading the batch raised an exception, raise it again.
+        """
+        while True:
+            try:
+                # with a timeout, so that KeyboardInterrupt gets through
+                site, error = self.loaded.get(True, 1)
+                break
+            except Queue.Empty:
+                pass
+        subjectGroup = self.running.pop(site)
+        if error:
+            raise error[0], error[1], error[2]
+        return site, subjectGroup
+
+
 def compareLanguages(old, new, insite):
 
     oldiw = set(old)
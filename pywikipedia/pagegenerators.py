@@ -26,10 +26,13 @@ import codecs
 import datetime
 import urllib, urllib2, time
 import traceback
+import threading
+import Queue
 import wikipedia as pywikibot
 import config
 from pywikibot import i18n
 from pywikibot.support import deprecate_arg
+from pywikibot.tools import itergroup
 import date, catlib, userlib, query
 
 parameterHelp = u"""\
@@ -193,6 +196,23 @@ parameterHelp = u"""\
 
 -page             Work on a single page. Argument can also be given as
                   "-page:pagetitle".
+
+-xml              Work on all pages of a local XML dump. Argument can also
+                  be given as "-xml:filename".
+
+-xmlstart         (Only works with -xml) Skip all pages in the XML dump
+                  before the one specified, e.g. "-xmlstart:Article". With
+                  the index of a multistream .bz2 dump, reading starts
+                  directly at the block of that page.
+
+-xmlrange         (Only works with -xml and a multistream .bz2 dump with
+                  index) Only read the given blocks of the dump, e.g.
+                  "-xmlrange:100-199" or "-xmlrange:100-" to read up to the
+                  end.
+
+-xmlindex         The index file of a multistream .bz2 dump given with -xml.
+                  Only needed if it is not named like the dump with
+                  "-index.txt.bz2" instead of ".xml.bz2".
 """
 
 docuReplacements = {'&params;': parameterHelp}
@@ -218,6 +238,11 @@ class GeneratorFactory(object):
         self.gens = []
         self.namespaces = []
         self.limit = None
+        # options of -xml, which may be given after it
+        self.xmlFilename = None
+        self.xmlStart = None
+        self.xmlRange = None
+        self.xmlIndex = None
 
     def getCombinedGenerator(self, gen=None):
         """Returns the combination of all accumulated generators,
@@ -275,6 +300,13 @@ class GeneratorFactory(object):
         return SubCategoriesPageGenerator(cat,
                start=startfrom, recurse=recurse)
 
+    def getXmlDumpGen(self):
+        """Generate the pages of the -xml dump; reads its options lazily."""
+        for page in XmlDumpPageGenerator(self.xmlFilename, start=self.xmlStart,
+                                         index=self.xmlIndex,
+                                         blocks=self.xmlRange):
+            yield page
+
     def handleArg(self, arg):
         """Parse one argument at a time.
 
@@ -499,6 +531,35 @@ class GeneratorFactory(object):
             gen = RegexFilterPageGenerator(site.allpages(), [regex])
         elif arg.startswith('-yahoo'):
             gen = YahooSearchPageGenerator(arg[7:])
+        elif arg.startswith('-xmlstart'):
+            if len(arg) == 9:
+                self.xmlStart = pywikibot.input(
+                    u'Please enter the dumped article to start with:')
+            else:
+                self.xmlStart = arg[10:]
+            return True
+        elif arg.startswith('-xmlrange'):
+            if len(arg) == 9:
+                xmlRange = pywikibot.input(
+                    u'Please enter the blocks to read (e.g. 100-199):')
+            else:
+                xmlRange = arg[10:]
+            first, sep, last = xmlRange.partition('-')
+            self.xmlRange = (int(first), last and int(last) or None)
+            return True
+        elif arg.startswith('-xmlindex'):
+            if len(arg) == 9:
+                self.xmlIndex = pywikibot.input(
+                    u'Please enter the index file of the XML dump:')
+            else:
+                self.xmlIndex = arg[10:]
+            return True
+        elif arg.startswith('-xml'):
+            if len(arg) == 4:
+                self.xmlFilename = i18n.input('pywikibot-enter-xml-filename')
+            else:
+                self.xmlFilename = arg[5:]
+            gen = self.getXmlDumpGen()
         elif arg.startswith('-'):
             mode, log, user = arg.partition('log')
             if log == 'log' and mode not in ['-', '-no']: #exclude -log, -nolog
@@ -617,7 +678,8 @@ def CategorizedPageGenerator(category, recurse=False, start=None):
     If recurse is True, pages in subcategories are included as well; if
     recurse is an int, only subcategories to that depth will be included
     (e.g., recurse=2 will get pages in subcats and sub-subcats, but will
-    not go any further).
+    not go any further). The subcategories are walked breadth first, and
+    every page is yielded once (see catlib.Category.walk()).
 
     If start is a string value, only pages whose title comes after start
     alphabetically are included.
@@ -779,6 +841,19 @@ def PagesFromTitlesGenerator(iterable, site=None):
             break
         yield pywikibot.Page(site, title)
 
+def XmlDumpPageGenerator(filename, start=None, index=None, blocks=None,
+                         site=None):
+    """Generate the pages of a local XML dump.
+
+    start, index and blocks are passed to xmlreader.XmlDump.
+    """
+    import xmlreader
+    if site is None:
+        site = pywikibot.getSite()
+    dump = xmlreader.XmlDump(filename, index=index, start=start, blocks=blocks)
+    for entry in dump.parse():
+        yield pywikibot.Page(site, entry.title)
+
 def LinksearchPageGenerator(link, step=500, site=None):
     """Yields all pages that include a specified link, according to
     [[Special:Linksearch]].
@@ -1195,15 +1270,30 @@ class PreloadingGenerator(object):
     another number specified by pageNumber), loads them using
     Special:Export, and yields them one after the other. Then retrieves more
     pages, etc. Thus, it is not necessary to load each page separately.
-    Operates asynchronously, so the next batch of pages is loaded in the
-    background before the first batch is fully consumed.
+
+    If prefetch is greater than 0 (see config.preload_prefetch), a
+    background thread consumes the wrapped generator and keeps up to
+    prefetch loaded batches in a bounded queue, so the next batch of pages
+    is loaded while the current one is being processed. The number of times
+    the consumer had to wait for a batch and the total waiting time are
+    counted in the starved and starvedTime attributes.
     """
     @deprecate_arg("lookahead", None)
-    def __init__(self, generator, pageNumber=60):
+    def __init__(self, generator, pageNumber=60, prefetch=None):
         self.wrapped_gen = generator
         self.pageNumber = pageNumber
+        if prefetch is None:
+            prefetch = config.preload_prefetch
+        self.prefetch = prefetch
+        # queue-starvation counters, only used in prefetch mode
+        self.starved = 0
+        self.starvedTime = 0.0
 
     def __iter__(self):
+        if self.prefetch > 0:
+            for loaded_page in self._prefetched():
+                yield loaded_page
+            return
         try:
             # this array will contain up to pageNumber pages and will be flushed
             # after these pages have been preloaded and yielded.
@@ -1227,6 +1317,71 @@ class PreloadingGenerator(object):
             traceback.print_exc()
             pywikibot.output(unicode(e))
 
+    def _prefetched(self):
+        """Yield pages loaded by a background worker thread."""
+        queue = Queue.Queue(self.prefetch)
+        finished = threading.Event()
+        worker = threading.Thread(target=self._prefetchWorker,
+                                  args=(queue, finished),
+                                  name='PreloadingGenerator')
+        worker.setDaemon(True)
+        worker.start()
+        try:
+            while True:
+                if queue.empty():
+                    self.starved += 1
+                    start = time.time()
+                    batch = self._get(queue)
+                    self.starvedTime += time.time() - start
+                else:
+                    batch = self._get(queue)
+                if batch is None:
+                    break
+                for loaded_page in batch:
+                    yield loaded_page
+        finally:
+            finished.set()
+            if pywikibot.verbose:
+                pywikibot.output(
+                    u'PreloadingGenerator: waited %d times (%.1f seconds) '
+                    u'for prefetched pages' % (self.starved, self.starvedTime))
+
+    def _get(self, queue):
+        # poll, so that KeyboardInterrupt still reaches the main thread
+        while True:
+            try:
+                return queue.get(True, 0.25)
+            except Queue.Empty:
+                pass
+
+    def _prefetchWorker(self, queue, finished):
+        """Load batches of pages and put them on the queue.
+
+        Puts None on the queue when the wrapped generator is exhausted.
+        Stops early if the consumer sets the finished event.
+        """
+        try:
+            try:
+                for somePages in itergroup(self.wrapped_gen, self.pageNumber):
+                    batch = list(self.preload(somePages))
+                    if not self._put(queue, batch, finished):
+                        return
+            except Exception, e:
+                traceback.print_exc()
+                pywikibot.output(unicode(e))
+        finally:
+            self._put(queue, None, finished)
+
+    def _put(self, queue, item, finished):
+        """Put item on the queue; return False if the consumer has stopped."""
+        while not finished.isSet():
+            try:
+                queue.put(item, True, 0.25)
+            except Queue.Full:
+                continue
+            return True
+        return False
+
     def preload(self, page_list, retry=False):
         try:
             while len(page_list) > 0:
@@ -129,6 +129,15 @@ def request(site, uri, retry=None, sysop=False, data=None, compress=True,
         except KeyboardInterrupt:
             raise
         except urllib2.HTTPError, e:
+            retryAfter = parseRetryAfter(e.info().get('retry-after'))
+            if e.code in [429, 503] and retryAfter is not None and retry \
+               and retry_attempt < config.maxretries:
+                # the server tells us when to try again
+                retry_attempt += 1
+                pywikibot.output(u'HTTPError: %s %s. Retrying in %i seconds...'
+                                 % (e.code, e.msg, retryAfter))
+                pywikibot.get_throttle.backoff(retryAfter, site)
+                continue
             if e.code in [401, 404]:
                 raise PageNotFound(
                     u'Page %s could not be retrieved. Check your family file.'
@@ -0,0 +1,301 @@
+# -*- coding: utf-8  -*-
+"""
+Persistent HTTP connections for urllib2.
+
+urllib2 opens a new connection for every request and closes it after the
+response ("Connection: close"), so every request to the wiki pays for the
+TCP and, with https, the SSL handshake. The handlers of this module keep the
+connections open (HTTP/1.1 keep-alive) and put them into a ConnectionPool
+when a response has been read completely, so that the next request to the
+same host can use them again.
+
+    pool = ConnectionPool(maxsize=4, idletimeout=30)
+    opener = urllib2.build_opener(HTTPHandler(pool), HTTPSHandler(pool))
+
+wikipedia.py installs these handlers in MyURLopener, which is used by
+Site.getUrl(), Site.postData() and pywikibot.comms.http.request(), if
+config.http_keepalive is set.
+"""
+#
+# (C) Pywikipedia bot team, 2013
+#
+# Distributed under the terms of the MIT license.
+#
+__version__ = '$Id$'
+
+import errno
+import httplib
+import select
+import socket
+import threading
+import time
+import urllib2
+
+
+class ConnectionPool(object):
+    """
+    Idle HTTP connections, per host.
+
+    At most maxsize idle connections are kept per host; connections which
+    have been idle for more than idletimeout seconds, and connections closed
+    by the server, are discarded instead of being used again.
+
+    The stats dictionary counts the requests sent, the connections created
+    and reused, the idle connections discarded, and the requests retried
+    because a reused connection had been closed by the server.
+    """
+    def __init__(self, maxsize=4, idletimeout=30):
+        self.maxsize = maxsize
+        self.idletimeout = idletimeout
+        self.lock = threading.Lock()
+        # key -> list of (connection, time it became idle), oldest first
+        self._idle = {}
+        self.stats = dict.fromkeys(('requests', 'created', 'reused',
+                                    'discarded', 'retried'), 0)
+
+    def _count(self, name):
+        self.lock.acquire()
+        try:
+            self.stats[name] += 1
+        finally:
+            self.lock.release()
+
+    def get(self, key):
+        """Return an idle connection for key, or None."""
+        while True:
+            self.lock.acquire()
+            try:
+                idle = self._idle.get(key)
+                if not idle:
+                    return None
+                # use the most recent one, the others may time out
+                conn, since = idle.pop()
+            finally:
+                self.lock.release()
+            if time.time() - since <= self.idletimeout and self._healthy(conn):
+                self._count('reused')
+                return conn
+            self._count('discarded')
+            conn.close()
+
+    def put(self, key, conn):
+        """Keep the idle connection conn for the next request to key."""
+        self.lock.acquire()
+        try:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append((conn, time.time()))
+                return
+        finally:
+            self.lock.release()
+        conn.close()
+
+    def clear(self):
+        """Close all idle connections."""
+        self.lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self.lock.release()
+        for connections in idle.itervalues():
+            for conn, since in connections:
+                conn.close()
+
+    def _healthy(self, conn):
+        """
+        Return False if the server has closed the idle connection conn.
+
+        Nothing may be readable on an idle connection; if something is,
+        it is the end of the stream (or garbage).
+        """
+        if conn.sock is None:
+            return False
+        try:
+            readable = select.select([conn.sock], [], [], 0)[0]
+        except (select.error, socket.error, ValueError):
+            return False
+        return not readable
+
+
+class PooledResponse(httplib.HTTPResponse):
+    """
+    A response which gives its connection back to the pool once it has
+    been read completely.
+    """
+    _release = None
+    _reading = False
+
+    def read(self, amt=None):
+        self._reading = True
+        try:
+            return httplib.HTTPResponse.read(self, amt)
+        finally:
+            self._reading = False
+
+    def close(self):
+        # HTTPResponse.read() closes the response at the end of the body;
+        # otherwise the rest of the body is still on the connection.
+        complete = self._reading or self.length == 0
+        httplib.HTTPResponse.close(self)
+        release, self._release = self._release, None
+        if release is not None:
+            release(complete and not self.will_close)
+
+
+class PooledHTTPConnection(httplib.HTTPConnection):
+    response_class = PooledResponse
+
+
+class PooledHTTPSConnection(httplib.HTTPSConnection):
+    response_class = PooledResponse
+
+
+class StaleConnection(Exception):
+    """A reused connection failed and the request may be sent again."""
+
+
+class KeepAliveHandler(object):
+    """Mixin for urllib2 handlers which keep their connections open."""
+
+    # requests which may be repeated if it is unknown whether the server got
+    # them (RFC 2616, section 9.1.2)
+    idempotent = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS',
+                            'TRACE'])
+
+    def __init__(self, pool, debuglevel=0):
+        self.pool = pool
+        self._debuglevel = debuglevel
+
+    def do_open(self, http_class, req):
+        """Like urllib2.AbstractHTTPHandler.do_open, with pooling."""
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items()
+                            if k not in headers))
+        headers["Connection"] = "keep-alive"
+        headers = dict(
+            (name.title(), val) for name, val in headers.items())
+
+        tunnel_headers = {}
+        if req._tunnel_host:
+            proxy_auth_hdr = "Proxy-Authorization"
+            if proxy_auth_hdr in headers:
+                tunnel_headers[proxy_auth_hdr] = headers[proxy_auth_hdr]
+                # Proxy-Authorization should not be sent to origin
+                # server.
+                del headers[proxy_auth_hdr]
+        key = (http_class, host, req._tunnel_host)
+
+        self.pool._count('requests')
+        conn = self.pool.get(key)
+        if conn is not None:
+            # use the timeout of this request, not of the first one
+            conn.timeout = req.timeout
+            if req.timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+                conn.sock.settimeout(socket.getdefaulttimeout())
+            else:
+                conn.sock.settimeout(req.timeout)
+            try:
+                r = self._request(conn, req, headers, reused=True)
+            except StaleConnection:
+                # the server closed the connection while it was idle
+                conn.close()
+                conn = None
+                self.pool._count('retried')
+            except socket.error, err:
+                conn.close()
+                raise urllib2.URLError(err)
+            except httplib.HTTPException:
+                conn.close()
+                raise
+        if conn is None:
+            conn = http_class(host, timeout=req.timeout)
+            conn.set_debuglevel(self._debuglevel)
+            if req._tunnel_host:
+                conn.set_tunnel(req._tunnel_host, headers=tunnel_headers)
+            self.pool._count('created')
+            try:
+                r = self._request(conn, req, headers)
+            except socket.error, err:
+                conn.close()
+                raise urllib2.URLError(err)
+
+        def release(reusable):
+            if reusable:
+                self.pool.put(key, conn)
+            else:
+                conn.close()
+        r._release = release
+        if r.length == 0 and not r.chunked:
+            # there is no body to wait for
+            r.close()
+
+        # See urllib2.AbstractHTTPHandler.do_open()
+        r.recv = r.read
+        fp = socket._fileobject(r, close=True)
+
+        resp = urllib2.addinfourl(fp, r.msg, req.get_full_url())
+        resp.code = r.status
+        resp.msg = r.reason
+        return resp
+
+    def _request(self, conn, req, headers, reused=False):
+        """
+        Send req on conn and return the response.
+
+        If conn is a reused connection which the server has closed, raise
+        StaleConnection, but only if it is safe to send the request again:
+        if sending it failed, or if not a single byte of the response came
+        back to an idempotent request. A timeout is never retried, since the
+        server may still be working on the request.
+        """
+        try:
+            conn.request(req.get_method(), req.get_selector(), req.data,
+                         headers)
+        except socket.timeout:
+            raise
+        except (socket.error, httplib.HTTPException):
+            if reused:
+                raise StaleConnection
+            raise
+        try:
+            return conn.getresponse(buffering=True)
+        except socket.timeout:
+            raise
+        except (socket.error, httplib.BadStatusLine), err:
+            if reused and req.get_method() in self.idempotent \
+               and self._noResponse(err):
+                raise StaleConnection
+            raise
+
+    def _noResponse(self, err):
+        """Return True if err means the connection was closed before
+        anything of the response was received."""
+        if isinstance(err, httplib.BadStatusLine):
+            # an empty status line is stored as repr(''), or explained
+            return err.line in ('', "''") or \
+                   err.line.startswith('No status line received')
+        return err.errno in (errno.ECONNRESET, errno.EPIPE)
+
+
+class HTTPHandler(KeepAliveHandler, urllib2.HTTPHandler):
+
+    def __init__(self, pool, debuglevel=0):
+        urllib2.HTTPHandler.__init__(self, debuglevel)
+        KeepAliveHandler.__init__(self, pool, debuglevel)
+
+    def http_open(self, req):
+        return self.do_open(PooledHTTPConnection, req)
+
+
+class HTTPSHandler(KeepAliveHandler, urllib2.HTTPSHandler):
+
+    def __init__(self, pool, debuglevel=0):
+        urllib2.HTTPSHandler.__init__(self, debuglevel)
+        KeepAliveHandler.__init__(self, pool, debuglevel)
+
+    def https_open(self, req):
+        return self.do_open(PooledHTTPSConnection, req)
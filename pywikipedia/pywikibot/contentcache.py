@@ -0,0 +1,161 @@
+# -*- coding: utf-8  -*-
+"""
+A persistent store of page contents (config.page_content_cache).
+
+The text of the pages loaded by Page.get() and getall() is kept in an SQLite
+database (cache/page-contents.db in the data directory) together with the
+revision it belongs to. When the store is used, Page.get() and getall() only
+ask the wiki for the id of the latest revision of the pages, and load the
+text of those whose latest revision is not in the store. The texts are
+compressed with zlib; when the store grows larger than
+config.page_content_cache_size, the pages used least recently are removed.
+
+The store counts its hits (pages whose text was taken from the store), its
+misses and the misses of pages which had an older revision in the store, and
+the number of bytes of text which did not need to be downloaded.
+"""
+#
+# (C) Pywikipedia bot team, 2013
+#
+# Distributed under the terms of the MIT license.
+#
+__version__ = '$Id$'
+
+import threading
+import time
+import zlib
+
+import sqlite3
+
+
+class ContentStore(object):
+    """
+    The texts of the latest revisions of pages, by site and title.
+
+    A record is a dictionary in the format of a revision in an API result:
+    'revid', 'timestamp' (in ISO 8601 format), 'user' (or 'userhidden'),
+    'anon' for edits by IP addresses, 'comment' and '*', the text.
+    """
+
+    def __init__(self, filename, maxsize):
+        self.filename = filename
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.outdated = 0
+        self.savedBytes = 0
+        # the store is used by the threads of the bot, one at a time, and
+        # may be shared with other bots
+        self.db = sqlite3.connect(filename, timeout=60,
+                                  check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS pages ('
+                        'site TEXT, title TEXT, revid INTEGER, '
+                        'timestamp TEXT, user TEXT, anon INTEGER, '
+                        'comment TEXT, text BLOB, size INTEGER, '
+                        'used REAL, PRIMARY KEY (site, title))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS pages_used '
+                        'ON pages (used)')
+        self.db.commit()
+        self.size = self._size()
+
+    def _size(self):
+        return self.db.execute('SELECT TOTAL(size) FROM pages').fetchone()[0]
+
+    def get(self, site, title, revid):
+        """Return the record of the page if the store has its revision
+        revid, and None otherwise.
+
+        """
+        self.lock.acquire()
+        try:
+            row = self.db.execute(
+                'SELECT revid, timestamp, user, anon, comment, text FROM '
+                'pages WHERE site = ? AND title = ?',
+                (repr(site), title)).fetchone()
+            if row is None or row[0] != int(revid):
+                self.misses += 1
+                if row is not None:
+                    self.outdated += 1
+                return None
+            self.db.execute('UPDATE pages SET used = ? WHERE site = ? AND '
+                            'title = ?', (time.time(), repr(site), title))
+            self.db.commit()
+        finally:
+            self.lock.release()
+        revid, timestamp, user, anon, comment, text = row
+        text = zlib.decompress(str(text))
+        self.hits += 1
+        self.savedBytes += len(text)
+        record = {'revid': revid, 'timestamp': timestamp,
+                  'comment': comment, '*': text.decode('utf-8')}
+        if user is None:
+            record['userhidden'] = u''
+        else:
+            record['user'] = user
+        if anon:
+            record['anon'] = u''
+        return record
+
+    def put(self, site, title, record):
+        """Store the record of the latest revision of a page."""
+        text = zlib.compress(record['*'].encode('utf-8'))
+        self.lock.acquire()
+        try:
+            row = self.db.execute('SELECT size FROM pages WHERE site = ? AND '
+                                  'title = ?', (repr(site), title)).fetchone()
+            if row is not None:
+                self.size -= row[0]
+            self.db.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, '
+                '?, ?)', (repr(site), title, int(record['revid']),
+                          record['timestamp'], record.get('user'),
+                          'anon' in record, record.get('comment'),
+                          sqlite3.Binary(text), len(text), time.time()))
+            self.size += len(text)
+            if self.size > self.maxsize:
+                self._evict()
+            self.db.commit()
+        finally:
+            self.lock.release()
+
+    def _evict(self):
+        """Remove the pages used least recently until the store is 10%
+        smaller than its maximum size.
+
+        """
+        # other bots may have added pages as well
+        self.size = self._size()
+        excess = self.size - self.maxsize * 0.9
+        if excess <= 0:
+            return
+        oldest = []
+        cursor = self.db.execute('SELECT site, title, size FROM pages '
+                                 'ORDER BY used')
+        for site, title, size in cursor:
+            oldest.append((site, title))
+            excess -= size
+            if excess <= 0:
+                break
+        cursor.close()
+        self.db.executemany('DELETE FROM pages WHERE site = ? AND title = ?',
+                            oldest)
+        self.size = self._size()
+
+    def __len__(self):
+        self.lock.acquire()
+        try:
+            return self.db.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+        finally:
+            self.lock.release()
+
+    def statistics(self):
+        """Return a line with the hits, misses and size of the store."""
+        return (u'%i hits, %i misses (%i outdated), %.1f kB not downloaded; '
+                u'%i pages, %.1f of %.1f MB'
+                % (self.hits, self.misses, self.outdated,
+                   self.savedBytes / 1024.0, len(self),
+                   self.size / 1048576.0, self.maxsize / 1048576.0))
+
+    def close(self):
+        self.db.close()
@@ -9,9 +9,12 @@
 #
 __version__ = '$Id: i18n.py 11345 2013-04-06 10:08:45Z xqt $'
 
+import os
 import re
 import sys
 import locale
+import marshal
+import threading
 from pywikibot.exceptions import Error
 import wikipedia as pywikibot
 import config
@@ -223,6 +226,182 @@ class TranslationError(Error):
     pass
 
 
+# Version of the catalog files; increase it when their format changes
+_catalogVersion = 1
+
+
+class _Catalog(object):
+    """The messages of the i18n/<package>.py module, by language.
+
+    The first time a package is used, its messages are written to
+    cache/i18n/<package>.dat, one marshalled dictionary per language after
+    an index of their offsets. Later runs only read the index and the
+    languages they use, instead of importing the module with the messages
+    of all languages. The file is written again when the module changes.
+    See config.i18n_catalogs.
+
+    """
+
+    def __init__(self, package):
+        self.package = package
+        self.lock = threading.Lock()
+        self.languages = {}
+        self.msg = None
+        self.index = None
+        if not config.i18n_catalogs:
+            self.msg = self._import()
+            return
+        self.filename = config.datafilepath('cache', 'i18n',
+                                            '%s.dat' % package)
+        key = self._key()
+        try:
+            self._open(key)
+        except (IOError, EOFError, ValueError, TypeError):
+            self.index = None
+            self.msg = self._import()
+            self._write(key)
+
+    def _import(self):
+        return getattr(__import__('i18n', {}, {}, [self.package]),
+                       self.package).msg
+
+    def _key(self):
+        """Return what the catalog file depends on."""
+        filename = os.path.join(__import__('i18n', {}, {}).__path__[0],
+                                '%s.py' % self.package)
+        try:
+            stat = os.stat(filename)
+            return (_catalogVersion, sys.version, filename, stat.st_mtime,
+                    stat.st_size)
+        except OSError:
+            return (_catalogVersion, sys.version, filename, None, None)
+
+    def _open(self, key):
+        # the file stays open, so that the offsets in the index remain
+        # valid even if another bot replaces it
+        f = open(self.filename, 'rb')
+        try:
+            if marshal.load(f) != key:
+                raise ValueError('%s is out of date' % self.filename)
+            self.index = marshal.load(f)
+            self.start = f.tell()
+        except:
+            f.close()
+            raise
+        self.file = f
+
+    def _write(self, key):
+        index = {}
+        blobs = []
+        offset = 0
+        for lang, messages in self.msg.iteritems():
+            blob = marshal.dumps(messages)
+            index[lang] = (offset, len(blob))
+            blobs.append(blob)
+            offset += len(blob)
+        # another bot may be reading the catalog; write a new file and
+        # rename it
+        tmpname = '%s.%i' % (self.filename, os.getpid())
+        try:
+            f = open(tmpname, 'wb')
+            try:
+                marshal.dump(key, f)
+                marshal.dump(index, f)
+                f.write(''.join(blobs))
+            finally:
+                f.close()
+            if sys.platform == 'win32' and os.path.exists(self.filename):
+                os.remove(self.filename)
+            os.rename(tmpname, self.filename)
+        except (IOError, OSError, ValueError):
+            try:
+                os.remove(tmpname)
+            except OSError:
+                pass
+
+    def __contains__(self, lang):
+        if self.msg is not None:
+            return lang in self.msg
+        return lang in self.index
+
+    def __getitem__(self, lang):
+        """Return the messages of lang. Raise KeyError if it has none."""
+        if self.msg is not None:
+            return self.msg[lang]
+        try:
+            return self.languages[lang]
+        except KeyError:
+            offset, length = self.index[lang]
+        self.lock.acquire()
+        try:
+            if lang not in self.languages:
+                self.file.seek(self.start + offset)
+                self.languages[lang] = marshal.loads(self.file.read(length))
+            return self.languages[lang]
+        finally:
+            self.lock.release()
+
+
+_catalogs = {}
+_catalogLock = threading.Lock()
+# language code -> the languages twtranslate() tries for it
+_fallbacks = {}
+# (language code, TranslateWiki title) -> (translation, its language)
+_resolved = {}
+
+
+def _catalog(package):
+    """Return the _Catalog of the messages of package."""
+    try:
+        return _catalogs[package]
+    except KeyError:
+        pass
+    _catalogLock.acquire()
+    try:
+        if package not in _catalogs:
+            _catalogs[package] = _Catalog(package)
+        return _catalogs[package]
+    finally:
+        _catalogLock.release()
+
+
+def _twresolve(lang, twtitle):
+    """Return the translation of twtitle for lang and the language it was
+    found in, which may be one of the fallback languages of lang.
+
+    """
+    try:
+        return _resolved[lang, twtitle]
+    except KeyError:
+        pass
+    transdict = _catalog(twtitle.split("-")[0])
+    # There are two possible failure modes: the translation dict might not
+    # have the language altogether, or a specific key could be
+    # untranslated. Both modes are caught with the KeyError.
+    trans = None
+    try:
+        trans = transdict[lang][twtitle]
+        found = lang
+    except KeyError:
+        try:
+            alternatives = _fallbacks[lang]
+        except KeyError:
+            alternatives = _fallbacks[lang] = tuple(_altlang(lang) + ['en'])
+        # try alternative languages and English
+        for alt in alternatives:
+            try:
+                trans = transdict[alt][twtitle]
+                found = alt
+                break
+            except KeyError:
+                continue
+        if not trans:
+            raise TranslationError("No English translation has been defined "
+                                   "for TranslateWiki key %r" % twtitle)
+    _resolved[lang, twtitle] = trans, found
+    return trans, found
+
+
 def translate(code, xdict, parameters=None, fallback=True):
     """Return the most appropriate translation from a translation dict.
 
@@ -332,9 +511,6 @@ def twtranslate(code, twtitle, parameters=None):
         The translations are retrieved from i18n.<package>, based on the callers
         import table.
     """
-    package = twtitle.split("-")[0]
-    transdict = getattr(__import__("i18n", {}, {}, [package]), package).msg
-
     code_needed = False
     # If a site is given instead of a code, use its language
     if hasattr(code, 'lang'):
@@ -346,29 +522,10 @@ def twtranslate(code, twtitle, parameters=None):
     else:
         lang = code
 
-    # There are two possible failure modes: the translation dict might not have
-    # the language altogether, or a specific key could be untranslated. Both
-    # modes are caught with the KeyError.
-
-    trans = None
-    try:
-        trans = transdict[lang][twtitle]
-    except KeyError:
-        # try alternative languages and English
-        for alt in _altlang(lang) + ['en']:
-            try:
-                trans = transdict[alt][twtitle]
-                if code_needed:
-                    lang = alt
-                break
-            except KeyError:
-                continue
-        if not trans:
-            raise TranslationError("No English translation has been defined "
-                                   "for TranslateWiki key %r" % twtitle)
+    trans, found = _twresolve(lang, twtitle)
     # send the language code back via the given list
     if code_needed:
-        code.append(lang)
+        code.append(found)
     if parameters:
         return trans % parameters
     else:
@@ -489,8 +646,7 @@ def twhas_key(code, twtitle):
         The translations are retrieved from i18n.<package>, based on the callers
         import table.
     """
-    package = twtitle.split("-")[0]
-    transdict = getattr(__import__("i18n", {}, {}, [package]), package).msg
+    transdict = _catalog(twtitle.split("-")[0])
     # If a site is given instead of a code, use its language
     if hasattr(code, 'lang'):
         code = code.lang
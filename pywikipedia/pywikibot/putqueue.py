@@ -0,0 +1,414 @@
+# -*- coding: utf-8  -*-
+"""
+The queue of Page.put_async().
+
+Pages given to put_async() are saved by worker threads, which are started
+per site when the first page of that site is queued (config.put_async_workers
+of them). The pages of a site are taken from the queue in the order in which
+they were put, and a page is never saved by two threads at once.
+
+If a page is put again while its previous save has not been started yet, the
+two saves are coalesced: the last text, summary and flags win, and only one
+edit is made. The callbacks of both saves are called after it.
+
+If config.put_async_journal is set, each queued save is written to a journal
+file (put-journal/<script>.txt in the data directory), and marked as done
+after it has been made. Saves which were still in the journal when the bot
+stopped, e.g. because it crashed, are queued again when the same script puts
+a page asynchronously the next time. The journal keeps the timestamps of
+the revision the new text was based on, so a save which is made again after
+someone else has edited the page fails with an edit conflict instead of
+overwriting that edit.
+"""
+#
+# (C) Pywikipedia bot team, 2013
+#
+# Distributed under the terms of the MIT license.
+#
+__version__ = '$Id$'
+
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import config
+import wikipedia as pywikibot
+
+
+class PutRequest(object):
+    """
+    A save in the queue.
+
+    When the save has been made or has failed, the callbacks given to
+    put_async() are called with the page and the error (None on success),
+    and the resultCallbacks with this object, which has the timing of the
+    save: the times at which it was queued, started and finished (time.time()
+    values), the number of earlier saves it replaced (coalesced), and the
+    error.
+    """
+    def __init__(self, page, newtext, comment=None, watchArticle=None,
+                 minorEdit=True, force=False, callback=None,
+                 resultCallback=None):
+        self.page = page
+        self.site = page.site()
+        self.key = (self.site, page.title())
+        self.newtext = newtext
+        self.comment = comment
+        self.watchArticle = watchArticle
+        self.minorEdit = minorEdit
+        self.force = force
+        self.callbacks = []
+        self.resultCallbacks = []
+        self._addCallbacks(callback, resultCallback)
+        self.queued = time.time()
+        self.started = None
+        self.finished = None
+        self.coalesced = 0
+        self.error = None
+        self.traceback = None
+        self.id = None
+
+    def _addCallbacks(self, callback, resultCallback):
+        if callback is not None:
+            self.callbacks.append(callback)
+        if resultCallback is not None:
+            self.resultCallbacks.append(resultCallback)
+
+    def replace(self, other):
+        """Take the text, summary and flags of the later save other."""
+        self.newtext = other.newtext
+        self.comment = other.comment
+        self.watchArticle = other.watchArticle
+        self.minorEdit = other.minorEdit
+        self.force = other.force
+        self.callbacks.extend(other.callbacks)
+        self.resultCallbacks.extend(other.resultCallbacks)
+        self.coalesced += other.coalesced + 1
+
+    def waited(self):
+        """Return the number of seconds the save waited in the queue."""
+        return (self.started or time.time()) - self.queued
+
+    def duration(self):
+        """Return the number of seconds the save took, or None."""
+        if self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def record(self):
+        """Return the journal record of this save."""
+        # put() uses the current time if the page was never loaded; when the
+        # save is made again after a crash, that would hide the edits made
+        # since it was queued
+        queued = time.strftime('%Y%m%d%H%M%S', time.gmtime(self.queued))
+        editTime = self.page._editTime or queued
+        startTime = self.page._startTime or queued
+        return {'id': self.id,
+                'family': self.site.family.name,
+                'lang': self.site.lang,
+                'title': self.page.title(),
+                'text': self.newtext,
+                'comment': self.comment,
+                'watch': self.watchArticle,
+                'minor': self.minorEdit,
+                'force': self.force,
+                'edittime': editTime,
+                'starttime': startTime}
+
+    def __repr__(self):
+        return 'PutRequest(%r)' % self.page
+
+
+class PutJournal(object):
+    """
+    Journal of the queued saves, one JSON record per line.
+
+    A save is written when it is queued, again when a later save of the same
+    page is coalesced with it, and a {"id": ..., "done": true} record after it
+    has been made. The file is emptied whenever the queue becomes empty.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.lastId = 0
+        self._file = None
+
+    def unfinished(self):
+        """Return the last records of the saves which were not done."""
+        try:
+            f = open(self.filename)
+        except IOError:
+            return []
+        records = {}
+        order = []
+        try:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last line of a crashed run may be incomplete
+                    continue
+                if record.get('done'):
+                    records.pop(record['id'], None)
+                else:
+                    if record['id'] not in records:
+                        order.append(record['id'])
+                    records[record['id']] = record
+        finally:
+            f.close()
+        return [records[id] for id in order if id in records]
+
+    def _write(self, record):
+        self.lock.acquire()
+        try:
+            if self._file is None:
+                self._file = open(self.filename, 'a')
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+        finally:
+            self.lock.release()
+
+    def add(self, request):
+        """Write the queued or coalesced save request."""
+        if request.id is None:
+            self.lock.acquire()
+            try:
+                self.lastId += 1
+                request.id = self.lastId
+            finally:
+                self.lock.release()
+        self._write(request.record())
+
+    def done(self, request):
+        """Mark the save request as made."""
+        self._write({'id': request.id, 'done': True})
+
+    def clear(self):
+        """Empty the journal."""
+        self.lock.acquire()
+        try:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.filename, 'w')
+        finally:
+            self.lock.release()
+
+
+class PutQueue(object):
+    """
+    Saves pages in worker threads, per site.
+
+    At most maxsize saves are waiting (if maxsize > 0); put() blocks if
+    there are more. workers is the number of threads per site.
+    """
+    def __init__(self, maxsize=0, workers=1, journal=None):
+        self.maxsize = maxsize
+        self.workers = max(1, workers)
+        self.journal = journal
+        self.cond = threading.Condition()
+        # site -> keys of the waiting saves, in the order they were put
+        self._order = {}
+        # key -> waiting PutRequest
+        self._waiting = {}
+        # keys of the saves in progress
+        self._busy = set()
+        # site -> live worker threads
+        self._threads = {}
+        self._recovered = False
+
+    def put(self, request):
+        """Queue the PutRequest request, or coalesce it with a waiting one."""
+        if not self._recovered:
+            self._recovered = True
+            self.recover()
+        self.cond.acquire()
+        try:
+            while (self.maxsize > 0 and len(self._waiting) >= self.maxsize
+                   and request.key not in self._waiting):
+                self.cond.wait()
+            waiting = self._waiting.get(request.key)
+            if waiting is not None:
+                waiting.replace(request)
+                request = waiting
+            else:
+                self._waiting[request.key] = request
+                self._order.setdefault(request.site, []).append(request.key)
+            if self.journal:
+                self.journal.add(request)
+            self._startWorker(request.site)
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+    def recover(self):
+        """Queue the saves the journal has from an earlier run again."""
+        if not self.journal:
+            return
+        records = self.journal.unfinished()
+        self.journal.clear()
+        if not records:
+            return
+        pywikibot.output(u'Saving %i pages which were still queued when %s '
+                         u'stopped the last time.'
+                         % (len(records), pywikibot.calledModuleName()))
+        for record in records:
+            try:
+                site = pywikibot.getSite(record['lang'], record['family'])
+                page = pywikibot.Page(site, record['title'])
+            except pywikibot.Error, error:
+                pywikibot.output(u'Cannot save %s:%s:%s again: %s'
+                                 % (record['family'], record['lang'],
+                                    record['title'], error))
+                continue
+            # detect edits made since the save was queued
+            page._editTime = record.get('edittime')
+            page._startTime = record.get('starttime')
+            self.put(PutRequest(page, record['text'], record['comment'],
+                                record['watch'], record['minor'],
+                                record['force']))
+
+    def _startWorker(self, site):
+        # called with self.cond acquired
+        threads = [thread for thread in self._threads.get(site, [])
+                   if thread.isAlive()]
+        waiting = len(self._order.get(site, ()))
+        if len(threads) < min(self.workers, waiting):
+            thread = threading.Thread(target=self._work, args=(site,))
+            # identification for debugging purposes
+            thread.setName('Put-Thread-%s-%i' % (site, len(threads) + 1))
+            thread.setDaemon(True)
+            threads.append(thread)
+            thread.start()
+        self._threads[site] = threads
+
+    def _next(self, site):
+        """Return the next save of site which is not in progress, or None."""
+        self.cond.acquire()
+        try:
+            while True:
+                order = self._order.get(site, [])
+                for i, key in enumerate(order):
+                    if key not in self._busy:
+                        del order[i]
+                        self._busy.add(key)
+                        self.cond.notifyAll()
+                        return self._waiting.pop(key)
+                if not order:
+                    # nothing left for this site; the worker ends, and a
+                    # new one is started for the next save
+                    self._threads[site].remove(threading.currentThread())
+                    return None
+                self.cond.wait()
+        finally:
+            self.cond.release()
+
+    def _work(self, site):
+        while True:
+            request = self._next(site)
+            if request is None:
+                return
+            self._save(request)
+            self.cond.acquire()
+            try:
+                self._busy.discard(request.key)
+                if self.journal and not self._busy and not self._waiting:
+                    self.journal.clear()
+                self.cond.notifyAll()
+            finally:
+                self.cond.release()
+
+    def _save(self, request):
+        request.started = time.time()
+        try:
+            request.page.put(request.newtext, request.comment,
+                             request.watchArticle, request.minorEdit,
+                             request.force)
+        except Exception, error:
+            request.error = error
+            request.traceback = traceback.format_exception(*sys.exc_info())
+        request.finished = time.time()
+        if self.journal:
+            self.journal.done(request)
+        for callback in request.callbacks:
+            callback(request.page, request.error)
+        for callback in request.resultCallbacks:
+            callback(request)
+        if not request.callbacks and not request.resultCallbacks:
+            # if a callback is provided, it is responsible for exception
+            # handling
+            self.report(request)
+
+    def report(self, request):
+        """Tell the user why the save request failed, if it did."""
+        page = request.page
+        error = request.error
+        if isinstance(error, pywikibot.SpamfilterError):
+            pywikibot.output(u"Saving page %s prevented by spam filter: %s"
+                             % (page, error.url))
+        elif isinstance(error, pywikibot.PageNotSaved):
+            pywikibot.output(u"Saving page %s failed: %s" % (page, error))
+        elif isinstance(error, pywikibot.LockedPage):
+            pywikibot.output(u"Page %s is locked; not saved." % page)
+        elif isinstance(error, pywikibot.NoUsername):
+            pywikibot.output(u"Page %s not saved; sysop privileges required."
+                             % page)
+        elif error is not None:
+            pywikibot.output(u"Saving page %s failed:\n%s"
+                             % (page, "".join(request.traceback)))
+
+    def qsize(self):
+        """Return the number of saves waiting or in progress."""
+        self.cond.acquire()
+        try:
+            return len(self._waiting) + len(self._busy)
+        finally:
+            self.cond.release()
+
+    def siteSizes(self):
+        """Return a dictionary site -> number of saves waiting or in progress."""
+        self.cond.acquire()
+        try:
+            sizes = {}
+            for site, key in self._busy:
+                sizes[site] = sizes.get(site, 0) + 1
+            for site, order in self._order.iteritems():
+                if order:
+                    sizes[site] = sizes.get(site, 0) + len(order)
+            return sizes
+        finally:
+            self.cond.release()
+
+    def join(self, timeout=None):
+        """
+        Wait until all saves are done, or for at most timeout seconds.
+
+        Return True if the queue is empty.
+        """
+        if timeout is not None:
+            end = time.time() + timeout
+        self.cond.acquire()
+        try:
+            while self._waiting or self._busy:
+                if timeout is None:
+                    # wait in steps, so that KeyboardInterrupt gets through
+                    self.cond.wait(1)
+                else:
+                    left = end - time.time()
+                    if left <= 0:
+                        return False
+                    self.cond.wait(left)
+            return True
+        finally:
+            self.cond.release()
+
+
+def journalFilename():
+    """Return the name of the journal file of the running script."""
+    return config.datafilepath('put-journal',
+                               '%s.txt' % pywikibot.calledModuleName())
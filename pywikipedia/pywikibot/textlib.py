@@ -33,8 +33,361 @@ def unescape(s):
     return s
 
 
+# Exception regexes which do not depend on the site. 'hyperlink' is added
+# on first use, see getExceptionRegexes().
+_EXCEPTION_REGEXES = {
+    'comment':      re.compile(r'(?s)<!--.*?-->'),
+    # section headers
+    'header':       re.compile(r'\r?\n=+.+=+ *\r?\n'),
+    # preformatted text
+    'pre':          re.compile(r'(?ism)<pre>.*?</pre>'),
+    'source':       re.compile(r'(?is)<source .*?</source>'),
+    # inline references
+    'ref':          re.compile(r'(?ism)<ref[ >].*?</ref>'),
+    # lines that start with a space are shown in a monospace font and
+    # have whitespace preserved.
+    'startspace':   re.compile(r'(?m)^ (.*?)$'),
+    # tables often have whitespace that is used to improve wiki
+    # source code readability.
+    # TODO: handle nested tables.
+    'table':        re.compile(r'(?ims)^{\|.*?^\|}|<table>.*?</table>'),
+    'gallery':      re.compile(r'(?is)<gallery.*?>.*?</gallery>'),
+    # this matches internal wikilinks, but also interwiki, categories, and
+    # images.
+    'link':         re.compile(r'\[\[[^\]\|]*(\|[^\]]*)?\]\]'),
+    # Wikidata property inclusions
+    'property':     re.compile(r'(?i)\{\{\s*#property:\s*p\d+\s*\}\}'),
+    # Module invocations (currently only Lua)
+    'invoke':       re.compile(r'(?i)\{\{\s*#invoke:.*?}\}'),
+}
+
+SYNTAXHIGHLIGHT_REGEX = re.compile(r'(?is)<syntaxhighlight .*?</syntaxhighlight>')
+GROUP_REGEX = re.compile(r'\\(?P<number>\d+)|\\g<(?P<name>.+?)>')
+
+# site -> (language links, obsolete codes, size, exception regexes)
+_site_exception_regexes = {}
+# extension tag name -> compiled regex
+_tag_regexes = {}
+
+
+def getExceptionRegexes(site):
+    """
+    Return the dictionary of compiled exception regexes for site.
+
+    The dictionary is built once per site and rebuilt only if the
+    language links or obsolete codes of the site's family change. It must
+    not be modified by the caller.
+
+    """
+    langs = site.validLanguageLinks()
+    obsolete = site.family.obsolete
+    key = repr(site)
+    try:
+        cachedLangs, cachedObsolete, size, regexes = \
+                     _site_exception_regexes[key]
+    except KeyError:
+        pass
+    else:
+        if cachedLangs is langs and cachedObsolete is obsolete \
+           and size == len(langs) + len(obsolete):
+            return regexes
+
+    if 'hyperlink' not in _EXCEPTION_REGEXES:
+        _EXCEPTION_REGEXES['hyperlink'] = compileLinkR()
+    regexes = dict(_EXCEPTION_REGEXES)
+    # also finds links to foreign sites with preleading ":"
+    regexes['interwiki'] = re.compile(r'(?i)\[\[:?(%s)\s?:[^\]]*\]\][\s]*'
+                                      % '|'.join(langs + obsolete.keys()))
+    _site_exception_regexes[key] = (langs, obsolete,
+                                    len(langs) + len(obsolete), regexes)
+    return regexes
+
+
+def _tagRegex(tag):
+    """Return a compiled regex matching the content of an extension tag."""
+    try:
+        return _tag_regexes[tag]
+    except KeyError:
+        regex = re.compile(r'(?is)<%s>.*?</%s>' % (tag, tag))
+        _tag_regexes[tag] = regex
+        return regex
+
+
+class ReplacePlan(object):
+    """
+    A replacement which can be applied to many texts.
+
+    Compiles 'old' and resolves the exceptions to regular expressions once,
+    so that apply() does not pay that cost for every text. The parameters
+    are the same as for replaceExcept(), plus:
+
+        masking         - if true, the spans protected by the exceptions are
+                          computed once and the replacements are only done
+                          in the gaps between them; if false, the exceptions
+                          are searched again after every match (slow on long
+                          texts with many exceptions). Defaults to
+                          config.replace_masking. With masking, 'old' and the
+                          exceptions are matched against the original text,
+                          not against the text replaced so far, so
+                          lookbehinds, anchors and exceptions which depend on
+                          earlier replacements give different results (see
+                          config.py).
+
+    Example:
+
+        plan = ReplacePlan(r'colou?r', u'colour', ['comment', 'nowiki'])
+        for page in pages:
+            text = plan.apply(page.get())
+
+    """
+    def __init__(self, old, new, exceptions, caseInsensitive=False,
+                 allowoverlap=False, marker='', site=None, masking=None):
+        if site is None:
+            site = pywikibot.getSite()
+        if masking is None:
+            masking = config.replace_masking
+        # if we got a string, compile it as a regular expression
+        if isinstance(old, basestring):
+            if caseInsensitive:
+                old = re.compile(old, re.IGNORECASE | re.UNICODE)
+            else:
+                old = re.compile(old)
+        self.old = old
+        if not callable(new):
+            # it is a little hack to make \n work. It would be better
+            # to fix it previously, but better than nothing.
+            new = new.replace('\\n', '\n')
+        self.new = new
+        self.allowoverlap = allowoverlap
+        self.marker = marker
+        # overlapping matches have to be searched in the replaced text,
+        # which only the iterative engine does
+        self.masking = masking and not allowoverlap
+
+        exceptionRegexes = getExceptionRegexes(site)
+        self.dontTouchRegexes = []
+        self.exceptTemplates = False
+        for exc in exceptions:
+            if isinstance(exc, basestring):
+                # assume it's a reference to the exceptionRegexes dictionary
+                if exc in exceptionRegexes:
+                    self.dontTouchRegexes.append(exceptionRegexes[exc])
+                elif exc == 'template':
+                    self.exceptTemplates = True
+                else:
+                    # nowiki, noinclude, includeonly, timeline, math ond other
+                    # extensions
+                    self.dontTouchRegexes.append(_tagRegex(exc))
+                # handle alias
+                if exc == 'source':
+                    self.dontTouchRegexes.append(SYNTAXHIGHLIGHT_REGEX)
+            else:
+                # assume it's a regular expression
+                self.dontTouchRegexes.append(exc)
+
+    def apply(self, text):
+        """Return text with the replacement applied."""
+        dontTouchRegexes = self.dontTouchRegexes
+        # mark templates
+        # don't care about mw variables and parser functions
+        if self.exceptTemplates:
+            dontTouchRegexes = list(dontTouchRegexes)
+            marker1 = findmarker(text)
+            marker2 = findmarker(text, u'##', u'#')
+            Rvalue = re.compile('{{{.+?}}}')
+            Rmarker1 = re.compile('%(mark)s(\d+)%(mark)s' % {'mark': marker1})
+            Rmarker2 = re.compile('%(mark)s(\d+)%(mark)s' % {'mark': marker2})
+            # hide the flat template marker
+            dontTouchRegexes.append(Rmarker1)
+            values = {}
+            count = 0
+            for m in Rvalue.finditer(text):
+                count += 1
+                item = m.group()
+                text = text.replace(item, '%s%d%s' % (marker2, count, marker2))
+                values[count] = item
+            inside = {}
+            count = 0
+            while TEMP_REGEX.search(text) is not None:
+                for m in TEMP_REGEX.finditer(text):
+                    count += 1
+                    item = m.group()
+                    text = text.replace(item, '%s%d%s' % (marker1, count, marker1))
+
+                    # Make sure stored templates don't contain markers
+                    for m2 in Rmarker1.finditer(item):
+                        item = item.replace(m2.group(), inside[int(m2.group(1))])
+                    for m2 in Rmarker2.finditer(item):
+                        item = item.replace(m2.group(), values[int(m2.group(1))])
+                    inside[count] = item
+        if self.masking:
+            text = self._replaceMasked(text, dontTouchRegexes)
+        else:
+            text = self._replaceIterative(text, dontTouchRegexes)
+
+        if self.exceptTemplates:  # restore templates from dict
+            for m2 in Rmarker1.finditer(text):
+                text = text.replace(m2.group(), inside[int(m2.group(1))])
+            for m2 in Rmarker2.finditer(text):
+                text = text.replace(m2.group(), values[int(m2.group(1))])
+        return text
+
+    def _replaceIterative(self, text, dontTouchRegexes):
+        """
+        Replace in text, searching the exceptions again after every match.
+
+        This is the old engine; it is needed for allowoverlap because the
+        replaced text is searched again.
+        """
+        index = 0
+        markerpos = len(text)
+        while True:
+            match = self.old.search(text, index)
+            if not match:
+                # nothing left to replace
+                break
+
+            # check which exception will occur next.
+            nextExceptionMatch = None
+            for dontTouchR in dontTouchRegexes:
+                excMatch = dontTouchR.search(text, index)
+                if excMatch and (
+                        nextExceptionMatch is None or
+                        excMatch.start() < nextExceptionMatch.start()):
+                    nextExceptionMatch = excMatch
+
+            if nextExceptionMatch is not None \
+                    and nextExceptionMatch.start() <= match.start():
+                # an HTML comment or text in nowiki tags stands before the next
+                # valid match. Skip.
+                index = nextExceptionMatch.end()
+            else:
+                # We found a valid match. Replace it.
+                replacement = self._replacement(match)
+                text = text[:match.start()] + replacement + text[match.end():]
+
+                # continue the search on the remaining text
+                if self.allowoverlap:
+                    index = match.start() + 1
+                else:
+                    index = match.start() + len(replacement)
+                markerpos = match.start() + len(replacement)
+        return text[:markerpos] + self.marker + text[markerpos:]
+
+    def _replaceMasked(self, text, dontTouchRegexes):
+        """
+        Replace in text outside of the spans matched by the exceptions.
+
+        The protected spans are computed once, so every exception regex
+        runs over the text only one time.
+        """
+        spans = protectedSpans(text, dontTouchRegexes)
+        result = []
+        # position in result after which the marker has to be inserted
+        markerpos = None
+        # end of the part of text which has already been copied to result
+        pos = 0
+        index = 0
+        span = 0
+        while index <= len(text):
+            match = self.old.search(text, index)
+            if not match:
+                # nothing left to replace
+                break
+            start = match.start()
+            # forget the spans which end before the match
+            while span < len(spans) and spans[span][1] <= start:
+                span += 1
+            if span < len(spans) and spans[span][0] <= start:
+                # the match starts inside an HTML comment, nowiki tags etc.
+                # Skip.
+                index = spans[span][1]
+                continue
+            result.append(text[pos:start])
+            result.append(self._replacement(match))
+            markerpos = len(result)
+            pos = match.end()
+            if match.end() > start:
+                index = match.end()
+            else:
+                # don't find the same empty match again
+                index = start + 1
+        result.append(text[pos:])
+        if self.marker:
+            if markerpos is None:
+                result.append(self.marker)
+            else:
+                result.insert(markerpos, self.marker)
+        return ''.join(result)
+
+    def _replacement(self, match):
+        """Return the replacement text for match."""
+        if callable(self.new):
+            # the parameter new can be a function which takes the match
+            # as a parameter.
+            return self.new(match)
+        # it is not a function, but a string.
+
+        # We cannot just insert the new string, as it may contain regex
+        # group references such as \2 or \g<name>.
+        # On the other hand, this approach does not work because it
+        # can't handle lookahead or lookbehind (see bug #1731008):
+        #replacement = old.sub(new, text[match.start():match.end()])
+        #text = text[:match.start()] + replacement + text[match.end():]
+
+        # So we have to process the group references manually.
+        replacement = self.new
+        while True:
+            groupMatch = GROUP_REGEX.search(replacement)
+            if not groupMatch:
+                break
+            groupID = groupMatch.group('name') or \
+                      int(groupMatch.group('number'))
+            try:
+                replacement = replacement[:groupMatch.start()] + \
+                              match.group(groupID) + \
+                              replacement[groupMatch.end():]
+            except IndexError:
+                print '\nInvalid group reference:', groupID
+                print 'Groups found:\n', match.groups()
+                raise IndexError
+        return replacement
+
+
+def protectedSpans(text, regexes):
+    """
+    Return the sorted list of (start, end) tuples of the parts of text which
+    are protected by any of the regexes.
+
+    The text is scanned once from the beginning: the leftmost match of any
+    regex is protected, and scanning continues at its end, so a match which
+    starts inside another one (e.g. <nowiki> inside a comment) is ignored.
+    A regex is only searched again when the scan has passed the start of its
+    last match.
+    """
+    # next match of each regex; None if there is none left
+    nextMatches = [regex.search(text) for regex in regexes]
+    spans = []
+    pos = 0
+    while True:
+        first = None
+        for i in range(len(regexes)):
+            m = nextMatches[i]
+            if m is not None and m.start() < pos:
+                m = nextMatches[i] = regexes[i].search(text, pos)
+            if m is not None and (first is None or m.start() < first.start()):
+                first = m
+        if first is None:
+            return spans
+        if first.end() > first.start():
+            spans.append((first.start(), first.end()))
+            pos = first.end()
+        else:
+            pos = first.start() + 1
+
+
 def replaceExcept(text, old, new, exceptions, caseInsensitive=False,
-                  allowoverlap=False, marker='', site=None):
+                  allowoverlap=False, marker='', site=None, masking=None):
     """
     Return text with 'old' replaced by 'new', ignoring specified types of text.
 
@@ -55,180 +408,14 @@ def replaceExcept(text, old, new, exceptions, caseInsensitive=False,
         caseInsensitive - a boolean
         marker          - a string that will be added to the last replacement;
                           if nothing is changed, it is added at the end
+        masking         - see ReplacePlan
 
-    """
-    if site is None:
-        site = pywikibot.getSite()
-
-    exceptionRegexes = {
-        'comment':      re.compile(r'(?s)<!--.*?-->'),
-        # section headers
-        'header':       re.compile(r'\r?\n=+.+=+ *\r?\n'),
-        # preformatted text
-        'pre':          re.compile(r'(?ism)<pre>.*?</pre>'),
-        'source':       re.compile(r'(?is)<source .*?</source>'),
-        # inline references
-        'ref':          re.compile(r'(?ism)<ref[ >].*?</ref>'),
-        # lines that start with a space are shown in a monospace font and
-        # have whitespace preserved.
-        'startspace':   re.compile(r'(?m)^ (.*?)$'),
-        # tables often have whitespace that is used to improve wiki
-        # source code readability.
-        # TODO: handle nested tables.
-        'table':        re.compile(r'(?ims)^{\|.*?^\|}|<table>.*?</table>'),
-        'hyperlink':    compileLinkR(),
-        'gallery':      re.compile(r'(?is)<gallery.*?>.*?</gallery>'),
-        # this matches internal wikilinks, but also interwiki, categories, and
-        # images.
-        'link':         re.compile(r'\[\[[^\]\|]*(\|[^\]]*)?\]\]'),
-        # also finds links to foreign sites with preleading ":"
-        'interwiki':    re.compile(r'(?i)\[\[:?(%s)\s?:[^\]]*\]\][\s]*'
-                                   % '|'.join(site.validLanguageLinks() +
-                                              site.family.obsolete.keys())),
-        # Wikidata property inclusions
-        'property':     re.compile(r'(?i)\{\{\s*#property:\s*p\d+\s*\}\}'),
-        # Module invocations (currently only Lua)
-        'invoke':       re.compile(r'(?i)\{\{\s*#invoke:.*?}\}'),
+    If the same replacement is applied to many texts, create a ReplacePlan
+    once and call its apply() method instead.
 
-    }
-
-    # if we got a string, compile it as a regular expression
-    if isinstance(old, basestring):
-        if caseInsensitive:
-            old = re.compile(old, re.IGNORECASE | re.UNICODE)
-        else:
-            old = re.compile(old)
-
-    dontTouchRegexes = []
-    except_templates = False
-    for exc in exceptions:
-        if isinstance(exc, basestring):
-            # assume it's a reference to the exceptionRegexes dictionary
-            # defined above.
-            if exc in exceptionRegexes:
-                dontTouchRegexes.append(exceptionRegexes[exc])
-            elif exc == 'template':
-                except_templates = True
-            else:
-                # nowiki, noinclude, includeonly, timeline, math ond other
-                # extensions
-                dontTouchRegexes.append(re.compile(r'(?is)<%s>.*?</%s>'
-                                                   % (exc, exc)))
-            # handle alias
-            if exc == 'source':
-                dontTouchRegexes.append(re.compile(
-                    r'(?is)<syntaxhighlight .*?</syntaxhighlight>'))
-        else:
-            # assume it's a regular expression
-            dontTouchRegexes.append(exc)
-
-    # mark templates
-    # don't care about mw variables and parser functions
-    if except_templates:
-        marker1 = findmarker(text)
-        marker2 = findmarker(text, u'##', u'#')
-        Rvalue = re.compile('{{{.+?}}}')
-        Rmarker1 = re.compile('%(mark)s(\d+)%(mark)s' % {'mark': marker1})
-        Rmarker2 = re.compile('%(mark)s(\d+)%(mark)s' % {'mark': marker2})
-        # hide the flat template marker
-        dontTouchRegexes.append(Rmarker1)
-        values = {}
-        count = 0
-        for m in Rvalue.finditer(text):
-            count += 1
-            item = m.group()
-            text = text.replace(item, '%s%d%s' % (marker2, count, marker2))
-            values[count] = item
-        inside = {}
-        count = 0
-        while TEMP_REGEX.search(text) is not None:
-            for m in TEMP_REGEX.finditer(text):
-                count += 1
-                item = m.group()
-                text = text.replace(item, '%s%d%s' % (marker1, count, marker1))
-
-                # Make sure stored templates don't contain markers
-                for m2 in Rmarker1.finditer(item):
-                    item = item.replace(m2.group(), inside[int(m2.group(1))])
-                for m2 in Rmarker2.finditer(item):
-                    item = item.replace(m2.group(), values[int(m2.group(1))])
-                inside[count] = item
-    index = 0
-    markerpos = len(text)
-    while True:
-        match = old.search(text, index)
-        if not match:
-            # nothing left to replace
-            break
-
-        # check which exception will occur next.
-        nextExceptionMatch = None
-        for dontTouchR in dontTouchRegexes:
-            excMatch = dontTouchR.search(text, index)
-            if excMatch and (
-                    nextExceptionMatch is None or
-                    excMatch.start() < nextExceptionMatch.start()):
-                nextExceptionMatch = excMatch
-
-        if nextExceptionMatch is not None \
-                and nextExceptionMatch.start() <= match.start():
-            # an HTML comment or text in nowiki tags stands before the next
-            # valid match. Skip.
-            index = nextExceptionMatch.end()
-        else:
-            # We found a valid match. Replace it.
-            if callable(new):
-                # the parameter new can be a function which takes the match
-                # as a parameter.
-                replacement = new(match)
-            else:
-                # it is not a function, but a string.
-
-                # it is a little hack to make \n work. It would be better
-                # to fix it previously, but better than nothing.
-                new = new.replace('\\n', '\n')
-
-                # We cannot just insert the new string, as it may contain regex
-                # group references such as \2 or \g<name>.
-                # On the other hand, this approach does not work because it
-                # can't handle lookahead or lookbehind (see bug #1731008):
-                #replacement = old.sub(new, text[match.start():match.end()])
-                #text = text[:match.start()] + replacement + text[match.end():]
-
-                # So we have to process the group references manually.
-                replacement = new
-
-                groupR = re.compile(r'\\(?P<number>\d+)|\\g<(?P<name>.+?)>')
-                while True:
-                    groupMatch = groupR.search(replacement)
-                    if not groupMatch:
-                        break
-                    groupID = groupMatch.group('name') or \
-                              int(groupMatch.group('number'))
-                    try:
-                        replacement = replacement[:groupMatch.start()] + \
-                                      match.group(groupID) + \
-                                      replacement[groupMatch.end():]
-                    except IndexError:
-                        print '\nInvalid group reference:', groupID
-                        print 'Groups found:\n', match.groups()
-                        raise IndexError
-            text = text[:match.start()] + replacement + text[match.end():]
-
-            # continue the search on the remaining text
-            if allowoverlap:
-                index = match.start() + 1
-            else:
-                index = match.start() + len(replacement)
-            markerpos = match.start() + len(replacement)
-    text = text[:markerpos] + marker + text[markerpos:]
-
-    if except_templates:  # restore templates from dict
-        for m2 in Rmarker1.finditer(text):
-            text = text.replace(m2.group(), inside[int(m2.group(1))])
-        for m2 in Rmarker2.finditer(text):
-            text = text.replace(m2.group(), values[int(m2.group(1))])
-    return text
+    """
+    return ReplacePlan(old, new, exceptions, caseInsensitive, allowoverlap,
+                       marker, site, masking).apply(text)
 
 
 def removeDisabledParts(text, tags=['*']):
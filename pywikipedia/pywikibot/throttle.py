@@ -1,9 +1,18 @@
 # -*- coding: utf-8  -*-
 """
 Mechanics to slow down wiki read and/or write rate.
+
+Every host has two token buckets, one for reads and one for writes. A
+request takes tokens from the bucket of its host and waits while the bucket
+is empty; the buckets are refilled at the nominal rate of one token per
+'delay' seconds. The buckets are kept in a small file (throttle.dat) which
+all bot processes map into memory and lock with fcntl, so that the
+processes share the rate allowed for a host instead of each of them
+slowing down by the number of running processes. Where fcntl or mmap are
+not available (e.g. on Windows), every process has its own buckets.
 """
 #
-# (C) Pywikipedia bot team, 2008
+# (C) Pywikipedia bot team, 2008-2013
 #
 # Distributed under the terms of the MIT license.
 #
@@ -12,32 +21,234 @@ __version__ = '$Id: throttle.py 8035 2010-03-22 14:49:07Z xqt $'
 import wikipedia as pywikibot
 import config
 
+import errno
 import math
+import os
+import struct
 import threading
 import time
 
+try:
+    import fcntl
+    import mmap
+except ImportError:
+    fcntl = None
+
 pid = False     # global process identifier
                 # when the first Throttle is instantiated, it will set this
                 # variable to a positive integer, which will apply to all
                 # throttle objects created by this process.
 
+# Processes which have not used the throttle for this many seconds are
+# considered to be gone, and their process id is given to another process.
+releasepid = 1200
+
+
+class _Buckets(object):
+    """
+    Token buckets of this process only.
+
+    A bucket record is a list [read tokens, time of the last read, write
+    tokens, time of the last write, time until which the host is blocked].
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = {}
+
+    def register(self):
+        """Return the process id of this process (see pid)."""
+        return 1
+
+    def drop(self, pid):
+        """Forget the process with the process id pid."""
+        pass
+
+    def update(self, host, function):
+        """Return function(record), which may change the record of host."""
+        self.lock.acquire()
+        try:
+            record = self.records.setdefault(host, [0.0] * 5)
+            return function(record)
+        finally:
+            self.lock.release()
+
+
+class _SharedBuckets(_Buckets):
+    """
+    Token buckets and process ids shared by all processes through a file
+    mapped into memory.
+    """
+    magic = 'PWBT0001'
+    processSlots = 64
+    hostSlots = 256
+    # os process id and the time the process used the throttle last
+    processStruct = struct.Struct('=id')
+    # host name and bucket record
+    hostStruct = struct.Struct('=64s5d')
+
+    def __init__(self, filename):
+        _Buckets.__init__(self)
+        self.filename = filename
+        self.hostOffset = len(self.magic) \
+                          + self.processSlots * self.processStruct.size
+        self.size = self.hostOffset + self.hostSlots * self.hostStruct.size
+        self.fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0644)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size < self.size \
+                    or os.read(self.fd, len(self.magic)) != self.magic:
+                # a new or unusable file
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                os.write(self.fd, self.magic + '\0' * (self.size
+                                                       - len(self.magic)))
+            self.map = mmap.mmap(self.fd, self.size)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        # host -> slot in the file
+        self.slots = {}
+
+    def _locked(self, function, *args):
+        self.lock.acquire()
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+            try:
+                return function(*args)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        finally:
+            self.lock.release()
+
+    def _processOffset(self, slot):
+        return len(self.magic) + slot * self.processStruct.size
+
+    def register(self):
+        return self._locked(self._register)
+
+    def _register(self):
+        now = time.time()
+        ospid = os.getpid()
+        free = None
+        for slot in range(self.processSlots):
+            offset = self._processOffset(slot)
+            other, seen = self.processStruct.unpack_from(self.map, offset)
+            if other == ospid:
+                free = slot
+                break
+            if free is None and (other == 0 or now - seen > releasepid
+                                 or not _alive(other)):
+                free = slot
+        if free is None:
+            # Too many processes; share the last process id
+            return self.processSlots
+        self.processStruct.pack_into(self.map, self._processOffset(free),
+                                     ospid, now)
+        return free + 1
+
+    def drop(self, pid):
+        if 0 < pid <= self.processSlots:
+            self._locked(self.processStruct.pack_into, self.map,
+                         self._processOffset(pid - 1), 0, 0.0)
+
+    def update(self, host, function):
+        return self._locked(self._update, host, function)
+
+    def _update(self, host, function):
+        slot = self.slots.get(host)
+        if slot is None:
+            slot = self._findSlot(host)
+            if slot is None:
+                # The file is full, use a bucket of this process
+                record = self.records.setdefault(host, [0.0] * 5)
+                return function(record)
+            self.slots[host] = slot
+        offset = self.hostOffset + slot * self.hostStruct.size
+        values = self.hostStruct.unpack_from(self.map, offset)
+        record = list(values[1:])
+        result = function(record)
+        self.hostStruct.pack_into(self.map, offset, values[0], *record)
+        return result
+
+    def _findSlot(self, host):
+        """Return the slot of host in the file, or None if it is full."""
+        name = host.encode('utf-8')[:self.hostStruct.size - 40]
+        for slot in range(self.hostSlots):
+            offset = self.hostOffset + slot * self.hostStruct.size
+            other = self.map[offset:offset + len(name) + 1].rstrip('\0')
+            if other == name:
+                return slot
+            if not other:
+                self.hostStruct.pack_into(self.map, offset, name,
+                                          0.0, 0.0, 0.0, 0.0, 0.0)
+                return slot
+        return None
+
+
+def _alive(ospid):
+    """Return True if the process with the os process id ospid exists."""
+    try:
+        os.kill(ospid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return True
+
+
+_buckets = None
+
+
+def _getBuckets():
+    """Return the token buckets of all throttles."""
+    global _buckets
+    if _buckets is None:
+        if fcntl is None:
+            _buckets = _Buckets()
+        else:
+            try:
+                _buckets = _SharedBuckets(
+                    config.datafilepath('pywikibot', 'throttle.dat'))
+            except EnvironmentError, e:
+                pywikibot.output(u'WARNING: cannot share the throttle with '
+                                 u'other processes: %s' % e)
+                _buckets = _Buckets()
+    return _buckets
+
+
+def parseRetryAfter(value):
+    """
+    Return the number of seconds to wait given by the value of a
+    Retry-After header (seconds or an HTTP date), or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0, int(value))
+    except ValueError:
+        import email.utils
+        date = email.utils.parsedate_tz(value)
+        if date is None:
+            return None
+        return max(0, int(email.utils.mktime_tz(date) - time.time()))
+
 
 class Throttle(object):
     """Control rate of access to wiki server
 
-    Calling this object blocks the calling thread until at least 'delay'
-    seconds have passed since the previous call.
+    Calling this object blocks the calling thread until the token bucket of
+    the host allows another request, i.e. on average 'delay' seconds after
+    the previous call. Requests to different hosts do not wait for each
+    other.
 
     The framework initiates two Throttle objects: get_throttle to control
     the rate of read access, and put_throttle to control the rate of write
     access.
 
+    stats maps the hosts to the number of requests, the number of requests
+    which had to wait and the total time waited.
+
     """
     def __init__(self, mindelay=None, maxdelay=None, writedelay=None,
                  multiplydelay=True, verbosedelay=False, write=False):
         self.lock = threading.RLock()
         self.mysite = None
-        self.ctrlfilename = config.datafilepath('pywikibot', 'throttle.ctrl')
         self.mindelay = mindelay
         if self.mindelay is None:
             self.mindelay = config.minthrottle
@@ -47,86 +258,26 @@ class Throttle(object):
         self.writedelay = writedelay
         if self.writedelay is None:
             self.writedelay = config.put_throttle
-        self.last_read = 0
-        self.last_write = 0
-        self.next_multiplicity = 1.0
-        self.checkdelay = 120  # Check logfile again after this many seconds
-        self.dropdelay = 360   # Ignore processes that have not made
-                               # a check in this many seconds
-        self.releasepid = 1200 # Free the process id after this many seconds
         self.lastwait = 0.0
         self.delay = 0
-        self.checktime = 0
         self.verbosedelay = verbosedelay
+        # share the buckets with the other processes
         self.multiplydelay = multiplydelay
+        self.stats = {}
         if self.multiplydelay:
             self.checkMultiplicity()
         self.setDelay()
         self.write = write
 
     def checkMultiplicity(self):
-        """Count running processes for site and set process_multiplicity."""
+        """Register this process with the other bot processes and set pid."""
         global pid
         self.lock.acquire()
-        mysite = self.mysite = str(pywikibot.getSite())
-        if pywikibot.verbose:
-            pywikibot.output(u"Checking multiplicity: pid = %(pid)s" % globals())
         try:
-            processes = []
-            my_pid = pid or 1  # start at 1 if global pid not yet set
-            count = 1
-            # open throttle.log
-            try:
-                f = open(self.ctrlfilename, 'r')
-            except IOError:
-                if not pid:
-                    pass
-                else:
-                    raise
-            else:
-                now = time.time()
-                for line in f.readlines():
-                    # parse line; format is "pid timestamp site"
-                    try:
-                        line = line.split(' ')
-                        this_pid = int(line[0])
-                        ptime = int(line[1].split('.')[0])
-                        this_site = line[2].rstrip()
-                    except (IndexError, ValueError):
-                        continue    # Sometimes the file gets corrupted
-                                    # ignore that line
-                    if now - ptime > self.releasepid:
-                        continue    # process has expired, drop from file
-                    if now - ptime <= self.dropdelay \
-                       and this_site == mysite \
-                       and this_pid != pid:
-                        count += 1
-                    if this_site != self.mysite or this_pid != pid:
-                        processes.append({'pid': this_pid,
-                                          'time': ptime,
-                                          'site': this_site})
-                    if not pid and this_pid >= my_pid:
-                        my_pid = this_pid+1 # next unused process id
-
-            if not pid:
-                pid = my_pid
-            self.checktime = time.time()
-            processes.append({'pid': pid,
-                              'time': self.checktime,
-                              'site': mysite})
-            processes.sort(key=lambda p:(p['pid'], p['site']))
-            try:
-                f = open(self.ctrlfilename, 'w')
-                for p in processes:
-                    f.write("%(pid)s %(time)s %(site)s\n" % p)
-            except IOError:
-                pass
-            f.close()
-            self.process_multiplicity = count
+            self.mysite = str(pywikibot.getSite())
+            pid = _getBuckets().register()
             if self.verbosedelay or pywikibot.verbose:
-                pywikibot.output(
-                    u"Found %(count)s %(mysite)s processes running, including this one."
-                    % locals())
+                pywikibot.output(u"Checking multiplicity: pid = %s" % pid)
         finally:
             self.lock.release()
 
@@ -134,7 +285,6 @@ class Throttle(object):
         """Set the nominal delays in seconds. Defaults to config values."""
         self.lock.acquire()
         try:
-            maxdelay = self.maxdelay
             if delay is None:
                 delay = self.mindelay
             if writedelay is None:
@@ -145,142 +295,127 @@ class Throttle(object):
             self.delay = delay
             self.writedelay = min(max(self.mindelay, writedelay),
                                   self.maxdelay)
-            # Start the delay count now, not at the next check
-            self.last_read = self.last_write = time.time()
         finally:
             self.lock.release()
 
     def getDelay(self, write=False):
-        """Return the actual delay, accounting for multiple processes.
+        """Return the nominal delay between two reads or writes."""
+        if write:
+            return self.writedelay
+        else:
+            return self.delay
 
-        This value is the maximum wait between reads/writes, not taking
-        account of how much time has elapsed since the last access.
+    def _host(self, site):
+        if site is None:
+            site = pywikibot.getSite()
+        return site.hostname()
 
+    def _bucket(self, write, requestsize, now):
         """
+        Return a function which takes the tokens for a request from a
+        bucket record and returns the time to wait before the request.
+        """
+        delay = self.getDelay(write)
+        offset = write and 2 or 0
         if write:
-            thisdelay = self.writedelay
+            capacity = 1.0
         else:
-            thisdelay = self.delay
-        if self.multiplydelay: # We're checking for multiple processes
-            if time.time() > self.checktime + self.checkdelay:
-                self.checkMultiplicity()
-            if thisdelay < (self.mindelay * self.next_multiplicity):
-                thisdelay = self.mindelay * self.next_multiplicity
-            elif thisdelay > self.maxdelay:
-                thisdelay = self.maxdelay
-            thisdelay *= self.process_multiplicity
-        return thisdelay
-
-    def waittime(self, write=False):
+            capacity = max(1.0, config.throttle_burst)
+        # Add "one delay" for each factor of two in the size of the
+        # request. Getting 64 pages at once costs 6 tokens, but never more
+        # than maxdelay seconds.
+        cost = math.log(1 + requestsize) / math.log(2.0)
+        if delay > 0:
+            cost = min(cost, self.maxdelay / float(delay))
+
+        def take(record):
+            wait = record[4] - now
+            if delay > 0:
+                tokens = record[offset] + (now - record[offset + 1]) / delay
+                tokens = min(tokens, capacity)
+                wait = max(wait, (1.0 - tokens) * delay)
+                record[offset] = tokens - cost
+                record[offset + 1] = now
+            return max(wait, 0.0)
+        return take
+
+    def waittime(self, write=False, site=None):
         """Return waiting time in seconds if a query would be made right now"""
-        # Take the previous requestsize in account calculating the desired
-        # delay this time
-        thisdelay = self.getDelay(write=write)
-        now = time.time()
-        if write:
-            ago = now - self.last_write
-        else:
-            ago = now - self.last_read
-        if ago < thisdelay:
-            delta = thisdelay - ago
-            return delta
-        else:
-            return 0.0
+        take = self._bucket(write, 0, time.time())
+        return _getBuckets().update(self._host(site), take)
 
     def drop(self):
         """Remove me from the list of running bot processes."""
-        # drop all throttles with this process's pid, regardless of site
-        self.checktime = 0
-        processes = []
-        try:
-            f = open(self.ctrlfilename, 'r')
-        except IOError:
-            return
-        else:
-            now = time.time()
-            for line in f.readlines():
-                try:
-                    line = line.split(' ')
-                    this_pid = int(line[0])
-                    ptime = int(line[1].split('.')[0])
-                    this_site = line[2].rstrip()
-                except (IndexError,ValueError):
-                    continue    # Sometimes the file gets corrupted
-                                # ignore that line
-                if now - ptime <= self.releasepid \
-                   and this_pid != pid:
-                    processes.append({'pid': this_pid,
-                                      'time': ptime,
-                                      'site': this_site})
-        processes.sort(key=lambda p:p['pid'])
-        try:
-            f = open(self.ctrlfilename, 'w')
-            for p in processes:
-                f.write("%(pid)s %(time)s %(site)s\n" % p)
-        except IOError:
-            pass
-        f.close()
-
-    def __call__(self, requestsize=1, write=False):
+        if pid:
+            _getBuckets().drop(pid)
+
+    def __call__(self, requestsize=1, write=False, site=None):
         """Block the calling program if the throttle time has not expired.
 
         Parameter requestsize is the number of Pages to be read/written;
-        multiply delay time by an appropriate factor.
-
-        Because this seizes the throttle lock, it will prevent any other
-        thread from writing to the same site the script started with
-        until the wait expires.
+        multiply delay time by an appropriate factor. site is the Site the
+        request goes to; default: the default Site.
 
+        Every request takes its place in the bucket before it waits, so
+        threads accessing the same host are spaced out, while requests to
+        other hosts go on.
         """
+        write = write or self.write
+        host = self._host(site)
+        take = self._bucket(write, requestsize, time.time())
+        wait = _getBuckets().update(host, take)
         self.lock.acquire()
         try:
-            wait = self.waittime(write=write or self.write)
-            # Calculate the multiplicity of the next delay based on how
-            # big the request is that is being posted now.
-            # We want to add "one delay" for each factor of two in the
-            # size of the request. Getting 64 pages at once allows 6 times
-            # the delay time for the server.
-            self.next_multiplicity = math.log(1+requestsize)/math.log(2.0)
-            # Announce the delay if it exceeds a preset limit
+            stats = self.stats.setdefault(host, [0, 0, 0.0])
+            stats[0] += 1
             if wait > 0:
-                if wait > config.noisysleep or pywikibot.verbose:
-                    pywikibot.output(
-                        u"Sleeping for %(wait).1f seconds, %(now)s"
-                        % {'wait': wait,
-                           'now' : time.strftime("%Y-%m-%d %H:%M:%S",
-                                                 time.localtime())
-                        } )
-                time.sleep(wait)
-            if write or self.write:
-                self.last_write = time.time()
-            else:
-                self.last_read = time.time()
+                stats[1] += 1
+                stats[2] += wait
+            self.lastwait = wait
         finally:
             self.lock.release()
+        # Announce the delay if it exceeds a preset limit
+        if wait > 0:
+            self._sleep(wait, pywikibot.verbose)
 
-    def lag(self, lagtime):
-        """Seize the throttle lock due to server lag.
+    def _sleep(self, wait, verbose=False):
+        if wait > config.noisysleep or verbose:
+            pywikibot.output(
+                u"Sleeping for %(wait).1f seconds, %(now)s"
+                % {'wait': wait,
+                   'now' : time.strftime("%Y-%m-%d %H:%M:%S",
+                                         time.localtime())
+                } )
+        time.sleep(wait)
 
-        This will prevent any thread from accessing this site.
+    def backoff(self, seconds, site=None):
+        """Block all access to the host of site for some seconds.
+
+        The host is blocked for the threads and processes using it, e.g.
+        because the server asked to retry after some time. Also waits
+        for the time in the calling thread.
 
         """
-        started = time.time()
-        self.lock.acquire()
-        try:
-            # start at 1/2 the current server lag time
-            # wait at least 5 seconds but not more than 120 seconds
-            delay = min(max(5, lagtime//2), 120)
-            # account for any time we waited while acquiring the lock
-            wait = delay - (time.time() - started)
-            if wait > 0:
-                if wait > config.noisysleep:
-                    pywikibot.output(
-                        u"Sleeping for %(wait).1f seconds, %(now)s"
-                        % {'wait': wait,
-                           'now': time.strftime("%Y-%m-%d %H:%M:%S",
-                                                time.localtime())
-                        } )
-                time.sleep(wait)
-        finally:
-            self.lock.release()
+        until = time.time() + seconds
+
+        def block(record):
+            record[4] = max(record[4], until)
+        _getBuckets().update(self._host(site), block)
+        self._sleep(seconds)
+
+    def lag(self, lagtime, site=None):
+        """Block access to the host due to server lag.
+
+        This will prevent any thread or process from accessing this site.
+
+        """
+        # start at 1/2 the current server lag time
+        # wait at least 5 seconds but not more than 120 seconds
+        self.backoff(min(max(5, lagtime // 2), 120), site)
 
+    def statistics(self):
+        """Return a summary of self.stats"""
+        return u'\n'.join([u'%s: %i requests, %i waited %.1f seconds'
+                           % (host, requests, waits, waited)
+                           for host, (requests, waits, waited)
+                           in sorted(self.stats.items())])
@@ -167,6 +167,193 @@ class ThreadList(list):
         thd.start()
 
 
+class LRUCache(object):
+    """A dictionary of at most maxsize items, which drops the least recently
+    used item when a new one is added to a full cache.
+
+    hits and misses count the successful and failed lookups by get().
+
+    >>> cache = LRUCache(2)
+    >>> cache.put('a', 1)
+    >>> cache.put('b', 2)
+    >>> print cache.get('a')
+    1
+    >>> cache.put('c', 3)
+    >>> print cache.get('b')
+    None
+    >>> print cache.hits, cache.misses
+    1 1
+
+    """
+    # the fields of a link in the list from the oldest to the newest item
+    PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        """Drop all items."""
+        self._links = {}
+        # the root of the circular list; root[NEXT] is the oldest item
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def __len__(self):
+        return len(self._links)
+
+    def get(self, key, default=None):
+        """Return the value of key and make it the newest item."""
+        self.lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            prev, next = link[0], link[1]
+            prev[1] = next
+            next[0] = prev
+            root = self._root
+            last = root[0]
+            last[1] = root[0] = link
+            link[0] = last
+            link[1] = root
+            return link[3]
+        finally:
+            self.lock.release()
+
+    def put(self, key, value):
+        """Add or replace the item key as the newest item."""
+        self.lock.acquire()
+        try:
+            link = self._links.pop(key, None)
+            if link is not None:
+                link[0][1] = link[1]
+                link[1][0] = link[0]
+            elif len(self._links) >= self.maxsize:
+                oldest = self._root[1]
+                oldest[0][1] = oldest[1]
+                oldest[1][0] = oldest[0]
+                del self._links[oldest[2]]
+            root = self._root
+            last = root[0]
+            link = [last, root, key, value]
+            self._links[key] = last[1] = root[0] = link
+        finally:
+            self.lock.release()
+
+    def statistics(self):
+        """Return a line with the size and hit rate of the cache."""
+        lookups = self.hits + self.misses
+        return u'%i of %i items, %i lookups, %.1f%% hits' % (
+            len(self), self.maxsize, lookups,
+            lookups and 100.0 * self.hits / lookups)
+
+
+class MultiMatcher(object):
+    """Find all occurrences of many words in a text in a single pass.
+
+    The words are compiled into an Aho-Corasick automaton, so a search takes
+    time linear in the length of the text however many words there are.
+    The automaton is (re)built on the first search after words were added.
+
+    >>> matcher = MultiMatcher(['he', 'she', 'his', 'hers'])
+    >>> print list(matcher.finditer('ushers'))
+    [(1, 4, 'she'), (2, 4, 'he'), (2, 6, 'hers')]
+    >>> print matcher.search('Ushers')
+    (1, 4, 'she')
+    >>> print MultiMatcher(['SHE'], ignoreCase=True).search('ushers')
+    (1, 4, 'SHE')
+    >>> print matcher.search('history')
+    (0, 3, 'his')
+    >>> print matcher.search('hi')
+    None
+
+    """
+    def __init__(self, words=(), ignoreCase=False):
+        self.ignoreCase = ignoreCase
+        self._words = {}
+        self._automaton = None
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return len(self._words)
+
+    def add(self, word):
+        """Add word to the words searched for. Empty words are ignored."""
+        key = self.ignoreCase and word.lower() or word
+        if key and key not in self._words:
+            self._words[key] = word
+            self._automaton = None
+
+    def _build(self):
+        # the trie of the words: goto[state] maps a character to the next
+        # state, out[state] lists the (length, word) ending in that state
+        goto = [{}]
+        out = [()]
+        for key, word in self._words.iteritems():
+            state = 0
+            for char in key:
+                next = goto[state].get(char)
+                if next is None:
+                    next = goto[state][char] = len(goto)
+                    goto.append({})
+                    out.append(())
+                state = next
+            out[state] = ((len(key), word),)
+        # fail[state] is the state of the longest proper suffix of state's
+        # path which is also in the trie; states are visited breadth first
+        # so that a suffix is always complete before it is used
+        fail = [0] * len(goto)
+        queue = goto[0].values()
+        index = 0
+        while index < len(queue):
+            state = queue[index]
+            index += 1
+            for char, next in goto[state].iteritems():
+                queue.append(next)
+                suffix = fail[state]
+                while suffix and char not in goto[suffix]:
+                    suffix = fail[suffix]
+                suffix = fail[next] = goto[suffix].get(char, 0)
+                out[next] = out[next] + out[suffix]
+        self._automaton = goto, fail, out
+        return self._automaton
+
+    def finditer(self, text):
+        """Yield (start, end, word) for every occurrence of a word in text,
+        including overlapping ones, ordered by end and longest first.
+
+        """
+        goto, fail, out = self._automaton or self._build()
+        if self.ignoreCase:
+            text = text.lower()
+        state = 0
+        for end, char in enumerate(text):
+            next = goto[state].get(char)
+            while next is None and state:
+                state = fail[state]
+                next = goto[state].get(char)
+            state = next or 0
+            if out[state]:
+                for length, word in out[state]:
+                    yield end + 1 - length, end + 1, word
+
+    def search(self, text):
+        """Return (start, end, word) for the first word ending in text, or
+        None if text contains none of the words.
+
+        """
+        for match in self.finditer(text):
+            return match
+        return None
+
+
 if __name__ == "__main__":
     def _test():
         import doctest
@@ -25,6 +25,8 @@ This module allow you to use the API in a simple and easy way.
 __version__ = '$Id: query.py 11103 2013-02-22 16:14:56Z amir $'
 #
 
+import sys
+import threading
 import time
 import wikipedia as pywikibot
 import config
@@ -186,6 +188,194 @@ def GetData(params, site=None, useAPI=True, retryCount=config.maxretries,
                 pywikibot.debugDump('ApiGetDataParse', site, str(error) + '\n%s\n%s' % (site.hostname(), path), jsontext)
     raise lastError
 
+class QueryIterator(object):
+    """Iterate over the results of an API query, following its
+    continuations.
+
+    params are the parameters of the query, as for GetData(); they are not
+    changed. If module is the name of a list (e.g. 'allpages'), the items of
+    the list are yielded; if it is None, the responses are yielded as they
+    are. For queries with a generator and properties, the properties are
+    continued first, then the generator.
+
+    If limitParam is the name of the limit parameter of the module (e.g.
+    'aplimit'), every request asks for at most requestLimit items (by
+    default config.special_page_limit, or 'max' for the highest limit the
+    user may use) and not more than needed for limit items in total. The
+    limits which the wiki returns for 'max' are used for later requests.
+
+    If prefetch is True (config.api_prefetch by default), the next
+    continuation is requested in a background thread while the caller uses
+    the items of the current one. If throttle is True, the get throttle is
+    used before every request. Errors and, if raiseWarnings is True,
+    warnings of the wiki raise a RuntimeError.
+
+    Example:
+
+        for page in QueryIterator(site, {'action': 'query',
+                                         'list': 'allpages'},
+                                  'allpages', 'aplimit', limit=1000):
+            print page['title']
+
+    """
+    def __init__(self, site, params, module=None, limitParam=None,
+                 limit=None, requestLimit=None, prefetch=None,
+                 throttle=False, raiseWarnings=False):
+        self.site = site
+        self.params = dict(params)
+        self.module = module
+        self.limitParam = limitParam
+        self.limit = limit
+        if requestLimit is None and limitParam:
+            requestLimit = self.params.get(limitParam,
+                                           config.special_page_limit)
+        self.requestLimit = requestLimit
+        if prefetch is None:
+            prefetch = config.api_prefetch
+        self.prefetch = prefetch
+        self.throttle = throttle
+        self.raiseWarnings = raiseWarnings
+        # the highest limit, as returned by the wiki for 'max'
+        self.maxLimit = None
+        self.requests = 0
+        # the continuation parameters of properties, see _continue()
+        self._propertyContinue = []
+
+    def _setLimit(self, params, count):
+        if not self.limitParam:
+            return
+        limit = self.requestLimit
+        if limit == 'max' and self.maxLimit is not None:
+            limit = self.maxLimit
+        if self.limit is not None:
+            if limit == 'max':
+                # the wiki has not told yet how many items 'max' is
+                if self.limit - count < 500:
+                    limit = self.limit - count
+            else:
+                limit = min(int(limit), self.limit - count)
+        params[self.limitParam] = limit
+
+    def _request(self, params):
+        if self.throttle:
+            pywikibot.get_throttle(site=self.site)
+        self.requests += 1
+        # GetData() changes the parameters
+        data = GetData(dict(params), self.site)
+        if 'error' in data:
+            raise RuntimeError("API query error: %s" % data['error'])
+        if 'warnings' in data:
+            if self.raiseWarnings:
+                raise RuntimeError("API query warning: %s" % data['warnings'])
+            elif pywikibot.verbose:
+                pywikibot.output(u'API query warning: %s' % data['warnings'])
+        if 'limits' in data and self.module in data['limits']:
+            self.maxLimit = int(data['limits'][self.module])
+        return data
+
+    def _continue(self, params, data):
+        """Return the parameters of the next request, or None if the query
+        is complete.
+
+        """
+        if 'query-continue' not in data:
+            return None
+        queryContinue = data['query-continue']
+        params = dict(params)
+        generator = params.get('generator')
+        # the continuations of the properties of the last response are
+        # replaced by the new ones
+        for key in self._propertyContinue:
+            params.pop(key, None)
+        self._propertyContinue = []
+        modules = [module for module in queryContinue if module != generator]
+        if not generator or not modules:
+            modules = queryContinue.keys()
+        for module in modules:
+            params.update(queryContinue[module])
+            if generator and module != generator:
+                self._propertyContinue.extend(queryContinue[module].keys())
+        return params
+
+    def _items(self, data):
+        if self.module is None:
+            return [data]
+        try:
+            items = data['query'][self.module]
+        except (KeyError, TypeError):
+            if data.get('query') == []:
+                # MediaWiki returns an empty list instead of an empty query
+                return []
+            raise RuntimeError("API query error, no %s found: %s"
+                               % (self.module, data))
+        if isinstance(items, dict):
+            items = items.values()
+        return items
+
+    def __iter__(self):
+        self._propertyContinue = []
+        params = dict(self.params)
+        self._setLimit(params, 0)
+        data = self._request(params)
+        count = 0
+        fetcher = None
+        try:
+            while True:
+                items = self._items(data)
+                if self.limit is not None and self.module is not None:
+                    items = items[:self.limit - count]
+                params = self._continue(params, data)
+                if params is not None:
+                    if self.limit is not None and \
+                       count + len(items) >= self.limit:
+                        params = None
+                    else:
+                        self._setLimit(params, count + len(items))
+                if params is not None and self.prefetch:
+                    fetcher = _Fetcher(self, params)
+                for item in items:
+                    count += 1
+                    yield item
+                if params is None:
+                    return
+                if fetcher is None:
+                    data = self._request(params)
+                else:
+                    data = fetcher.result()
+                    fetcher = None
+        finally:
+            if fetcher is not None:
+                # the caller does not need the next continuation anymore
+                fetcher.discard()
+
+
+class _Fetcher(threading.Thread):
+    """Request the next continuation of a QueryIterator."""
+    def __init__(self, iterator, params):
+        threading.Thread.__init__(self, name='QueryIterator')
+        self.setDaemon(True)
+        self.iterator = iterator
+        self.params = params
+        self.data = None
+        self.excInfo = None
+        self.start()
+
+    def run(self):
+        try:
+            self.data = self.iterator._request(self.params)
+        except:
+            self.excInfo = sys.exc_info()
+
+    def result(self):
+        self.join()
+        if self.excInfo is not None:
+            raise self.excInfo[0], self.excInfo[1], self.excInfo[2]
+        return self.data
+
+    def discard(self):
+        self.excInfo = None
+        self.data = None
+
 def GetInterwikies(site, titles, extraParams = None ):
     """ Usage example: data = GetInterwikies('ru','user:yurik')
     titles may be either ane title (as a string), or a list of strings
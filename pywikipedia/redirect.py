@@ -35,6 +35,9 @@ and arguments can be:
                is treated with -api, with -xml all namespaces are treated,
                Works only with an XML dump, or the API interface.
 
+-xmlprocesses:n With -xml, read the XML dump with n worker processes.
+               Defaults to config.xml_processes.
+
 -offset:n      With -moves, the number of hours ago to start scanning moved
                pages. With -xml, the number of the redirect to restart with
                (see progress). Otherwise, ignored.
@@ -69,12 +72,79 @@ import query
 import xmlreader
 
 
+class DumpRedirectExtractor(object):
+    """
+    Finds out where a page of an XML dump redirects to.
+
+    Calling it with an XmlEntry returns None if the page is not in one of
+    the namespaces, else a tuple (title, source, target): the title with
+    underscores, and the normalized redirect name and target, which are
+    None if the page is not a redirect to this wiki. It is picklable, so it
+    can be used with xmlreader.XmlDumpScanner.
+    """
+    def __init__(self, site, namespaces=[]):
+        self.code = site.lang
+        self.fam = site.family.name
+        self.namespaces = namespaces
+        self.redirR = site.redirectRegex()
+
+    def __call__(self, entry):
+        site = pywikibot.getSite(self.code, self.fam)
+        if len(self.namespaces) > 0:
+            if pywikibot.Page(site, entry.title).namespace() \
+                    not in self.namespaces:
+                return None
+        title = entry.title.replace(' ', '_')
+
+        m = self.redirR.match(entry.text)
+        if not m:
+            return title, None, None
+        target = m.group(1)
+        # There might be redirects to another wiki. Ignore these.
+        for code in site.family.iwkeys:
+            if target.startswith('%s:' % code) \
+                    or target.startswith(':%s:' % code):
+                if code == site.language():
+                # link to our wiki, but with the lang prefix
+                    target = target[(len(code)+1):]
+                    if target.startswith(':'):
+                        target = target[1:]
+                else:
+                    pywikibot.output(
+                        u'NOTE: Ignoring %s which is a redirect to %s:'
+                        % (entry.title, code))
+                    target = None
+                    break
+        # if the redirect does not link to another wiki
+        if not target:
+            return title, None, None
+        source = entry.title.replace(' ', '_')
+        target = target.replace(' ', '_')
+        # remove leading and trailing whitespace
+        target = target.strip('_')
+        # capitalize the first letter
+        if not pywikibot.getSite().nocapitalize:
+            source = source[:1].upper() + source[1:]
+            target = target[:1].upper() + target[1:]
+        if '#' in target:
+            target = target[:target.index('#')].rstrip("_")
+        if '|' in target:
+            pywikibot.output(
+                u'HINT: %s is a redirect with a pipelink.'
+                % entry.title)
+            target = target[:target.index('|')].rstrip("_")
+        if not target: # in case preceding steps left nothing
+            return title, None, None
+        return title, source, target
+
+
 class RedirectGenerator:
     def __init__(self, xmlFilename=None, namespaces=[], offset=-1,
                  use_move_log=False, use_api=False, start=None, until=None,
-                 number=None):
+                 number=None, xmlProcesses=1):
         self.site = pywikibot.getSite()
         self.xmlFilename = xmlFilename
+        self.xmlProcesses = xmlProcesses
         self.namespaces = namespaces
         if use_api and self.namespaces == []:
             self.namespaces = [ 0 ]
@@ -100,61 +170,33 @@ class RedirectGenerator:
         '''
         xmlFilename = self.xmlFilename
         redict = {}
-        # open xml dump and read page titles out of it
-        dump = xmlreader.XmlDump(xmlFilename)
-        redirR = self.site.redirectRegex()
+        extractor = DumpRedirectExtractor(self.site, self.namespaces)
+        # the extractor only needs these, don't read the other fields
+        fields = ('title', 'text')
+        if self.xmlProcesses > 1:
+            # pages outside of self.namespaces are dropped by the scanner
+            results = xmlreader.XmlDumpScanner(xmlFilename, extractor,
+                                               self.xmlProcesses,
+                                               fields=fields)
+        else:
+            # open xml dump and read page titles out of it
+            dump = xmlreader.XmlDump(xmlFilename, fields=fields)
+            results = (extractor(entry) for entry in dump.parse())
         readPagesCount = 0
         if alsoGetPageTitles:
             pageTitles = set()
-        for entry in dump.parse():
+        for result in results:
             readPagesCount += 1
             # always print status message after 10000 pages
             if readPagesCount % 10000 == 0:
                 pywikibot.output(u'%i pages read...' % readPagesCount)
-            if len(self.namespaces) > 0:
-                if pywikibot.Page(self.site, entry.title).namespace() \
-                        not in self.namespaces:
-                    continue
+            if result is None:
+                continue
+            title, source, target = result
             if alsoGetPageTitles:
-                pageTitles.add(entry.title.replace(' ', '_'))
-
-            m = redirR.match(entry.text)
-            if m:
-                target = m.group(1)
-                # There might be redirects to another wiki. Ignore these.
-                for code in self.site.family.iwkeys:
-                    if target.startswith('%s:' % code) \
-                            or target.startswith(':%s:' % code):
-                        if code == self.site.language():
-                        # link to our wiki, but with the lang prefix
-                            target = target[(len(code)+1):]
-                            if target.startswith(':'):
-                                target = target[1:]
-                        else:
-                            pywikibot.output(
-                                u'NOTE: Ignoring %s which is a redirect to %s:'
-                                % (entry.title, code))
-                            target = None
-                            break
-                # if the redirect does not link to another wiki
-                if target:
-                    source = entry.title.replace(' ', '_')
-                    target = target.replace(' ', '_')
-                    # remove leading and trailing whitespace
-                    target = target.strip('_')
-                    # capitalize the first letter
-                    if not pywikibot.getSite().nocapitalize:
-                        source = source[:1].upper() + source[1:]
-                        target = target[:1].upper() + target[1:]
-                    if '#' in target:
-                        target = target[:target.index('#')].rstrip("_")
-                    if '|' in target:
-                        pywikibot.output(
-                            u'HINT: %s is a redirect with a pipelink.'
-                            % entry.title)
-                        target = target[:target.index('|')].rstrip("_")
-                    if target: # in case preceding steps left nothing
-                        redict[source] = target
+                pageTitles.add(title)
+            if target:
+                redict[source] = target
         if alsoGetPageTitles:
             return redict, pageTitles
         else:
@@ -176,22 +218,12 @@ class RedirectGenerator:
             params['apnamespace'] = ns
             if self.api_start:
                 params['apfrom'] = self.api_start
-            done = False
-            while not done:
-                pywikibot.output(u'\nRetrieving pages...', newline=False)
-                data = query.GetData(params, self.site)
-                if 'error' in data:
-                    raise RuntimeError("API query error: %s" % data['error'])
-                if "limits" in data: # process aplimit = max
-                    params['aplimit'] = int(data['limits']['allpages'])
-                for x in data['query']['allpages']:
-                    done = self.api_until and x['title'] >= self.api_until
-                    if done: break
-                    yield x['pageid']
-                if not done and 'query-continue' in data:
-                    params.update(data['query-continue']['allpages'])
-                else:
+            pywikibot.output(u'\nRetrieving pages...', newline=False)
+            for x in query.QueryIterator(self.site, params, 'allpages',
+                                         'aplimit'):
+                if self.api_until and x['title'] >= self.api_until:
                     break
+                yield x['pageid']
 
     def _next_redirect_group(self):
         """
@@ -725,6 +757,8 @@ def main(*args):
     # maintenance special page from the live wiki, or the filename of a
     # local XML dump file)
     xmlFilename = None
+    # number of processes to read the XML dump with
+    xmlProcesses = config.xml_processes
     # Which namespace should be processed when using a XML dump
     # default to -1 which means all namespaces will be processed
     namespaces = []
@@ -746,6 +780,8 @@ def main(*args):
             action = 'both'
         elif arg == '-api':
             api = True
+        elif arg.startswith('-xmlprocesses:'):
+            xmlProcesses = int(arg[14:])
         elif arg.startswith('-xml'):
             if len(arg) == 4:
                 xmlFilename = i18n.input('pywikibot-enter-xml-filename')
@@ -791,7 +827,7 @@ def main(*args):
         pywikibot.showHelp('redirect')
     else:
         gen = RedirectGenerator(xmlFilename, namespaces, offset, moved_pages,
-                                api, start, until, number)
+                                api, start, until, number, xmlProcesses)
         bot = RedirectRobot(action, gen, always, number)
         bot.run()
 
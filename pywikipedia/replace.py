@@ -32,6 +32,10 @@ Furthermore, the following command line parameters are supported:
                   before the one specified (may also be given as
                   -xmlstart:Article).
 
+-xmlprocesses     (Only works with -xml) Search the XML dump with this many
+                  worker processes, e.g. -xmlprocesses:4. Defaults to
+                  config.xml_processes.
+
 -save             Saves the titles of the articles to a file instead of
                   modifying the articles. This way you may collect titles to
                   work on in automatic mode, and process them later with
@@ -169,6 +173,7 @@ __version__='$Id: replace.py 10576 2012-10-14 17:16:30Z xqt $'
 
 import sys, re, time, codecs
 import wikipedia as pywikibot
+import config
 import pagegenerators
 import editarticle
 from pywikibot import i18n
@@ -185,6 +190,63 @@ docuReplacements = {
 }
 
 
+class XmlDumpReplaceMatcher(object):
+    """
+    Checks whether an XmlEntry contains text to replace.
+
+    Calling it with an entry returns the entry's title if the replacements
+    change its text, else None. It is picklable as long as the replacements
+    are, so it can be used with xmlreader.XmlDumpScanner.
+    Arguments:
+        * replacements - A list of 2-tuples of original text (as a
+                         compiled regular expression) and replacement
+                         text (as a string).
+        * exceptions   - A dictionary which defines when to ignore an
+                         occurence. See docu of the ReplaceRobot
+                         constructor below.
+        * site         - The site the dump belongs to.
+
+    """
+    def __init__(self, replacements, exceptions, site):
+        self.exceptions = exceptions
+        excsInside = []
+        if "inside-tags" in self.exceptions:
+            excsInside += self.exceptions['inside-tags']
+        if "inside" in self.exceptions:
+            excsInside += self.exceptions['inside']
+        self.plans = [pywikibot.ReplacePlan(old, new, excsInside, site=site)
+                      for old, new in replacements]
+
+    def __call__(self, entry):
+        if not self.isTitleExcepted(entry.title) \
+                and not self.isTextExcepted(entry.text):
+            new_text = entry.text
+            for plan in self.plans:
+                new_text = plan.apply(new_text)
+            if new_text != entry.text:
+                return entry.title
+        return None
+
+    def isTitleExcepted(self, title):
+        if "title" in self.exceptions:
+            for exc in self.exceptions['title']:
+                if exc.search(title):
+                    return True
+        if "require-title" in self.exceptions:
+            for req in self.exceptions['require-title']:
+                if not req.search(title): # if not all requirements are met:
+                    return True
+
+        return False
+
+    def isTextExcepted(self, text):
+        if "text-contains" in self.exceptions:
+            for exc in self.exceptions['text-contains']:
+                if exc.search(text):
+                    return True
+        return False
+
+
 class XmlDumpReplacePageGenerator:
     """
     Iterator that will yield Pages that might contain text to replace.
@@ -199,40 +261,52 @@ class XmlDumpReplacePageGenerator:
         * exceptions   - A dictionary which defines when to ignore an
                          occurence. See docu of the ReplaceRobot
                          constructor below.
+        * processes    - If greater than 1, the dump is searched by that
+                         many worker processes (see xmlreader.XmlDumpScanner).
 
     """
-    def __init__(self, xmlFilename, xmlStart, replacements, exceptions):
+    def __init__(self, xmlFilename, xmlStart, replacements, exceptions,
+                 processes=1):
         self.xmlFilename = xmlFilename
         self.replacements = replacements
         self.exceptions = exceptions
         self.xmlStart = xmlStart
         self.skipping = bool(xmlStart)
+        self.processes = processes
 
-        self.excsInside = []
-        if "inside-tags" in self.exceptions:
-            self.excsInside += self.exceptions['inside-tags']
-        if "inside" in self.exceptions:
-            self.excsInside += self.exceptions['inside']
         import xmlreader
         self.site = pywikibot.getSite()
-        dump = xmlreader.XmlDump(self.xmlFilename)
-        self.parser = dump.parse()
+        self.matcher = XmlDumpReplaceMatcher(self.replacements,
+                                             self.exceptions, self.site)
+        if self.processes > 1:
+            self.scanner = xmlreader.XmlDumpScanner(
+                self.xmlFilename, self.matcher, self.processes,
+                start=self.xmlStart)
+        else:
+            # with the index of a multistream dump, XmlDump seeks to xmlStart
+            dump = xmlreader.XmlDump(self.xmlFilename, start=self.xmlStart)
+            self.parser = dump.parse()
 
     def __iter__(self):
+        if self.processes > 1:
+            try:
+                for title in self.scanner:
+                    yield pywikibot.Page(self.site, title)
+            except KeyboardInterrupt:
+                title = self.scanner.resumeTitle()
+                if title is not None:
+                    pywikibot.output(
+                        u'To resume, use "-xmlstart:%s" on the command line.'
+                        % title)
+            return
         try:
             for entry in self.parser:
                 if self.skipping:
                     if entry.title != self.xmlStart:
                         continue
                     self.skipping = False
-                if not self.isTitleExcepted(entry.title) \
-                        and not self.isTextExcepted(entry.text):
-                    new_text = entry.text
-                    for old, new in self.replacements:
-                        new_text = pywikibot.replaceExcept(
-                            new_text, old, new, self.excsInside, self.site)
-                    if new_text != entry.text:
-                        yield pywikibot.Page(self.site, entry.title)
+                if self.matcher(entry) is not None:
+                    yield pywikibot.Page(self.site, entry.title)
         except KeyboardInterrupt:
             try:
                 if not self.skipping:
@@ -243,23 +317,10 @@ class XmlDumpReplacePageGenerator:
                 pass
 
     def isTitleExcepted(self, title):
-        if "title" in self.exceptions:
-            for exc in self.exceptions['title']:
-                if exc.search(title):
-                    return True
-        if "require-title" in self.exceptions:
-            for req in self.exceptions['require-title']:
-                if not req.search(title): # if not all requirements are met:
-                    return True
-
-        return False
+        return self.matcher.isTitleExcepted(title)
 
     def isTextExcepted(self, text):
-        if "text-contains" in self.exceptions:
-            for exc in self.exceptions['text-contains']:
-                if exc.search(text):
-                    return True
-        return False
+        return self.matcher.isTextExcepted(text)
 
 
 class ReplaceRobot:
@@ -339,6 +400,8 @@ class ReplaceRobot:
         self.editSummary = editSummary
         self.articles = articles
         self.exctitles = exctitles
+        # ReplacePlans for self.replacements, see replacePlans()
+        self._plans = None
 
         # An edit counter to split the file by 100 titles if -save or -savenew
         # is on, and to display the number of edited articles otherwise.
@@ -377,18 +440,28 @@ class ReplaceRobot:
         the given text.
         """
         new_text = original_text
-        exceptions = []
-        if "inside-tags" in self.exceptions:
-            exceptions += self.exceptions['inside-tags']
-        if "inside" in self.exceptions:
-            exceptions += self.exceptions['inside']
-        for old, new in self.replacements:
+        for plan in self.replacePlans():
             if self.sleep is not None:
                 time.sleep(self.sleep)
-            new_text = pywikibot.replaceExcept(new_text, old, new, exceptions,
-                                               allowoverlap=self.allowoverlap)
+            new_text = plan.apply(new_text)
         return new_text
 
+    def replacePlans(self):
+        """
+        Returns the list of ReplacePlans for the replacements, building it
+        on first use so that the exceptions are only resolved once.
+        """
+        if self._plans is None:
+            exceptions = []
+            if "inside-tags" in self.exceptions:
+                exceptions += self.exceptions['inside-tags']
+            if "inside" in self.exceptions:
+                exceptions += self.exceptions['inside']
+            self._plans = [pywikibot.ReplacePlan(old, new, exceptions,
+                                                 allowoverlap=self.allowoverlap)
+                           for old, new in self.replacements]
+        return self._plans
+
     def writeEditCounter(self):
         """ At the end of our work this writes the counter. """
         if self.articles:
@@ -605,6 +678,8 @@ def main(*args):
     # the dump's path, either absolute or relative, which will be used
     # if -xml flag is present
     xmlFilename = None
+    # number of processes to search the XML dump with
+    xmlProcesses = config.xml_processes
     useSql = False
     PageTitles = []
     # will become True when the user presses a ('yes to all') or uses the
@@ -656,6 +731,8 @@ def main(*args):
                     u'Please enter the dumped article to start with:')
             else:
                 xmlStart = arg[10:]
+        elif arg.startswith('-xmlprocesses:'):
+            xmlProcesses = int(arg[14:])
         elif arg.startswith('-xml'):
             if len(arg) == 4:
                 xmlFilename = i18n.input('pywikibot-enter-xml-filename')
@@ -894,7 +971,8 @@ def main(*args):
         except NameError:
             xmlStart = None
         gen = XmlDumpReplacePageGenerator(xmlFilename, xmlStart,
-                                          replacements, exceptions)
+                                          replacements, exceptions,
+                                          xmlProcesses)
     elif useSql:
         whereClause = 'WHERE (%s)' % ' OR '.join(
             ["old_text RLIKE '%s'" % prepareRegexForMySQL(old.pattern)
@@ -5,11 +5,11 @@
 Script to remove links that are being or have been spammed.
 Usage:
 
-spamremove.py spammedsite.com
+spamremove.py spammedsite.com [otherspammedsite.com ...]
 
 It will use Special:Linksearch to find the pages on the wiki that link to
-that site, then for each page make a proposed change consisting of removing
-all the lines where that url occurs. You can choose to:
+these sites, then for each page make a proposed change consisting of removing
+all the lines where one of those urls occurs. You can choose to:
 * accept the changes as proposed
 * edit the page yourself to remove the offending link
 * not change the page in question
@@ -36,6 +36,7 @@ import sys
 import wikipedia as pywikibot
 import pagegenerators
 import editarticle
+from pywikibot.tools import MultiMatcher
 
 def main():
     automatic = False
@@ -56,7 +57,7 @@ def main():
         'vi': u'xóa các liên kết đến website spam %s',
         'zh': u'機器人: 移除廣告黑名單連結 %s',
     }
-    spamSite = ''
+    spamSites = []
     for arg in pywikibot.handleArgs():
         if arg.startswith("-automatic"):
             automatic = True
@@ -66,15 +67,20 @@ def main():
             except ValueError:
                 namespaces.append(arg[len('-namespace:'):])
         else:
-            spamSite = arg
+            spamSites.append(arg)
     if not automatic:
         pywikibot.put_throttle.setDelay(1)
-    if not spamSite:
+    if not spamSites:
         pywikibot.showHelp('spamremove')
         pywikibot.output(u"No spam site specified.")
         sys.exit()
     mysite = pywikibot.getSite()
-    pages = list(set(mysite.linksearch(spamSite)))
+    pages = set()
+    for spamSite in spamSites:
+        pages.update(mysite.linksearch(spamSite))
+    pages = list(pages)
+    # find all the sites in a single pass over the text
+    matcher = MultiMatcher(spamSites)
     if namespaces:
         pages = list(set(pagegenerators.NamespaceFilterPageGenerator(pages,
                                                                      namespaces)))
@@ -84,7 +90,8 @@ def main():
         pywikibot.getall(mysite, pages)
         for p in pages:
             text = p.get()
-            if not spamSite in text:
+            first = matcher.search(text)
+            if not first:
                 continue
             # Show the title of the page we're working on.
             # Highlight the title in purple.
@@ -94,7 +101,7 @@ def main():
             newpage = []
             lastok = ""
             for line in lines:
-                if spamSite in line:
+                if matcher.search(line):
                     if lastok:
                         pywikibot.output(lastok)
                     pywikibot.output('\03{lightred}%s\03{default}' % line)
@@ -115,12 +122,13 @@ def main():
                 continue
             elif answer == "e":
                 editor = editarticle.TextEditor()
-                newtext = editor.edit(text, highlight=spamSite,
-                                      jumpIndex=text.find(spamSite))
+                newtext = editor.edit(text, highlight=first[2],
+                                      jumpIndex=first[0])
             else:
                 newtext = "\n".join(newpage)
             if newtext != text:
-                p.put(newtext, pywikibot.translate(mysite, msg) % spamSite)
+                p.put(newtext, pywikibot.translate(mysite, msg)
+                                   % u', '.join(spamSites))
 
 try:
     main()
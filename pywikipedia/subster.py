@@ -70,7 +70,9 @@ import difflib, traceback
 import BeautifulSoup
 import StringIO, zipfile, csv
 import mailbox, mimetypes, datetime, email.utils
-import openpyxl.reader.excel
+import openpyxl.reader.excel, openpyxl.reader.iter_worksheet
+import openpyxl.reader.workbook, openpyxl.cell
+from xml.etree.cElementTree import iterparse
 import crontab
 import logging
 import ast
@@ -118,6 +120,7 @@ bot_config = {
             'zip':             'False',
             'xlsx':            '',              #
             'ods':             '',              #
+            'rows':            '',              # e.g. '2:100' (xlsx, ods)
             # may be 'hours' have to be added too (e.g. for 'ar')
             'cron':            '',              # DRTRIGON-102
             'verbose':         'True',          # DRTRIGON-132 (else see logs)
@@ -135,6 +138,145 @@ bot_config = {
 debug = []
 #debug.append( 'code' )  # code debugging
 
+# ODF (ods) element and attribute names
+_ODS_TABLE = '{urn:oasis:names:tc:opendocument:xmlns:table:1.0}%s'
+_ODS_TEXT  = '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}%s'
+
+
+def row_range(rows):
+    """Return the first and last row (counted from 1, last may be None for
+       all) of the range rows, e.g. '5' or '2:100' or '2:' or ':100'.
+    """
+    if not rows:
+        return (1, None)
+    if u':' not in rows:
+        rows = u'%s:%s' % (rows, rows)
+    first, last = rows.split(u':', 1)
+    return (int(first or 1), int(last) if last else None)
+
+def _ods_text(elem):
+    # the text of an element like odf.teletype.extractText() gives it
+    result = [elem.text or u'']
+    for child in elem:
+        if child.tag == _ODS_TEXT % 's':
+            result.append(u' ' * int(child.get(_ODS_TEXT % 'c', 1)))
+        elif child.tag == _ODS_TEXT % 'tab':
+            result.append(u'\t')
+        elif child.tag == _ODS_TEXT % 'line-break':
+            result.append(u'\n')
+        else:
+            result.append(_ods_text(child))
+        result.append(child.tail or u'')
+    return u''.join(result)
+
+def ods_rows(ods_file, sheet, first=1, last=None):
+    """Yield the rows first to last (counted from 1) of the table sheet in
+       an ods (Open/Libre Office) file as lists of unicode strings.
+
+       content.xml is parsed incrementally and every row is dropped as soon
+       as it has been read, parsing stops after the last row. Repeated rows
+       and cells are expanded, but not trailing empty ones (by which office
+       applications fill up a table to its maximal size).
+    """
+    table, row = _ODS_TABLE % 'table', _ODS_TABLE % 'table-row'
+    cells = (_ODS_TABLE % 'table-cell', _ODS_TABLE % 'covered-table-cell')
+    archive = zipfile.ZipFile(ods_file)
+    try:
+        parents = []    # the open elements
+        tables  = 0     # the number of open tables (may be nested in cells)
+        found   = False
+        count   = 0     # the number of rows read
+        empty   = 0     # the number of empty rows not yet yielded
+        for event, elem in iterparse(archive.open('content.xml'),
+                                     events=('start', 'end')):
+            if event == 'start':
+                parents.append(elem)
+                if elem.tag == table:
+                    tables += 1
+                    if tables == 1:
+                        found = (elem.get(_ODS_TABLE % 'name') == sheet)
+                continue
+            parents.pop()
+            if elem.tag == table:
+                tables -= 1
+                if found and not tables:
+                    return
+                elem.clear()
+            if elem.tag != row or tables != 1:
+                continue
+            values, pending = [], 0
+            if found:
+                for cell in elem:
+                    if cell.tag not in cells:
+                        continue
+                    n = int(cell.get(_ODS_TABLE % 'number-columns-repeated', 1))
+                    # (whitespace between the paragraphs is no content)
+                    text = u''.join([_ods_text(p) for p in cell])
+                    if text:
+                        values += [u''] * pending + [text] * n
+                        pending = 0
+                    else:
+                        pending += n
+            repeated = int(elem.get(_ODS_TABLE % 'number-rows-repeated', 1))
+            # free the memory used by the row
+            elem.clear()
+            parents[-1].remove(elem)
+            if not found:
+                continue
+            if not values:
+                empty += repeated
+                continue
+            for (n, value) in ((empty, []), (repeated, values)):
+                for i in xrange(max(count + 1, first),
+                                min(count + n, last or (count + n)) + 1):
+                    yield value
+                count += n
+            empty = 0
+            if last and (count >= last):
+                return
+    finally:
+        archive.close()
+
+def xlsx_rows(xlsx_file, sheet, first=1, last=None):
+    """Yield the rows first to last (counted from 1) of the worksheet sheet
+       in an xlsx (EXCEL) file as lists of cell values.
+
+       Only this worksheet is unpacked (not every one like load_workbook()
+       does) and read by openpyxl.reader.iter_worksheet, reading stops after
+       the last row.
+    """
+    iter_worksheet = openpyxl.reader.iter_worksheet
+    archive = zipfile.ZipFile(xlsx_file)
+    try:
+        titles = openpyxl.reader.workbook.read_sheets_titles(
+                   archive.read(openpyxl.reader.excel.ARC_WORKBOOK))
+        codename = 'sheet%d.xml' % (titles.index(sheet) + 1)
+        xml_source = iter_worksheet.unpack_worksheet(
+                       archive, '%s/%s' % (iter_worksheet.PACKAGE_WORKSHEETS,
+                                           codename))
+    finally:
+        archive.close()
+    try:
+        min_col, min_row, max_col, max_row = \
+          iter_worksheet.read_dimension(xml_source=xml_source)
+        first = max(first, min_row)
+        if last is None:
+            last = max_row
+        # get_squared_range() does not include the last column of the range
+        max_col = openpyxl.cell.get_column_letter(
+                    openpyxl.cell.column_index_from_string(max_col) + 1)
+        # the range ends with the last row of the worksheet, since the rows
+        # of a smaller range would be read up to its end anyway
+        rows = iter_worksheet.iter_rows(xlsx_file, codename, xml_source,
+                                        '%s%i:%s%i' % (min_col, first,
+                                                       max_col, max_row))
+        for (i, row) in enumerate(rows):
+            if (first + i) > last:
+                break
+            yield [cell.internal_value for cell in row]
+    finally:
+        xml_source.close()
+
 
 class SubsterBot(basic.AutoBasicBot):
     '''
@@ -409,9 +551,11 @@ class SubsterBot(basic.AutoBasicBot):
             fileno          = 0 if (param['zip'] == True) else (param['zip']-1)
             external_buffer = self.unzip(external_buffer, fileno)
         if param['xlsx']:   # 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            external_buffer = self.xlsx2csv(external_buffer, param['xlsx'])
+            external_buffer = self.xlsx2csv(external_buffer, param['xlsx'],
+                                            param['rows'])
         if param['ods']:    # 'application/vnd.oasis.opendocument.spreadsheet'
-            external_buffer = self.ods2csv(external_buffer, param['ods'])
+            external_buffer = self.ods2csv(external_buffer, param['ods'],
+                                           param['rows'])
 
         if not ast.literal_eval(param['beautifulsoup']):    # DRTRIGON-88
             # 2.) regexp
@@ -669,44 +813,37 @@ class SubsterBot(basic.AutoBasicBot):
 
         return external_buffer
 
-    def xlsx2csv(self, external_buffer, sheet):
+    def xlsx2csv(self, external_buffer, sheet, rows=u''):
         """Convert xlsx (EXCEL) data to csv format.
+           (rows selects the rows to convert, see row_range())
         """
 
-        wb = openpyxl.reader.excel.load_workbook(StringIO.StringIO(external_buffer), use_iterators = True)
-
-        sheet_ranges = wb.get_sheet_by_name(name = sheet)
-
         output = StringIO.StringIO()
         spamWriter = csv.writer(output)
 
-        for row in sheet_ranges.iter_rows(): # it brings a new method: iter_rows()
-            spamWriter.writerow([ cell.internal_value for cell in row ])
+        (first, last) = row_range(rows)
+        for row in xlsx_rows(StringIO.StringIO(external_buffer), sheet,
+                             first, last):
+            spamWriter.writerow([ (v.encode('utf-8') if isinstance(v, unicode) else v)
+                                  for v in row ])
 
         external_buffer = output.getvalue()
         output.close()
 
         return external_buffer
 
-    def ods2csv(self, external_buffer, sheet):
+    def ods2csv(self, external_buffer, sheet, rows=u''):
         """Convert ods (Open/Libre Office) data to csv format.
+           (rows selects the rows to convert, see row_range())
         """
-        # http://www.mail-archive.com/python-list@python.org/msg209447.html
-
-        import odf
-        from odf import opendocument, table, teletype
-
-        doc = odf.opendocument.load(StringIO.StringIO(external_buffer))
 
         output = StringIO.StringIO()
         spamWriter = csv.writer(output)
 
-        for sheet in doc.getElementsByType(odf.table.Table):
-            if not (sheet.getAttribute('name') == sheet):
-                continue
-            for row in sheet.getElementsByType(odf.table.TableRow):
-                spamWriter.writerow([ odf.teletype.extractText(cell).encode('utf-8')
-                                      for cell in row.getElementsByType(odf.table.TableCell) ])
+        (first, last) = row_range(rows)
+        for row in ods_rows(StringIO.StringIO(external_buffer), sheet,
+                            first, last):
+            spamWriter.writerow([ v.encode('utf-8') for v in row ])
 
         external_buffer = output.getvalue()
         output.close()
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Measure how fast date.getAutoFormat() recognizes titles, as interwiki.py
+calls it for every page.
+
+    python tests/manual/date_benchmark.py [lang ...]
+
+For each language (default en, de, fr, ja and ru), 2000 titles generated
+from its date formats and 8000 ordinary titles are recognized. The time
+to build the table of the language is shown separately.
+"""
+#
+# (C) Pywikipedia bot team, 2013
+#
+# Distributed under the terms of the MIT license.
+#
+__version__ = '$Id$'
+#
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import wikipedia as pywikibot
+import date
+
+
+def makeTitles(lang, count=10000):
+    rnd = random.Random(0)
+    dates = []
+    for dictName, dict in date.formats.iteritems():
+        if lang not in dict:
+            continue
+        start, stop = date.formatLimits[dictName][1:]
+        for value in xrange(start, stop, max(1, (stop - start) / 50)):
+            try:
+                dates.append(dict[lang](value))
+            except Exception:
+                pass
+    titles = [rnd.choice(dates) for i in xrange(count / 5)]
+    words = [u'Paris', u'Albert Einstein', u'List of rivers', u'Talk:Foo',
+             u'Category:1990s films', u'Apollo 11', u'The Beatles (album)']
+    titles += [u'%s %i' % (rnd.choice(words), i)
+               for i in xrange(count - len(titles))]
+    rnd.shuffle(titles)
+    return titles
+
+
+def run(lang):
+    titles = makeTitles(lang)
+    start = time.time()
+    date._autoFormatTable(lang)
+    build = time.time() - start
+    start = time.time()
+    found = len([title for title in titles
+                 if date.getAutoFormat(lang, title)[0]])
+    elapsed = time.time() - start
+    print '%-4s table %6.1fms  %6d titles %7.3fs %9.0f titles/s  %d dates' % (
+        lang, build * 1000, len(titles), elapsed, len(titles) / elapsed, found)
+
+
+def main():
+    for lang in sys.argv[1:] or ['en', 'de', 'fr', 'ja', 'ru']:
+        run(lang)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        pywikibot.stopme()
@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Measure how fast _GetAll matches the pages the API returned to the
+requested pages.
+
+    python tests/manual/getall_benchmark.py [number of titles ...]
+
+For every number of titles (default 500, 2000 and 5000), a batch of pages
+on en.wikipedia is requested, some of them with underscores or a lowercase
+first letter so that the API has to normalize them, and a made-up API result
+for them is given to _GetAll. Nothing is read from the wiki.
+"""
+#
+# (C) Pywikipedia bot team, 2013
+#
+# Distributed under the terms of the MIT license.
+#
+__version__ = '$Id$'
+#
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import wikipedia as pywikibot
+
+
+def makeBatch(site, count):
+    """Return the requested pages and the API result for them"""
+    pages = []
+    result = {'pages': {}, 'normalized': []}
+    for i in xrange(count):
+        title = u'Benchmark page %i' % i
+        if i % 3 == 1:
+            requested = u'benchmark page %i' % i
+            result['normalized'].append({'from': requested, 'to': title})
+        elif i % 3 == 2:
+            requested = u'Talk:Benchmark_page_%i' % i
+            title = u'Talk:Benchmark page %i' % i
+        else:
+            requested = title
+        pages.append(pywikibot.Page(site, requested))
+        result['pages'][str(i)] = {
+            'title': title, 'lastrevid': i,
+            'revisions': [{'user': u'Bot', 'timestamp': u'2013-01-01T00:00:00Z',
+                           '*': u'text of %s' % title}],
+            'protection': []}
+    return pages, result
+
+
+def run(site, count):
+    pages, result = makeBatch(site, count)
+    start = time.time()
+    getall = pywikibot._GetAll(site, pages, True, False)
+    getall._normalize(result['normalized'])
+    for data in result['pages'].itervalues():
+        getall.oneDoneApi(data)
+    elapsed = time.time() - start
+    assert all(page._contents == u'text of %s' % page.title()
+               for page in pages)
+    print '%6d titles %8.3fs %9.0f titles/s' % (count, elapsed,
+                                                count / elapsed)
+
+
+def main():
+    site = pywikibot.getSite('en', 'wikipedia')
+    for count in [int(arg) for arg in sys.argv[1:]] or (500, 2000, 5000):
+        run(site, count)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        pywikibot.stopme()
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Measure the time and memory a single-language bot spends on translating
+its messages, with and without the i18n catalogs (see config.i18n_catalogs).
+
+    python tests/manual/i18n_benchmark.py [lang [runs]]
+
+In a new Python process for every run (10 by default), one message of
+each of the largest i18n packages is translated to lang (default de) and
+then translated again 10000 times. The best time and the growth of the
+maximum resident set size while translating are shown. The first run with
+the catalogs builds the catalog files.
+"""
+#
+# (C) Pywikipedia bot team, 2013
+#
+# Distributed under the terms of the MIT license.
+#
+__version__ = '$Id$'
+#
+import os
+import subprocess
+import sys
+
+basedir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+titles = ['interwiki-adding', 'category-adding',
+          'solve_disambiguation-links-removed',
+          'thirdparty-drtrigonbot-sum_disc-summary-head',
+          'category_redirect-comment']
+
+code = '''
+import resource, time
+import config
+config.i18n_catalogs = %(catalogs)r
+import wikipedia
+from pywikibot import i18n
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.time()
+for title in %(titles)r:
+    i18n.twtranslate(%(lang)r, title)
+first = time.time() - start
+start = time.time()
+for i in xrange(10000):
+    i18n.twtranslate(%(lang)r, %(titles)r[i %% %(count)i])
+again = time.time() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+print first, again, rss
+wikipedia.stopme()
+'''
+
+
+def run(lang, catalogs, runs):
+    best = None
+    for i in xrange(runs):
+        output = subprocess.Popen(
+            [sys.executable, '-c', code % {'catalogs': catalogs, 'lang': lang,
+                                           'titles': titles,
+                                           'count': len(titles)}],
+            cwd=basedir, stdout=subprocess.PIPE).communicate()[0]
+        result = map(float, output.split()[-3:])
+        if best is None or result[0] < best[0]:
+            best = result
+    return best
+
+
+def main():
+    lang = sys.argv[1:] and sys.argv[1] or 'de'
+    runs = sys.argv[2:] and int(sys.argv[2]) or 10
+    for catalogs in (False, True):
+        first, again, rss = run(lang, catalogs, runs)
+        print ('%-16s first %6.1fms  10000 more %6.1fms  +%5.0f kB RSS'
+               % (catalogs and 'with catalogs' or 'without catalogs',
+                  first * 1000, again * 1000, rss))
+
+
+if __name__ == '__main__':
+    main()
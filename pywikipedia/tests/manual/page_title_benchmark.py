@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Measure how fast Page objects are created for a category-scale list of
+titles, with and without the title cache and the Page pool.
+
+    python tests/manual/page_title_benchmark.py [titles [distinct titles]]
+
+The list has 100000 titles (by default), chosen at random from 10000
+distinct titles in several namespaces and spellings, as the members of a
+large category and the links found on them would be. Nothing is read from
+the wiki.
+"""
+#
+# (C) Pywikipedia bot team, 2013
+#
+# Distributed under the terms of the MIT license.
+#
+__version__ = '$Id$'
+#
+import os
+import random
+import sys
+import time
+import weakref
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import wikipedia as pywikibot
+from pywikibot.tools import LRUCache
+
+spellings = [u'Member %i', u'member_%i', u'Talk:Member %i',
+             u'Category:Members/%i', u'Member %i#History', u':en:Member %i']
+
+
+def makeTitles(count, distinct):
+    titles = [spellings[i % len(spellings)] % i for i in xrange(distinct)]
+    choice = random.Random(0).choice
+    return [choice(titles) for i in xrange(count)]
+
+
+def run(site, titles, label):
+    start = time.time()
+    pages = [pywikibot.Page(site, title) for title in titles]
+    elapsed = time.time() - start
+    line = '%-12s %8d pages %8.3fs %9.0f pages/s' % (
+        label, len(titles), elapsed, len(titles) / elapsed)
+    if pywikibot._titleCache is not None:
+        line += '  cache: %s' % pywikibot._titleCache.statistics()
+    if pywikibot._pagePool is not None:
+        line += '  %i objects' % len(set(map(id, pages)))
+    print line
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:]]
+    count = args and args[0] or 100000
+    distinct = len(args) > 1 and args[1] or 10000
+    site = pywikibot.getSite('en', 'wikipedia')
+    titles = makeTitles(count, distinct)
+
+    pywikibot._pagePool = None
+    pywikibot._titleCache = None
+    run(site, titles, u'uncached')
+    pywikibot._titleCache = LRUCache(pywikibot.config.page_title_cache_size)
+    run(site, titles, u'cached')
+    pywikibot._titleCache = LRUCache(pywikibot.config.page_title_cache_size)
+    pywikibot._pagePool = weakref.WeakValueDictionary()
+    run(site, titles, u'cached+pool')
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        pywikibot.stopme()
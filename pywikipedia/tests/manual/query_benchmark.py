@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Measure the throughput of Site.allpages() and Category.articles(), which
+load their lists with query.QueryIterator, with and without prefetching the
+next continuation (see config.api_prefetch).
+
+    python tests/manual/query_benchmark.py [latency [work [pages]]]
+
+The API is simulated: every request takes latency seconds (default 0.2) and
+returns 500 made-up pages, up to pages pages in total (default 10000). The
+bot spends work milliseconds on every page (default 0.4, about as long as a
+request takes per page). Nothing is read from the wiki, and the throttle is
+not used.
+"""
+#
+# (C) Pywikipedia bot team, 2013
+#
+# Distributed under the terms of the MIT license.
+#
+__version__ = '$Id$'
+#
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import wikipedia as pywikibot
+import catlib
+import config
+import query
+
+
+def makeGetData(latency, total):
+    def GetData(params, site=None, *args, **kwargs):
+        time.sleep(latency)
+        if params['list'] == 'allpages':
+            prefix, module = 'ap', 'allpages'
+        else:
+            prefix, module = 'cm', 'categorymembers'
+        start = int(params.get(prefix + 'continue', 0))
+        end = min(start + int(params[prefix + 'limit']), total)
+        data = {'query': {module: [
+            {'ns': 0, 'pageid': i, 'title': u'Page %i' % i,
+             'sortkey': u'PAGE %i' % i, 'timestamp': u'2013-01-01T00:00:00Z'}
+            for i in xrange(start, end)]}}
+        if end < total:
+            data['query-continue'] = {module: {prefix + 'continue': end}}
+        return data
+    return GetData
+
+
+def run(name, gen, work):
+    start = time.time()
+    count = 0
+    for page in gen:
+        # simulate the work of a bot
+        until = time.time() + work
+        while time.time() < until:
+            pass
+        count += 1
+    elapsed = time.time() - start
+    print '%-34s %6d pages %7.2fs %7.0f pages/s' % (name, count, elapsed,
+                                                    count / elapsed)
+
+
+def main():
+    latency = sys.argv[1:] and float(sys.argv[1]) or 0.2
+    work = (sys.argv[2:] and float(sys.argv[2]) or 0.4) / 1000
+    total = sys.argv[3:] and int(sys.argv[3]) or 10000
+    query.GetData = makeGetData(latency, total)
+    throttle = pywikibot.get_throttle
+    pywikibot.get_throttle = lambda *args, **kwargs: None
+    config.special_page_limit = 500
+    # the category walk would load the members in another thread as well
+    config.category_walk_threads = 1
+    site = pywikibot.getSite('en', 'wikipedia')
+    try:
+        for prefetch in (False, True):
+            config.api_prefetch = prefetch
+            suffix = prefetch and 'with prefetch' or 'without prefetch'
+            run('allpages ' + suffix, site.allpages(throttle=False), work)
+            cat = catlib.Category(site, u'Category:Benchmark')
+            run('categorymembers ' + suffix, cat.articles(), work)
+    finally:
+        pywikibot.get_throttle = throttle
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        pywikibot.stopme()
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Compare the speed of the two replaceExcept() engines (masking=True, the
+default, and masking=False, the old iterative engine) and check that they
+give the same results.
+
+The texts used are the fixtures of tests/test_textlib.py, the articles in
+tests/data and, if given, the pages of the XML dumps passed as arguments:
+
+    python tests/manual/replaceExcept_benchmark.py [dump.xml[.bz2] ...]
+
+Every text is also tested when repeated a number of times, to show how the
+engines behave on long pages with many comments, references and tables.
+"""
+#
+# (C) Pywikipedia bot team, 2013
+#
+# Distributed under the terms of the MIT license.
+#
+__version__ = '$Id$'
+#
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import wikipedia as pywikibot
+from pywikibot import textlib
+import xmlreader
+from test_textlib import PyWikiTextLibTestCase
+
+data = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+replacements = [
+    (r'\b(\w+)\b', r'\1'),
+    (r'e', u'E'),
+    (r'\[\[(.+?)\]\]', r'[[\1]]'),
+]
+exceptions = ['comment', 'nowiki', 'pre', 'math', 'ref', 'table', 'template',
+              'startspace', 'hyperlink', 'interwiki']
+
+
+def texts(filenames):
+    yield u'fixture result1', unicode(PyWikiTextLibTestCase.result1)
+    for filename in filenames:
+        for entry in xmlreader.XmlDump(filename).parse():
+            yield entry.title, entry.text
+
+
+def bench(plan, text, repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = plan.apply(text)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def main():
+    site = pywikibot.getSite('en', 'wikipedia')
+    filenames = [os.path.join(data, 'article-pear.xml'),
+                 os.path.join(data, 'article-pyrus.xml')] + sys.argv[1:]
+    total = {True: 0.0, False: 0.0}
+    for old, new in replacements:
+        plans = {}
+        for masking in (True, False):
+            plans[masking] = textlib.ReplacePlan(old, new, exceptions,
+                                                 site=site, masking=masking)
+        for title, text in texts(filenames):
+            for factor in (1, 20):
+                results = {}
+                times = {}
+                for masking in (True, False):
+                    times[masking], results[masking] = \
+                                    bench(plans[masking], text * factor)
+                    total[masking] += times[masking]
+                if results[True] != results[False]:
+                    print 'RESULTS DIFFER:',
+                print '%-8r x%-3d %-30s masking: %8.4fs  old: %8.4fs' % (
+                    old[:8], factor, title.encode('utf-8')[:30],
+                    times[True], times[False])
+    print 'total: masking %.3fs, old %.3fs' % (total[True], total[False])
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        pywikibot.stopme()
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Measure how fast XmlDump reads all revisions of a full-history dump, and
+how much memory its entries take.
+
+    python tests/manual/xmlreader_benchmark.py [dump.xml[.bz2]]
+
+Without an argument, a dump with 20000 revisions of the page in
+tests/data/article-pear.xml is generated in a temporary directory.
+
+The dump is read once with all fields, once with only title, ns and
+redirect, and once more keeping all entries and their texts in a list to
+measure their size. The memory figures are the growth of the maximum resident set size
+of this process, so each of them is only meaningful for the first run
+that grows it; run with a single mode (all, fields or keep) as second
+argument to measure it alone.
+"""
+#
+# (C) Pywikipedia bot team, 2013
+#
+# Distributed under the terms of the MIT license.
+#
+__version__ = '$Id$'
+#
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import wikipedia as pywikibot
+import xmlreader
+
+data = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+def makeDump(directory, revisions=20000):
+    """Write a full-history dump with copies of the revisions of Pear"""
+    text = open(os.path.join(data, 'article-pear.xml')).read()
+    header, sep, rest = text.partition('<revision>')
+    revision, sep2, footer = rest.partition('</revision>')
+    filename = os.path.join(directory, 'pear-history.xml')
+    f = open(filename, 'w')
+    f.write(header)
+    for i in xrange(revisions):
+        f.write(sep + revision + sep2)
+    f.write(footer.partition('</page>')[1] + '\n</mediawiki>\n')
+    f.close()
+    return filename
+
+
+def maxrss():
+    """Return the maximum resident set size of this process in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run(filename, mode):
+    if mode == 'fields':
+        fields = ('title', 'ns', 'isredirect')
+    else:
+        fields = None
+    dump = xmlreader.XmlDump(filename, allrevisions=True, fields=fields)
+    kept = []
+    count = 0
+    before = maxrss()
+    start = time.time()
+    for entry in dump.parse():
+        count += 1
+        if mode == 'keep':
+            entry.text
+            kept.append(entry)
+    elapsed = time.time() - start
+    print '%-7s %8d revisions %8.3fs %9.0f rev/s  max RSS +%.1f MB' % (
+        mode, count, elapsed, count / elapsed, maxrss() - before)
+
+
+def main():
+    args = sys.argv[1:]
+    tmpdir = None
+    if args and args[0] not in ('all', 'fields', 'keep'):
+        filename = args.pop(0)
+    else:
+        tmpdir = tempfile.mkdtemp()
+        filename = makeDump(tmpdir)
+    try:
+        for mode in args or ('all', 'fields', 'keep'):
+            run(filename, mode)
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        pywikibot.stopme()
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+
+"""Unit tests for the timestamp parser and the threads of archivebot.py"""
+__version__ = '$Id$'
+
+import time
+import unittest
+
+import test_utils
+
+import archivebot
+
+
+class TimestampParserTestCase(unittest.TestCase):
+
+    def assertTimestamp(self, lang, line, expected):
+        if expected is not None:
+            expected = time.mktime(expected + (0, 0, 0, -1))
+        parser = archivebot.timestampParser(lang)
+        self.assertEqual(expected, parser.timestamp(line))
+
+    def test_formats(self):
+        self.assertTimestamp('en', u'Text. [[User:X|X]] 16:36, 30 March 2008 '
+                             u'(UTC)', (2008, 3, 30, 16, 36))
+        self.assertTimestamp('en', u'16:36, March 30, 2008 (UTC)',
+                             (2008, 3, 30, 16, 36))
+        self.assertTimestamp('en', u'16:36, 30 Mar 2008 (UTC)',
+                             (2008, 3, 30, 16, 36))
+        self.assertTimestamp('no', u'19:42, 25 mars 2008 (CET)',
+                             (2008, 3, 25, 19, 42))
+        self.assertTimestamp('hu', u'2007. december 8., 13:42 (CET)',
+                             (2007, 12, 8, 13, 42))
+        self.assertTimestamp('no', u'4. nov 2006 kl. 20:46 (CET)',
+                             (2006, 11, 4, 20, 46))
+        self.assertTimestamp('fi', u'3. joulukuuta 2008 kello 16.26 (EET)',
+                             (2008, 12, 3, 16, 26))
+        self.assertTimestamp('de', u'14:23, 12. Jan. 2009 (UTC)',
+                             (2009, 1, 12, 14, 23))
+        self.assertTimestamp('de', u'14:23, 12. März 2009 (CET)',
+                             (2009, 3, 12, 14, 23))
+        self.assertTimestamp('ro', u'4 august 2012 13:01 (EEST)',
+                             (2012, 8, 4, 13, 1))
+
+    def test_invalid(self):
+        self.assertTimestamp('en', u'No signature (really)', None)
+        self.assertTimestamp('en', u'16:36, 30 Foo 2008 (UTC)', None)
+        self.assertTimestamp('en', u'25:61, 1 May 2010 (UTC)', None)
+        # impossible dates are not rolled over into the next month
+        self.assertTimestamp('en', u'16:36, 31 February 2008 (UTC)', None)
+        self.assertTimestamp('en', u'16:36, 29 February 2009 (UTC)', None)
+        self.assertTimestamp('en', u'16:36, 29 February 2008 (UTC)',
+                             (2008, 2, 29, 16, 36))
+        # only inflected month names may continue after the full name
+        self.assertTimestamp('en', u'16:36, 30 Marchy 2008 (UTC)', None)
+        self.assertTimestamp('de', u'14:23, 12. Junior 2009 (UTC)', None)
+        self.assertTimestamp('fi', u'3. maaliskuuta 2008 kello 16.26 (EET)',
+                             (2008, 3, 3, 16, 26))
+
+
+class DiscussionThreadTestCase(unittest.TestCase):
+
+    def test_thread(self):
+        thread = archivebot.DiscussionThread(
+            u'Title', archivebot.timestampParser('en'))
+        for line in [u'', u'Question. 10:00, 1 May 2010 (UTC)',
+                     u':Answer. 11:00, 3 May 2010 (UTC)',
+                     u'::Thanks. 12:00, 2 May 2010 (UTC)']:
+            thread.feedLine(line)
+        self.assertEqual(time.mktime((2010, 5, 3, 11, 0, 0, 0, 0, -1)),
+                         thread.timestamp)
+        self.assertEqual(u'Question. 10:00, 1 May 2010 (UTC)\n'
+                         u':Answer. 11:00, 3 May 2010 (UTC)\n'
+                         u'::Thanks. 12:00, 2 May 2010 (UTC)\n',
+                         thread.content)
+        self.assertEqual(len(thread.toText()) + 4, thread.size())
+
+if __name__ == '__main__':
+    unittest.main()
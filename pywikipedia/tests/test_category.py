@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+
+"""Unit tests for the CategoryDatabase of category.py"""
+__version__ = '$Id$'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import test_utils
+
+import wikipedia
+import catlib
+import category
+
+# A -> B, C; B -> C, D; C -> A; D -> E
+tree = {
+    u'A': [u'B', u'C'],
+    u'B': [u'C', u'D'],
+    u'C': [u'A'],
+    u'D': [u'E'],
+    u'E': [],
+}
+
+
+class CategoryDatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'category.db')
+        self.site = wikipedia.getSite('en', 'wikipedia')
+        self.loaded = []
+        self.maxAge = wikipedia.config.category_db_max_age
+        self.patched = {}
+        # the members of the categories come from tree, not from the wiki
+        def subcategoriesList(cat):
+            title = cat.title(withNamespace=False)
+            self.loaded.append(title)
+            return [catlib.Category(self.site, u'Category:' + sub)
+                    for sub in tree[title]]
+        def articlesList(cat):
+            return [wikipedia.Page(self.site, u'Page ' +
+                                   cat.title(withNamespace=False))]
+        def supercategoriesList(cat):
+            title = cat.title(withNamespace=False)
+            return [catlib.Category(self.site, u'Category:' + sup)
+                    for sup in sorted(tree) if title in tree[sup]]
+        for function in (subcategoriesList, articlesList,
+                         supercategoriesList):
+            name = function.__name__
+            self.patched[name] = catlib.Category.__dict__[name]
+            setattr(catlib.Category, name, function)
+        self.db = category.CategoryDatabase(filename=self.filename)
+
+    def tearDown(self):
+        for name, function in self.patched.iteritems():
+            setattr(catlib.Category, name, function)
+        wikipedia.config.category_db_max_age = self.maxAge
+        self.db.db.close()
+        shutil.rmtree(self.dir)
+
+    def cat(self, title):
+        return catlib.Category(self.site, u'Category:' + title)
+
+    def subtree(self, title, maxDepth=None):
+        return [(cat.title(withNamespace=False), depth)
+                for cat, depth in self.db.getSubtree(self.cat(title),
+                                                     maxDepth)]
+
+    def test_subtree(self):
+        # each category once despite the cycle, at its smallest depth
+        self.assertEquals([(u'B', 1), (u'C', 1), (u'D', 2), (u'E', 3)],
+                          self.subtree(u'A'))
+        self.assertEquals([u'A', u'B', u'C', u'D', u'E'], sorted(self.loaded))
+        # the second time everything comes from the database
+        self.assertEquals([(u'A', 1), (u'B', 2), (u'D', 3), (u'E', 4)],
+                          self.subtree(u'C'))
+        self.assertEquals(5, len(self.loaded))
+
+    def test_maxdepth(self):
+        self.assertEquals([(u'B', 1), (u'C', 1)], self.subtree(u'A', 1))
+        self.assertEquals([u'A'], self.loaded)
+        self.assertEquals([(u'B', 1), (u'C', 1), (u'D', 2)],
+                          self.subtree(u'A', 2))
+        self.assertEquals([u'A', u'B', u'C'], sorted(self.loaded))
+
+    def test_stale(self):
+        self.subtree(u'A')
+        # pretend that B was loaded 40 days ago
+        self.db.db.execute('UPDATE categories SET contentsLoaded = '
+                           'contentsLoaded - 40 * 86400 WHERE title = ?',
+                           (u'Category:B',))
+        wikipedia.config.category_db_max_age = 0
+        self.subtree(u'A')
+        self.assertEquals(5, len(self.loaded))
+        wikipedia.config.category_db_max_age = 30
+        self.subtree(u'A')
+        self.assertEquals(6, len(self.loaded))
+        self.assertEquals(u'B', self.loaded[-1])
+        self.assertEquals([u'Category:C', u'Category:D'],
+                          [c.title() for c in self.db.getSubcats(self.cat(u'B'))])
+        self.assertEquals(6, len(self.loaded))
+
+    def test_corrupt(self):
+        self.db.db.close()
+        f = open(self.filename, 'wb')
+        f.write('garbage' * 1000)
+        f.close()
+        self.db = category.CategoryDatabase(filename=self.filename)
+        self.assertEquals([(u'B', 1), (u'C', 1)], self.subtree(u'A', 1))
+
+    def test_treeview(self):
+        filename = os.path.join(self.dir, 'tree.txt')
+        robot = category.CategoryTreeRobot(u'A', self.db, filename,
+                                           maxDepth=1)
+        robot.site = self.site
+        robot.run()
+        lines = open(filename).read().decode('utf-8').splitlines()
+        self.assertEquals(5, len(lines))
+        self.assertTrue(lines[0].startswith(u'[[:Category:A|A]] (1)'))
+        self.assertTrue(lines[1].startswith(u'#[[:Category:B|B]] (1)'))
+        # B has subcategories beyond maxDepth
+        self.assertEquals(u'##[...]', lines[2])
+        # every category was loaded once, down to the last level
+        self.assertEquals([u'A', u'B', u'C'], self.loaded)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+
+"""Unit tests for the category walk of catlib.py"""
+__version__ = '$Id$'
+
+import threading
+import time
+import unittest
+
+import test_utils
+
+import wikipedia
+import catlib
+
+# A -> B, C; B -> D, P1; C -> B, D, P2; D -> A, P1, P3
+tree = {
+    u'A': [u'Category:B', u'Category:C'],
+    u'B': [u'Category:D', u'P1'],
+    u'C': [u'Category:B', u'Category:D', u'P2'],
+    u'D': [u'Category:A', u'P1', u'P3'],
+}
+
+
+class Category(catlib.Category):
+
+    loaded = []
+    threads = set()
+    running = [0, 0]
+    lock = threading.Lock()
+
+    def _parseCategory(self, purge=False, startFrom=None, sortby=None,
+                       sortdir=None, endsort=None):
+        self.lock.acquire()
+        self.loaded.append(self.title(withNamespace=False))
+        self.threads.add(threading.currentThread())
+        self.running[0] += 1
+        self.running[1] = max(self.running)
+        self.lock.release()
+        time.sleep(0.05)
+        self.lock.acquire()
+        self.running[0] -= 1
+        self.lock.release()
+        for title in tree[self.title(withNamespace=False)]:
+            if title.startswith(u'Category:'):
+                yield catlib.SUBCATEGORY, Category(self.site(), title)
+            else:
+                yield catlib.ARTICLE, wikipedia.Page(self.site(), title)
+
+
+class CategoryWalkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        Category.loaded = []
+        Category.threads = set()
+        Category.running = [0, 0]
+        self.site = wikipedia.getSite('en', 'wikipedia')
+
+    def titles(self, pages):
+        return [page.title() for page in pages]
+
+    def test_walk(self):
+        cat = Category(self.site, u'Category:A')
+        self.assertEquals([u'P1', u'P2', u'P3'],
+                          self.titles(cat.articles(recurse=True)))
+        # each category is loaded once despite the cycle, B and C at the
+        # same time
+        self.assertEquals([u'A', u'B', u'C', u'D'], sorted(Category.loaded))
+        self.assertEquals(2, Category.running[1])
+        self.assertEquals([u'Category:B', u'Category:C', u'Category:D'],
+                          self.titles(cat.subcategories(recurse=True)))
+
+    def test_depth(self):
+        cat = Category(self.site, u'Category:A')
+        self.assertEquals([], self.titles(cat.articles()))
+        self.assertEquals([u'P1', u'P2'],
+                          self.titles(cat.articles(recurse=1)))
+        self.assertEquals([u'A', u'A', u'B', u'C'], sorted(Category.loaded))
+
+    def test_single(self):
+        # a single category is loaded by the calling thread
+        cat = Category(self.site, u'Category:B')
+        self.assertEquals([u'P1'], self.titles(cat.articles()))
+        self.assertEquals(set([threading.currentThread()]), Category.threads)
+
+    def test_cache(self):
+        cat = Category(self.site, u'Category:A')
+        first = sorted(cat.walk(cacheResults=True))
+        self.assertEquals(first, sorted(cat.walk(cacheResults=True)))
+        self.assertEquals([u'A', u'B', u'C', u'D'], sorted(Category.loaded))
+
+if __name__ == '__main__':
+    unittest.main()
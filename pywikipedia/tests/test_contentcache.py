@@ -0,0 +1,65 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+
+"""Unit tests for pywikibot/contentcache.py"""
+__version__ = '$Id$'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import test_utils
+
+from pywikibot import contentcache
+
+
+class ContentStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = contentcache.ContentStore(
+            os.path.join(self.tmpdir, 'contents.db'), 2000)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmpdir)
+
+    def record(self, revid, text):
+        return {'revid': revid, 'timestamp': u'2013-05-01T12:00:00Z',
+                'user': u'Example', 'comment': u'edit', '*': text}
+
+    def test_revision(self):
+        self.store.put('wikipedia:de', u'Straße', self.record(7, u'Text ä'))
+        self.assertEquals(None, self.store.get('wikipedia:en', u'Straße', 7))
+        self.assertEquals(None, self.store.get('wikipedia:de', u'Straße', 8))
+        record = self.store.get('wikipedia:de', u'Straße', u'7')
+        self.assertEquals(self.record(7, u'Text ä'), record)
+        self.assertEquals((1, 2, 1), (self.store.hits, self.store.misses,
+                                      self.store.outdated))
+        self.assertEquals(len(u'Text ä'.encode('utf-8')),
+                          self.store.savedBytes)
+
+    def test_hidden_user(self):
+        record = self.record(1, u'text')
+        del record['user']
+        record['anon'] = u''
+        self.store.put('wikipedia:de', u'A', record)
+        record = self.store.get('wikipedia:de', u'A', 1)
+        self.assertTrue('userhidden' in record and 'anon' in record)
+        self.assertFalse('user' in record)
+
+    def test_evict(self):
+        # random texts do not compress, so that the size is known
+        for i in range(10):
+            self.store.put('wikipedia:de', u'Page %i' % i,
+                           self.record(i, os.urandom(300).decode('latin-1')))
+            if i == 1:
+                self.store.get('wikipedia:de', u'Page 0', 0)
+        self.assertTrue(self.store.size <= 2000)
+        # the pages used least recently are gone
+        self.assertFalse(self.store.get('wikipedia:de', u'Page 1', 1))
+        self.assertTrue(self.store.get('wikipedia:de', u'Page 9', 9))
+
+if __name__ == '__main__':
+    unittest.main()
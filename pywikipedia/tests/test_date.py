@@ -1,3 +1,4 @@
+# -*- coding: utf-8  -*-
 import date
 
 def test_date_formats():
@@ -5,3 +6,17 @@ def test_date_formats():
         yield date.testMapEntry, formatName, False
 
 test_date_formats.slow = True
+
+def check_getAutoFormat(lang, title, result):
+    assert date.getAutoFormat(lang, title) == result
+
+def test_getAutoFormat():
+    for lang, title, result in [
+            ('en', u'1990s', ('DecadeAD', 1990)),
+            ('en', u'may 1976', ('Year_May', 1976)),
+            ('fr', u'5 janvier', ('Day_January', 5)),
+            ('de', u'20. Jahrhundert', ('CenturyAD', 20)),
+            ('ja', u'2001年', ('YearAD', 2001)),
+            ('en', u'Paris', (None, None)),
+            ('en', u'', (None, None))]:
+        yield check_getAutoFormat, lang, title, result
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+
+"""Unit tests for diskcache.py"""
+__version__ = '$Id$'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import test_utils
+
+import config
+import diskcache
+
+
+class DiskCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.base_dir = config.base_dir
+        config.base_dir = self.tmpdir
+        self.data = [(u'Aboutpage', u'Project:About'),
+                     (u'édit', u'Modifier'),
+                     (u'ÜBER', u'Apropos'),
+                     (u'1movedto2', u'moved [[$1]] to [[$2]]'),
+                     (u'api-error:foo bar', None),
+                     (u'empty', u'')]
+        self.data += [(u'message-%i' % i, u'text %i' % i)
+                      for i in range(1000)]
+
+    def tearDown(self):
+        config.base_dir = self.base_dir
+        shutil.rmtree(self.tmpdir)
+
+    def test_lookup(self):
+        cache = diskcache.CachedReadOnlyDictI(self.data, prefix='msg-')
+        self.assertEquals(len(self.data), len(cache))
+        for key, value in self.data:
+            self.assertEquals(value, cache[key])
+            self.assertEquals(value, cache[key.upper()])
+        self.assertEquals(u'Modifier', cache[u'ÉDIT'])
+        self.assertEquals(u'Modifier', cache[u'édit'])
+        self.assertEquals(u'Modifier', cache[u'édit'.encode('utf-8')])
+        # non-ASCII uppercase letters in the stored keys
+        self.assertEquals(u'Apropos', cache[u'über'])
+        self.assertEquals(u'Apropos', cache[u'Über'])
+        self.assertTrue(u'message-999' in cache)
+        self.assertFalse(u'message-1000' in cache)
+        self.assertRaises(KeyError, cache.__getitem__, u'')
+        cache.close()
+
+    def test_reuse(self):
+        cache = diskcache.CachedReadOnlyDictI(self.data, prefix='msg-')
+        cache.close()
+        mtime = os.path.getmtime(cache.cache_path)
+        again = diskcache.CachedReadOnlyDictI(self.data, prefix='msg-')
+        self.assertEquals(cache.cache_path, again.cache_path)
+        self.assertEquals(mtime, os.path.getmtime(again.cache_path))
+        again.close()
+        # other items replace the file
+        other = diskcache.CachedReadOnlyDictI(self.data[:3], prefix='msg-')
+        self.assertNotEquals(cache.cache_path, other.cache_path)
+        self.assertEquals([os.path.basename(other.cache_path)],
+                          os.listdir(os.path.join(self.tmpdir, 'cache')))
+        other.delete()
+        self.assertFalse(os.path.exists(other.cache_path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+
+"""Unit tests for the SpillStore of interwiki.py"""
+__version__ = '$Id$'
+
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+
+import test_utils
+
+import interwiki
+
+
+class SpillStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = interwiki.SpillStore(os.path.join(self.dir, 'store'),
+                                          memory=2)
+        # flush and compact often
+        self.store.maxPending = 1000
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.dir)
+
+    def test_shared(self):
+        store = self.store
+        store['a'] = u'#REDIRECT [[X]]'
+        store['b'] = u'#REDIRECT [[X]]'
+        store['c'] = u'Text ü'
+        store.flush()
+        self.assertEquals(2, len(store.blobs))
+        del store['a']
+        self.assertEquals(u'#REDIRECT [[X]]', store['b'])
+        self.assertEquals(u'Text ü', store['c'])
+        self.assertRaises(KeyError, store.__getitem__, 'a')
+
+    def test_random(self):
+        # compare with a dict, with compaction and only few texts in memory
+        rand = random.Random(42)
+        store, expected = self.store, {}
+        for i in range(5000):
+            key = rand.randint(0, 50)
+            action = rand.random()
+            if action < 0.4:
+                text = u'%i %s' % (rand.randint(0, 30),
+                                   unichr(rand.randint(32, 1000)) *
+                                   rand.randint(0, 500))
+                store[key] = expected[key] = text
+            elif action < 0.6:
+                if key in expected:
+                    del store[key]
+                    del expected[key]
+            elif action < 0.65:
+                store.flush()
+            elif key in expected:
+                self.assertEquals(expected[key], store[key])
+        for key in expected:
+            self.assertEquals(expected[key], store[key])
+        # unused texts were dropped from the file
+        store.flush()
+        self.assertFalse(store.dead > store.maxPending and
+                         store.dead > store.live)
+        self.assertEquals(store.end, os.path.getsize(store.path))
+
+    def test_threads(self):
+        store, errors = self.store, []
+
+        def work(n):
+            try:
+                for i in range(300):
+                    key = (n, i % 20)
+                    text = u'%i %i ' % key * (i % 7 + 1) * 20
+                    store[key] = text
+                    if store[key] != text:
+                        errors.append(key)
+                    if i % 5 == 0:
+                        del store[key]
+                    if i % 11 == 0:
+                        store.flush()
+            except Exception, err:
+                errors.append(err)
+        threads = [threading.Thread(target=work, args=(n,))
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals([], errors)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+
+"""Unit tests for pywikibot/comms/keepalive.py, using a local HTTP server"""
+__version__ = '$Id$'
+
+import BaseHTTPServer
+import threading
+import time
+import unittest
+import urllib2
+
+import test_utils
+
+from pywikibot.comms import keepalive
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = 'path %s' % self.path
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        if self.path == '/close':
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+        if self.path == '/drop':
+            # close the connection without telling the client
+            self.close_connection = 1
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.posts.append(self.path)
+        if self.path == '/slow':
+            time.sleep(0.5)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class KeepAliveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.server.posts = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        self.url = 'http://127.0.0.1:%i' % self.server.server_port
+        self.pool = keepalive.ConnectionPool(maxsize=2, idletimeout=30)
+        self.opener = urllib2.build_opener(keepalive.HTTPHandler(self.pool))
+
+    def tearDown(self):
+        self.pool.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuse(self):
+        for i in range(3):
+            f = self.opener.open(self.url + '/page%i' % i)
+            self.assertEquals('path /page%i' % i, f.read())
+        f = self.opener.open(self.url + '/post', 'a=b')
+        self.assertEquals('a=b', f.read())
+        self.assertEquals(4, self.pool.stats['requests'])
+        self.assertEquals(1, self.pool.stats['created'])
+        self.assertEquals(3, self.pool.stats['reused'])
+
+    def test_connection_close(self):
+        self.assertEquals('path /close',
+                          self.opener.open(self.url + '/close').read())
+        self.assertEquals('path /x', self.opener.open(self.url + '/x').read())
+        self.assertEquals(2, self.pool.stats['created'])
+        self.assertEquals(0, self.pool.stats['reused'])
+
+    def test_unread(self):
+        # a connection whose response was not read is not used again
+        self.opener.open(self.url + '/x').close()
+        self.assertEquals('path /y', self.opener.open(self.url + '/y').read())
+        self.assertEquals(2, self.pool.stats['created'])
+
+    def test_idle_timeout(self):
+        self.pool.idletimeout = -1
+        self.opener.open(self.url + '/x').read()
+        self.opener.open(self.url + '/y').read()
+        self.assertEquals(2, self.pool.stats['created'])
+        self.assertEquals(1, self.pool.stats['discarded'])
+
+    def test_stale(self):
+        # the pool cannot tell that the server has closed the connection
+        self.pool._healthy = lambda conn: True
+        self.opener.open(self.url + '/drop').read()
+        self.assertEquals('path /x', self.opener.open(self.url + '/x').read())
+        self.assertEquals(1, self.pool.stats['retried'])
+        # a POST is not sent again if it may have reached the server
+        self.opener.open(self.url + '/drop').read()
+        self.assertRaises(Exception, self.opener.open, self.url + '/post',
+                          'a=b')
+        self.assertEquals(1, self.pool.stats['retried'])
+
+    def test_timeout(self):
+        self.opener.open(self.url + '/x').read()
+        self.assertRaises(urllib2.URLError, self.opener.open,
+                          self.url + '/slow', 'a=b', 0.1)
+        time.sleep(0.6)
+        self.assertEquals(['/slow'], self.server.posts)
+        self.assertEquals(0, self.pool.stats['retried'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+
+"""Unit tests for pywikibot/putqueue.py"""
+__version__ = '$Id$'
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import test_utils
+
+import wikipedia as pywikibot
+from pywikibot import putqueue
+
+
+class FakeFamily(object):
+    name = 'wikipedia'
+
+
+class FakeSite(object):
+    family = FakeFamily()
+    lang = 'test'
+
+
+class FakePage(object):
+    saved = []
+    lock = threading.Lock()
+    # title -> timestamp of the latest revision on the wiki
+    latest = {}
+
+    def __init__(self, title, delay=0.05):
+        self._title = title
+        self.delay = delay
+        self._editTime = None
+        self._startTime = '0'
+
+    def site(self):
+        return FakeSite.instance
+
+    def title(self):
+        return self._title
+
+    def put(self, newtext, comment, watchArticle, minorEdit, force):
+        time.sleep(self.delay)
+        if newtext is None:
+            raise pywikibot.LockedPage()
+        base = self._editTime or time.strftime('%Y%m%d%H%M%S', time.gmtime())
+        if self.latest.get(self._title, '') > base:
+            raise pywikibot.EditConflict(u'An edit conflict has occured.')
+        self.lock.acquire()
+        self.saved.append((self._title, newtext))
+        self.lock.release()
+
+FakeSite.instance = FakeSite()
+
+
+class PutQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        FakePage.saved = []
+        FakePage.latest = {}
+        self.tmpdir = tempfile.mkdtemp()
+        self.journal = putqueue.PutJournal(os.path.join(self.tmpdir, 'j.txt'))
+        self.queue = putqueue.PutQueue(workers=1, journal=self.journal)
+        self.queue._recovered = True
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def put(self, page, text, callback=None, resultCallback=None):
+        self.queue.put(putqueue.PutRequest(page, text, callback=callback,
+                                           resultCallback=resultCallback))
+
+    def test_order(self):
+        for i in range(5):
+            self.put(FakePage(str(i), 0.01), u'text')
+        self.assertTrue(self.queue.join(5))
+        self.assertEquals([str(i) for i in range(5)],
+                          [title for title, text in FakePage.saved])
+
+    def test_coalesce(self):
+        results = []
+        errors = []
+        first = FakePage('first')
+        self.put(first, u'a')
+        # 'first' is being saved now; the saves of 'second' wait
+        time.sleep(0.01)
+        second = FakePage('second')
+        self.put(second, u'a', callback=lambda page, error:
+                 errors.append(error))
+        self.put(second, u'b', resultCallback=results.append)
+        self.put(second, u'c', resultCallback=results.append)
+        self.assertTrue(self.queue.join(5))
+        self.assertEquals([('first', u'a'), ('second', u'c')],
+                          FakePage.saved)
+        self.assertEquals([None], errors)
+        self.assertEquals(2, len(results))
+        request = results[0]
+        self.assertEquals(2, request.coalesced)
+        self.assertTrue(request.waited() > 0)
+        self.assertTrue(request.duration() >= 0.04)
+
+    def test_error(self):
+        errors = []
+        self.put(FakePage('locked', 0), None,
+                 callback=lambda page, error: errors.append(error))
+        self.assertTrue(self.queue.join(5))
+        self.assertTrue(isinstance(errors[0], pywikibot.LockedPage))
+
+    def test_journal(self):
+        self.put(FakePage('done', 0), u'x')
+        self.assertTrue(self.queue.join(5))
+        # the journal is emptied when the queue is
+        self.assertEquals(0, os.path.getsize(self.journal.filename))
+        # a crashed run: one save done, one coalesced, one incomplete line
+        self.journal.add(putqueue.PutRequest(FakePage('a'), u'1'))
+        request = putqueue.PutRequest(FakePage('b'), u'2')
+        self.journal.add(request)
+        self.journal.done(request)
+        request = putqueue.PutRequest(FakePage('c'), u'3')
+        self.journal.add(request)
+        request.newtext = u'4'
+        self.journal.add(request)
+        self.journal._file.write('{"id": 4, "fam')
+        self.journal._file.flush()
+        records = putqueue.PutJournal(self.journal.filename).unfinished()
+        self.assertEquals([('a', u'1'), ('c', u'4')],
+                          [(record['title'], record['text'])
+                           for record in records])
+
+    def test_recover_conflict(self):
+        errors = {}
+        old = FakePage('old')
+        old._editTime = '20130101000000'
+        self.journal.add(putqueue.PutRequest(old, u'1'))
+        # a page which was not loaded before it was put
+        self.journal.add(putqueue.PutRequest(FakePage('unloaded'), u'2'))
+        self.journal.add(putqueue.PutRequest(FakePage('unchanged'), u'3'))
+        # the bot crashed; then someone edited two of the pages
+        FakePage.latest['old'] = '20130102000000'
+        FakePage.latest['unloaded'] = time.strftime('%Y%m%d%H%M%S',
+                                                    time.gmtime(time.time() + 2))
+        getSite, Page = pywikibot.getSite, pywikibot.Page
+        pywikibot.getSite = lambda lang, family: FakeSite.instance
+        pywikibot.Page = lambda site, title: FakePage(title, 0)
+        try:
+            queue = putqueue.PutQueue(journal=putqueue.PutJournal(
+                                                    self.journal.filename))
+            queue.report = lambda request: errors.__setitem__(
+                request.page.title(), request.error)
+            queue.recover()
+            self.assertTrue(queue.join(5))
+        finally:
+            pywikibot.getSite, pywikibot.Page = getSite, Page
+        self.assertEquals([('unchanged', u'3')], FakePage.saved)
+        self.assertTrue(isinstance(errors['old'], pywikibot.EditConflict))
+        self.assertTrue(isinstance(errors['unloaded'], pywikibot.EditConflict))
+        self.assertEquals(None, errors['unchanged'])
+
+if __name__ == '__main__':
+    unittest.main()
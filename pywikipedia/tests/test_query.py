@@ -154,5 +154,106 @@ class PyWikiQueryTestCase(tests.test_pywiki.PyWikiTestCase):
         }}
         self.assertEqualQueryResult(params, expectedresult)
 
+
+class QueryIteratorTestCase(tests.test_pywiki.PyWikiTestCase):
+    """QueryIterator with made-up API results; nothing is read from the
+    wiki."""
+
+    def setUp(self):
+        tests.test_pywiki.PyWikiTestCase.setUp(self)
+        self.GetData = query.GetData
+        query.GetData = self.fakeGetData
+        self.requests = []
+
+    def tearDown(self):
+        query.GetData = self.GetData
+
+    def fakeGetData(self, params, site):
+        self.requests.append(params)
+        if params.get('list') == 'allpages':
+            start = int(params.get('apcontinue', 0))
+            limit = params['aplimit']
+            data = {}
+            if limit == 'max':
+                limit = 3
+                data['limits'] = {'allpages': 3}
+            end = min(start + limit, 10)
+            data['query'] = {'allpages': [{'title': u'P%i' % i}
+                                          for i in range(start, end)]}
+            if end < 10:
+                data['query-continue'] = {'allpages': {'apcontinue': end}}
+            return data
+        # two pages from the allpages generator at a time, with two links
+        # each, one at a time
+        start = int(params.get('gapcontinue', 0))
+        link = int(params.get('plcontinue', 0))
+        data = {'query': {'pages': {}}}
+        for i in (start, start + 1):
+            data['query']['pages'][str(i)] = {
+                'title': u'P%i' % i, 'links': [{'title': u'L%i' % link}]}
+        if link == 0:
+            data['query-continue'] = {'links': {'plcontinue': 1},
+                                      'allpages': {'gapcontinue': start + 2}}
+        elif start < 2:
+            data['query-continue'] = {'allpages': {'gapcontinue': start + 2}}
+        return data
+
+    def titles(self, items):
+        return [item['title'] for item in items]
+
+    def test_continue(self):
+        params = {'action': 'query', 'list': 'allpages', 'aplimit': 4}
+        for prefetch in (False, True):
+            self.requests = []
+            result = query.QueryIterator(self.site, params, 'allpages',
+                                         'aplimit', prefetch=prefetch)
+            self.assertEqual([u'P%i' % i for i in range(10)],
+                             self.titles(result))
+            self.assertEqual([4, 4, 4],
+                             [r['aplimit'] for r in self.requests])
+        self.assertEqual({'action': 'query', 'list': 'allpages',
+                          'aplimit': 4}, params)
+
+    def test_limit(self):
+        params = {'action': 'query', 'list': 'allpages', 'aplimit': 4}
+        result = query.QueryIterator(self.site, params, 'allpages',
+                                     'aplimit', limit=7)
+        self.assertEqual([u'P%i' % i for i in range(7)], self.titles(result))
+        self.assertEqual([4, 3], [r['aplimit'] for r in self.requests])
+
+    def test_max(self):
+        params = {'action': 'query', 'list': 'allpages'}
+        result = query.QueryIterator(self.site, params, 'allpages',
+                                     'aplimit', limit=1000,
+                                     requestLimit='max')
+        self.assertEqual(10, len(list(result)))
+        # 'max' until the wiki has told its limit
+        self.assertEqual(['max', 3, 3, 3],
+                         [r['aplimit'] for r in self.requests])
+
+    def test_generator(self):
+        params = {'action': 'query', 'generator': 'allpages',
+                  'prop': 'links'}
+        result = list(query.QueryIterator(self.site, params))
+        self.assertEqual([(None, None), (1, None), (None, 2), (1, 2)],
+                         [(r.get('plcontinue'), r.get('gapcontinue'))
+                          for r in self.requests])
+        self.assertEqual(4, len(result))
+
+    def test_throttle(self):
+        # the requests are charged to the site they are sent to
+        site = pywikibot.getSite('commons', 'commons')
+        sites = []
+        get_throttle = pywikibot.get_throttle
+        pywikibot.get_throttle = lambda **kwargs: sites.append(kwargs['site'])
+        try:
+            params = {'action': 'query', 'list': 'allpages', 'aplimit': 4}
+            result = query.QueryIterator(site, params, 'allpages', 'aplimit',
+                                         throttle=True, prefetch=True)
+            self.assertEqual(10, len(list(result)))
+        finally:
+            pywikibot.get_throttle = get_throttle
+        self.assertEqual([site] * 3, sites)
+
 if __name__ == "__main__":
     unittest.main()
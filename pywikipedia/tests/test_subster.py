@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+
+"""Unit tests for the xlsx and ods row readers of subster.py"""
+__version__ = '$Id$'
+
+import StringIO
+import unittest
+import zipfile
+
+import test_utils
+
+from openpyxl.workbook import Workbook
+
+import subster
+
+ods_content = '''<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content
+  xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+  xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+  xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0">
+<office:body><office:spreadsheet>
+<table:table table:name="Other">
+ <table:table-row><table:table-cell><text:p>x</text:p></table:table-cell>
+ </table:table-row>
+</table:table>
+<table:table table:name="Data">
+ <table:table-column table:number-columns-repeated="1024"/>
+ <table:table-row>
+  <table:table-cell><text:p>a<text:s text:c="2"/>b</text:p></table:table-cell>
+  <table:table-cell table:number-columns-repeated="2"/>
+  <table:table-cell table:number-columns-repeated="2"><text:p>r</text:p>
+  </table:table-cell>
+  <table:table-cell table:number-columns-repeated="1019"/>
+ </table:table-row>
+ <table:table-row table:number-rows-repeated="2">
+  <table:table-cell table:number-columns-repeated="1024"/>
+ </table:table-row>
+ <table:table-row table:number-rows-repeated="3">
+  <table:table-cell><text:p>\xc3\xbc</text:p></table:table-cell>
+ </table:table-row>
+ <table:table-row table:number-rows-repeated="1048570">
+  <table:table-cell table:number-columns-repeated="1024"/>
+ </table:table-row>
+</table:table>
+</office:spreadsheet></office:body></office:document-content>'''
+
+
+class RowReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        output = StringIO.StringIO()
+        archive = zipfile.ZipFile(output, 'w')
+        archive.writestr('content.xml', ods_content)
+        archive.close()
+        self.ods = output.getvalue()
+
+        wb = Workbook()
+        ws = wb.get_active_sheet()
+        ws.title = 'Data'
+        for row in range(6):
+            ws.cell(row=row, column=0).value = u'row %i' % (row + 1)
+            ws.cell(row=row, column=1).value = row + 1
+        ws.cell(row=2, column=2).value = u'ü'
+        output = StringIO.StringIO()
+        wb.save(output)
+        self.xlsx = output.getvalue()
+
+    def test_row_range(self):
+        self.assertEquals((1, None), subster.row_range(u''))
+        self.assertEquals((5, 5), subster.row_range(u'5'))
+        self.assertEquals((2, 100), subster.row_range(u'2:100'))
+        self.assertEquals((2, None), subster.row_range(u'2:'))
+        self.assertEquals((1, 100), subster.row_range(u':100'))
+
+    def test_ods(self):
+        rows = lambda *args: list(subster.ods_rows(
+                                    StringIO.StringIO(self.ods), *args))
+        # repeated cells and rows are expanded, trailing empty ones dropped
+        self.assertEquals([[u'a  b', u'', u'', u'r', u'r'], [], [],
+                           [u'ü'], [u'ü'], [u'ü']], rows('Data'))
+        self.assertEquals([[], [], [u'ü']], rows('Data', 2, 4))
+        self.assertEquals([[u'ü'], [u'ü']], rows('Data', 5))
+        self.assertEquals([[u'x']], rows('Other'))
+        self.assertEquals('a  b,,,r,r\r\n\r\n',
+                          subster.SubsterBot.ods2csv.im_func(
+                            None, self.ods, 'Data', u':2'))
+
+    def test_xlsx(self):
+        rows = lambda *args: list(subster.xlsx_rows(
+                                    StringIO.StringIO(self.xlsx), *args))
+        self.assertEquals(6, len(rows('Data')))
+        self.assertEquals([[u'row 2', 2.0, None], [u'row 3', 3.0, u'ü']],
+                          rows('Data', 2, 3))
+        self.assertEquals([[u'row 6', 6.0, None]], rows('Data', 6))
+        self.assertEquals('row 3,3.0,\xc3\xbc\r\nrow 4,4.0,\r\n',
+                          subster.SubsterBot.xlsx2csv.im_func(
+                            None, self.xlsx, 'Data', u'3:4'))
+
+if __name__ == '__main__':
+    unittest.main()
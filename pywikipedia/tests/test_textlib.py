@@ -102,5 +102,66 @@ class PyWikiTextLibTestCase(PyWikiTestCase):
         result = 'Blah\r\n\r\n[[Category:Cat1]]\r\n[[Category:Cat2]]\r\n\r\n[[fr:Test]]'
         self.assertRoundtripCategory(result,2)
 
+    def test_replaceExcept(self):
+        text = u'foo <!-- foo --> <nowiki>foo</nowiki> [[de:foo]] foo'
+        self.assertEqual(
+            u'bar <!-- foo --> <nowiki>foo</nowiki> [[de:foo]] bar',
+            textlib.replaceExcept(text, 'foo', 'bar',
+                                  ['comment', 'nowiki', 'interwiki'],
+                                  site=self.site))
+        self.assertEqual(u'xfooy', textlib.replaceExcept(
+            u'xbary', r'(?P<word>bar)', r'foo', [], site=self.site))
+        self.assertEqual(u'x-a-y', textlib.replaceExcept(
+            u'xay', r'(a)', r'-\1-', [], site=self.site))
+
+    def test_ReplacePlan(self):
+        plan = textlib.ReplacePlan(r'foo', u'bar', ['comment', 'math'],
+                                   site=self.site)
+        for text in [u'foo <!-- foo -->', u'<math>foo</math> foo', u'']:
+            self.assertEqual(
+                textlib.replaceExcept(text, r'foo', u'bar',
+                                      ['comment', 'math'], site=self.site),
+                plan.apply(text))
+
+    def test_replaceExcept_masking(self):
+        text = (u'foo<!--foo <nowiki>-->foo</nowiki>foo\n'
+                u'{|\n| foo\n|}\n<ref>foo</ref> {{foo|foo}} foo')
+        exceptions = ['comment', 'nowiki', 'table', 'ref', 'template']
+        for old, new in [(r'foo', u'bar'), (r'(f)(o+)', r'\2\1'),
+                         (r'o', u'oo')]:
+            for marker in ['', u'@@']:
+                self.assertEqual(
+                    textlib.replaceExcept(text, old, new, exceptions,
+                                          marker=marker, site=self.site,
+                                          masking=False),
+                    textlib.replaceExcept(text, old, new, exceptions,
+                                          marker=marker, site=self.site,
+                                          masking=True))
+
+    def test_replaceExcept_masking_differences(self):
+        # the masking engine matches against the original text
+        for old, new, text, exceptions, iterative, masked in [
+                (r'(?<=x)x', u'y', u'xxx', [], u'xyx', u'xyy'),
+                (r'^a', u'', u'aaaa', [], u'', u'aaa'),
+                (r'[ab]', u'\n', u'a b', ['startspace'], u'\n b', u'\n \n')]:
+            self.assertEqual(iterative, textlib.replaceExcept(
+                text, old, new, exceptions, site=self.site, masking=False))
+            self.assertEqual(masked, textlib.replaceExcept(
+                text, old, new, exceptions, site=self.site, masking=True))
+
+    def test_protectedSpans(self):
+        regexes = [textlib.getExceptionRegexes(self.site)['comment'],
+                   textlib._tagRegex('nowiki')]
+        # the nowiki tag inside the comment is ignored
+        self.assertEqual([(0, 17), (29, 47), (47, 54)],
+                         textlib.protectedSpans(
+                             u'<!-- <nowiki> --> </nowiki>'
+                             u'a <nowiki>b</nowiki><!---->', regexes))
+
+    def test_getExceptionRegexes_cached(self):
+        regexes = textlib.getExceptionRegexes(self.site)
+        self.assertTrue(regexes is textlib.getExceptionRegexes(self.site))
+        self.assertTrue(regexes['interwiki'].match(u'[[de:Foo]]'))
+
 if __name__ == "__main__":
     unittest.main()
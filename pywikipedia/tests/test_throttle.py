@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+
+"""Unit tests for pywikibot/throttle.py"""
+__version__ = '$Id$'
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import test_utils
+
+import wikipedia as pywikibot
+from pywikibot import throttle
+
+
+class FakeSite(object):
+    def __init__(self, hostname):
+        self._hostname = hostname
+
+    def hostname(self):
+        return self._hostname
+
+
+def registerChild(filename, queue):
+    queue.put(throttle._SharedBuckets(filename).register())
+
+
+class ThrottleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'throttle.dat')
+        self.oldBuckets = throttle._buckets
+        throttle._buckets = throttle._SharedBuckets(self.filename)
+        self.throttle = throttle.Throttle(mindelay=0.1, maxdelay=1,
+                                          multiplydelay=False)
+        self.throttle.setDelay(0.1)
+
+    def tearDown(self):
+        throttle._buckets = self.oldBuckets
+        shutil.rmtree(self.tmpdir)
+
+    def test_sameHost(self):
+        site = FakeSite('a.example.org')
+        start = time.time()
+        for i in range(3):
+            self.throttle(site=site)
+        self.assertTrue(time.time() - start >= 0.19)
+        self.assertEquals([3, 2], self.throttle.stats['a.example.org'][:2])
+
+    def test_otherHosts(self):
+        start = time.time()
+        for i in range(3):
+            self.throttle(site=FakeSite('%i.example.org' % i))
+        self.assertTrue(time.time() - start < 0.1)
+
+    def test_requestsize(self):
+        site = FakeSite('a.example.org')
+        self.throttle(requestsize=7, site=site)
+        # 3 tokens taken: wait for 2 more delays, plus one for this request
+        self.assertAlmostEquals(0.3, self.throttle.waittime(site=site), 1)
+
+    def test_backoffShared(self):
+        site = FakeSite('a.example.org')
+        self.throttle.backoff(0.1, site)
+        # a process which uses the same file has to wait, too
+        other = throttle._SharedBuckets(self.filename)
+        blocked = other.update('a.example.org', lambda record: record[4])
+        self.assertTrue(blocked > time.time() - 0.2)
+        self.assertEquals(0.0, other.update('b.example.org',
+                                            lambda record: record[4]))
+
+    def test_register(self):
+        self.assertEquals(1, throttle._buckets.register())
+        queue = multiprocessing.Queue()
+        child = multiprocessing.Process(target=registerChild,
+                                        args=(self.filename, queue))
+        child.start()
+        self.assertEquals(2, queue.get(timeout=10))
+        child.join()
+        # the slot of the finished process is free again
+        throttle._buckets.drop(1)
+        self.assertEquals(1, throttle._buckets.register())
+
+    def test_parseRetryAfter(self):
+        self.assertEquals(120, throttle.parseRetryAfter('120'))
+        self.assertEquals(None, throttle.parseRetryAfter(None))
+        self.assertEquals(None, throttle.parseRetryAfter('soon'))
+        self.assertEquals(0, throttle.parseRetryAfter(
+            'Wed, 21 Oct 2015 07:28:00 GMT'))
+
+if __name__ == '__main__':
+    unittest.main()
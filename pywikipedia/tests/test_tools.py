@@ -0,0 +1,56 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+
+"""Unit tests for the MultiMatcher of pywikibot/tools.py"""
+__version__ = '$Id$'
+
+import random
+import unittest
+
+import test_utils
+
+from pywikibot.tools import MultiMatcher
+
+
+class MultiMatcherTestCase(unittest.TestCase):
+
+    def naive(self, words, text):
+        return sorted([(i, i + len(word), word) for word in set(words)
+                       for i in range(len(text))
+                       if word and text.startswith(word, i)])
+
+    def test_random(self):
+        # compare with a naive search on words sharing many prefixes and
+        # suffixes
+        rand = random.Random(42)
+        for i in range(50):
+            words = [u''.join([rand.choice(u'ab') for j in
+                               range(rand.randint(1, 5))])
+                     for k in range(rand.randint(1, 10))]
+            text = u''.join([rand.choice(u'abc') for j in range(40)])
+            matcher = MultiMatcher(words)
+            self.assertEquals(self.naive(words, text),
+                              sorted(matcher.finditer(text)))
+
+    def test_case(self):
+        matcher = MultiMatcher([u'Admin', u'sysop'], ignoreCase=True)
+        self.assertEquals((3, 8, u'Admin'), matcher.search(u'TheADMIN'))
+        self.assertEquals((0, 5, u'sysop'), matcher.search(u'SysopX'))
+        self.assertEquals(None, MultiMatcher([u'Admin']).search(u'admin'))
+
+    def test_add(self):
+        matcher = MultiMatcher([u'spam.example'])
+        self.assertEquals(None, matcher.search(u'http://www.example.org'))
+        matcher.add(u'example.org')
+        matcher.add(u'')
+        self.assertEquals(2, len(matcher))
+        self.assertEquals((11, 22, u'example.org'),
+                          matcher.search(u'http://www.example.org'))
+
+    def test_unicode(self):
+        matcher = MultiMatcher([u'gesù', u'über'], ignoreCase=True)
+        self.assertEquals([(0, 4, u'über'), (5, 9, u'gesù')],
+                          list(matcher.finditer(u'ÜBER GESÙ')))
+
+if __name__ == '__main__':
+    unittest.main()
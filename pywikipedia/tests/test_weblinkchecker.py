@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+
+"""Unit tests for the LinkCheckEngine of weblinkchecker.py"""
+__version__ = '$Id$'
+
+import BaseHTTPServer
+import threading
+import time
+import unittest
+
+import test_utils
+
+import weblinkchecker
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.server.requests.append(('HEAD', self.path))
+        if self.path == '/nohead':
+            self.answer(405)
+        else:
+            self.do_GET(False)
+
+    def do_GET(self, log=True):
+        if log:
+            self.server.requests.append(('GET', self.path))
+        if self.path == '/dead':
+            self.answer(404)
+        elif self.path == '/moved':
+            self.answer(301, '/alive')
+        else:
+            self.answer(200)
+
+    def answer(self, status, location=None):
+        self.server.connections.add(self.connection)
+        self.send_response(status)
+        if location:
+            self.send_header('Location', 'http://%s:%i%s'
+                             % (self.server.server_address + (location,)))
+        self.send_header('Content-Length', '4')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write('body')
+
+    def log_message(self, *args):
+        pass
+
+
+class Page(object):
+
+    def __init__(self, title):
+        self._title = title
+
+    def title(self):
+        return self._title
+
+
+class History(object):
+
+    def __init__(self):
+        self.alive = []
+        self.dead = []
+
+    def setLinkAlive(self, url):
+        self.alive.append(url)
+        return False
+
+    def setLinkDead(self, url, error, page, day):
+        self.dead.append((url, error, page.title()))
+
+
+class LinkCheckEngineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self.server.requests = []
+        self.server.connections = set()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        self.history = History()
+        self.engine = weblinkchecker.LinkCheckEngine(
+            self.history, workers=4, perHost=1, hostDelay=0)
+
+    def tearDown(self):
+        self.engine.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def url(self, path):
+        return 'http://127.0.0.1:%i%s' % (self.server.server_address[1], path)
+
+    def check(self, links):
+        for title, path in links:
+            self.engine.add(Page(title), self.url(path))
+        start = time.time()
+        while self.engine.pending and time.time() - start < 10:
+            time.sleep(0.01)
+        self.assertEquals(0, self.engine.pending)
+
+    def test_check(self):
+        self.check([('A', '/alive'), ('A', '/dead'), ('B', '/dead'),
+                    ('B', '/moved'), ('C', '/nohead'), ('C', '/alive')])
+        self.assertEquals([self.url('/alive')] * 2 + [self.url('/moved')] +
+                          [self.url('/nohead')],
+                          sorted(self.history.alive))
+        self.assertEquals([(self.url('/dead'), '404 Not Found', 'A'),
+                           (self.url('/dead'), '404 Not Found', 'B')],
+                          sorted(self.history.dead))
+        requests = sorted(self.server.requests)
+        # every URL is requested once (/alive again as the target of /moved),
+        # with GET only if HEAD fails
+        self.assertEquals([('GET', '/dead'), ('GET', '/nohead'),
+                           ('HEAD', '/alive'), ('HEAD', '/alive'),
+                           ('HEAD', '/dead'), ('HEAD', '/moved'),
+                           ('HEAD', '/nohead')], requests)
+        # one connection per host
+        self.assertEquals(1, len(self.server.connections))
+        self.assertEquals((4, 1, 2),
+                          (self.engine.checked, self.engine.dead,
+                           self.engine.duplicates))
+        lines = self.engine.statistics()
+        self.assertEquals(2, len(lines))
+        self.assertTrue(lines[1].startswith(u'127.0.0.1:%i: 7 requests, 0 '
+                                            % self.server.server_address[1]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,11 @@ import xml.sax
 import unittest
 import test_utils
 
+import bz2
+import pickle
+import shutil
+import tempfile
+
 import xmlreader
 
 import os
@@ -32,6 +37,52 @@ class XmlReaderTestCase(unittest.TestCase):
         pages = [r for r in xmlreader.XmlDump(path + "/data/article-pyrus.xml").parse()]
         self.assertTrue(pages[0].isredirect)
 
+    def test_XmlDumpFields(self):
+        pages = list(xmlreader.XmlDump(path + "/data/article-pear.xml",
+                                       allrevisions=True,
+                                       fields=('title', 'isredirect')).parse())
+        self.assertEquals(4, len(pages))
+        self.assertEquals(u"Pear", pages[3].title)
+        self.assertEquals(False, pages[3].isredirect)
+        self.assertEquals(None, pages[3].text)
+        self.assertEquals(None, pages[3].username)
+        self.assertRaises(ValueError, xmlreader.XmlDump,
+                          path + "/data/article-pear.xml", fields=('txt',))
+
+    def test_XmlEntryLazyText(self):
+        # the texts can still be read after the dump has been parsed
+        pages = list(xmlreader.XmlDump(path + "/data/article-pear.xml",
+                                       allrevisions=True).parse())
+        for page in pages:
+            self.assertTrue(page.text.startswith('Pears are [[tree]]s of'))
+        self.assertFalse(hasattr(pages[0], '__dict__'))
+        copy = pickle.loads(pickle.dumps(pages[0], 2))
+        self.assertEquals(pages[0].text, copy.text)
+        self.assertEquals(pages[0].revisionid, copy.revisionid)
+
+    def test_XmlDumpScanner(self):
+        scanner = xmlreader.XmlDumpScanner(path + "/data/article-pear.xml",
+                                           xmlreader.TextFilter([u'Pear']),
+                                           processes=2, chunksize=1,
+                                           allrevisions=True)
+        self.assertEquals([u"Pear"] * 4, list(scanner))
+        self.assertEquals(4, scanner.count)
+        self.assertEquals(None, scanner.resumeTitle())
+
+    def test_XmlDumpScannerUnordered(self):
+        scanner = xmlreader.XmlDumpScanner(path + "/data/article-pear.xml",
+                                           xmlreader.TextFilter([u'Pear']),
+                                           processes=2, ordered=False,
+                                           chunksize=1, allrevisions=True)
+        self.assertEquals(4, len(list(scanner)))
+
+    def test_XmlDumpScannerStart(self):
+        scanner = xmlreader.XmlDumpScanner(path + "/data/article-pear.xml",
+                                           xmlreader.TextFilter([u'Pear']),
+                                           processes=2, start=u'Pyrus')
+        self.assertEquals([], list(scanner))
+        self.assertEquals(0, scanner.count)
+
     def test_MediaWikiXmlHandler(self):
         handler = xmlreader.MediaWikiXmlHandler()
         pages = []
@@ -43,5 +94,72 @@ class XmlReaderTestCase(unittest.TestCase):
         self.assertEquals(4, len(pages))
         self.assertNotEquals("", pages[0].comment)
 
+
+class MultistreamTestCase(unittest.TestCase):
+    """Tests for multistream dumps built from the pages in data/"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dump = os.path.join(self.tmpdir, 'test-multistream.xml.bz2')
+        pages = []
+        for name in ('article-pear.xml', 'article-pyrus.xml'):
+            text = open(os.path.join(path, 'data', name)).read()
+            header, sep, rest = text.partition('<page>')
+            pages.append(sep + rest.rpartition('</mediawiki>')[0])
+        streams = [header] + pages + ['</mediawiki>\n']
+        f = open(self.dump, 'wb')
+        for stream in streams:
+            f.write(bz2.compress(stream))
+        f.close()
+        self.index = os.path.join(self.tmpdir,
+                                  'test-multistream-index.txt')
+        xmlreader.MultistreamIndex.build(self.dump, self.index)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_index(self):
+        self.assertEquals(self.index,
+                          xmlreader.MultistreamIndex.indexFilename(self.dump))
+        index = xmlreader.MultistreamIndex(self.index)
+        self.assertEquals(2, len(index))
+        self.assertEquals(1, index.block(u'Pyrus'))
+        self.assertEquals(None, index.block(u'Apple'))
+        self.assertEquals(u'Pear', index.firstTitle(0))
+        self.assertEquals([(0, 0), (1, 1)], index.blockRanges(2))
+
+    def test_read(self):
+        whole = xmlreader.MultistreamBZ2File(self.dump).read()
+        self.assertTrue(whole.endswith('</mediawiki>\n'))
+        f = xmlreader.MultistreamBZ2File(self.dump)
+        chunks = []
+        for size in [1, 7, 0, 300, 5000] * 100:
+            chunks.append(f.read(size))
+            self.assertTrue(len(chunks[-1]) <= size)
+        self.assertEquals(whole, ''.join(chunks))
+        self.assertEquals('', f.read())
+        f.close()
+
+    def test_parse(self):
+        pages = list(xmlreader.XmlDump(self.dump).parse())
+        self.assertEquals([u'Pear', u'Pyrus'], [p.title for p in pages])
+
+    def test_start(self):
+        pages = list(xmlreader.XmlDump(self.dump, start=u'Pyrus').parse())
+        self.assertEquals([u'Pyrus'], [p.title for p in pages])
+        self.assertTrue(pages[0].isredirect)
+
+    def test_blocks(self):
+        pages = list(xmlreader.XmlDump(self.dump, blocks=(0, 0)).parse())
+        self.assertEquals([u'Pear'], [p.title for p in pages])
+        self.assertTrue(pages[0].text.startswith('Pears are [[tree]]s of'))
+
+    def test_scanner(self):
+        scanner = xmlreader.XmlDumpScanner(self.dump,
+                                           xmlreader.TextFilter([u'.']),
+                                           processes=2, blocksPerTask=1)
+        self.assertEquals([u'Pear', u'Pyrus'], list(scanner))
+        self.assertEquals(2, scanner.count)
+
 if __name__ == '__main__':
     unittest.main()
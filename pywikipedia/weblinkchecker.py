@@ -2,7 +2,11 @@
 """
 This bot is used for checking external links found at the wiki. It checks
 several pages at once, with a limit set by the config variable
-max_external_links, which defaults to 50.
+max_external_links, which defaults to 50. Links found on several pages are
+checked only once per run, and the web servers are not asked for more than a
+few pages at the same time (see the config variables below). At the end of
+the run, the number of links checked per second and the response times of the
+busiest web servers are shown.
 
 The bot won't change any wiki pages, it will only report dead links such that
 people can fix or remove the links themselves.
@@ -62,6 +66,12 @@ max_external_links        - The maximum number of web pages that should be
                             is congested, and will then think that the page
                             is offline.
 
+max_external_links_per_host - The maximum number of web pages of the same
+                            host that should be loaded simultaneously.
+
+external_links_host_delay - The minimum time in seconds between the starts
+                            of two requests to the same host.
+
 report_dead_links_on_talk - If set to true, causes the script to report dead
                             links on the article's talk page if (and ONLY if)
                             the linked page has been unavailable at least two
@@ -94,10 +104,10 @@ Syntax examples:
 #
 __version__='$Id: weblinkchecker.py 10741 2012-11-18 20:22:23Z xqt $'
 
-import sys, re
+import sys, re, traceback
 import codecs, pickle
 import httplib, socket, urlparse, urllib, urllib2
-import threading, time
+import threading, time, Queue
 import pywikibot
 from pywikibot import i18n
 import config, pagegenerators
@@ -195,12 +205,17 @@ class LinkChecker(object):
     Warning: Also returns false if your Internet connection isn't working
     correctly! (This will give a Socket Error)
     '''
-    def __init__(self, url, redirectChain = [], serverEncoding=None, HTTPignore=[]):
+    def __init__(self, url, redirectChain = [], serverEncoding=None,
+                 HTTPignore=[], connections=None):
         """
         redirectChain is a list of redirects which were resolved by
         resolveRedirect(). This is needed to detect redirect loops.
+
+        If connections is a ConnectionPool, the connections to the servers
+        are taken from it and given back for the next requests.
         """
         self.url = url
+        self.connections = connections
         self.serverEncoding = serverEncoding
         self.header = {
             # 'User-agent': pywikibot.useragent,
@@ -219,6 +234,8 @@ class LinkChecker(object):
         self.HTTPignore = HTTPignore
 
     def getConnection(self):
+        if self.connections is not None:
+            return self.connections.get(self.scheme, self.host)
         if self.scheme == 'http':
             return httplib.HTTPConnection(self.host)
         elif self.scheme == 'https':
@@ -275,6 +292,46 @@ class LinkChecker(object):
             self.path = unicode(urllib.quote(self.path.encode(encoding)))
             self.query = unicode(urllib.quote(self.query.encode(encoding), '=&'))
 
+    def request(self, method):
+        '''
+        Sends a request for the page to the server and returns the response.
+
+        Without a ConnectionPool, a new connection is opened. Otherwise an
+        idle connection to the server is used if there is one; if the server
+        has closed it in the meantime, the request is sent again on a new
+        connection. The connection is given back to the pool once the
+        response has been read.
+        '''
+        if self.connections is None:
+            conn = self.getConnection()
+            conn.request(method, '%s%s' % (self.path, self.query), None,
+                         self.header)
+            return conn.getresponse()
+        start = time.time()
+        conn = self.getConnection()
+        try:
+            conn.request(method, '%s%s' % (self.path, self.query), None,
+                         self.header)
+            response = conn.getresponse()
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            if not conn.pwbReused:
+                self.connections.record(self.host, time.time() - start, False)
+                raise
+            start = time.time()
+            conn = self.connections.new(self.scheme, self.host)
+            try:
+                conn.request(method, '%s%s' % (self.path, self.query), None,
+                             self.header)
+                response = conn.getresponse()
+            except:
+                conn.close()
+                self.connections.record(self.host, time.time() - start, False)
+                raise
+        self.connections.record(self.host, time.time() - start, True)
+        self.connections.release(self.scheme, self.host, conn, response)
+        return response
+
     def resolveRedirect(self, useHEAD = False):
         '''
         Requests the header from the server. If the page is an HTTP redirect,
@@ -283,15 +340,12 @@ class LinkChecker(object):
         If useHEAD is true, uses the HTTP HEAD method, which saves bandwidth
         by not downloading the body. Otherwise, the HTTP GET method is used.
         '''
-        conn = self.getConnection()
         try:
             if useHEAD:
-                conn.request('HEAD', '%s%s' % (self.path, self.query), None,
-                             self.header)
+                self.method = 'HEAD'
             else:
-                conn.request('GET', '%s%s' % (self.path, self.query), None,
-                             self.header)
-            self.response = conn.getresponse()
+                self.method = 'GET'
+            self.response = self.request(self.method)
             # read the server's encoding, in case we need it later
             self.readEncodingFromResponse(self.response)
         except httplib.BadStatusLine:
@@ -379,7 +433,8 @@ class LinkChecker(object):
                     # we don't use HEAD, but GET requests.
                     redirChecker = LinkChecker(self.redirectChain[0],
                                                serverEncoding=self.serverEncoding,
-                                               HTTPignore=self.HTTPignore)
+                                               HTTPignore=self.HTTPignore,
+                                               connections=self.connections)
                     return redirChecker.check(useHEAD = False)
                 else:
                     urlList = ['[%s]' % url for url in self.redirectChain + [self.url]]
@@ -392,7 +447,8 @@ class LinkChecker(object):
                     # we don't use HEAD, but GET requests.
                     redirChecker = LinkChecker(self.redirectChain[0],
                                                serverEncoding=self.serverEncoding,
-                                               HTTPignore = self.HTTPignore)
+                                               HTTPignore=self.HTTPignore,
+                                               connections=self.connections)
                     return redirChecker.check(useHEAD = False)
                 else:
                     urlList = ['[%s]' % url for url in self.redirectChain + [self.url]]
@@ -400,60 +456,285 @@ class LinkChecker(object):
             else:
                 redirChecker = LinkChecker(self.url, self.redirectChain,
                                            self.serverEncoding,
-                                           HTTPignore=self.HTTPignore)
+                                           HTTPignore=self.HTTPignore,
+                                           connections=self.connections)
                 return redirChecker.check(useHEAD = useHEAD)
         else:
-            try:
-                conn = self.getConnection()
-            except httplib.error, error:
-                return False, u'HTTP Error: %s' % error.__class__.__name__
-            try:
-                conn.request('GET', '%s%s'
-                             % (self.path, self.query), None, self.header)
-            except socket.error, error:
-                return False, u'Socket Error: %s' % repr(error[1])
-            try:
-                self.response = conn.getresponse()
-            except Exception, error:
-                return False, u'Error: %s' % error
-            # read the server's encoding, in case we need it later
-            self.readEncodingFromResponse(self.response)
-            # site down if the server status is between 400 and 499
+            # The response to the request made by resolveRedirect() tells if
+            # the page is alive. Some servers refuse HEAD requests or answer
+            # them wrongly, so that pages which seem to be dead are loaded
+            # again with GET.
             alive = self.response.status not in range(400, 500)
             if self.response.status in self.HTTPignore:
                 alive = False
+            if self.method == 'HEAD' and not alive:
+                return self.check(useHEAD = False)
             return alive, '%s %s' % (self.response.status, self.response.reason)
 
-class LinkCheckThread(threading.Thread):
+class ConnectionPool(object):
     '''
-    A thread responsible for checking one URL. After checking the page, it
-    will die.
+    Keeps the connections to the web servers open, so that the next request
+    to the same server does not need to open a new one, and counts the
+    requests made to every host and the time it took to answer them.
     '''
-    def __init__(self, page, url, history, HTTPignore):
-        threading.Thread.__init__(self)
-        self.page = page
-        self.url = url
+    def __init__(self, maxIdle = 2, maxBody = 65536):
+        self.maxIdle = maxIdle
+        # the body of a response has to be read before the connection can be
+        # used again; connections with larger responses are closed instead.
+        self.maxBody = maxBody
+        self.lock = threading.Lock()
+        self.idle = {}
+        # host -> [requests, failed requests, total time, maximum time]
+        self.hosts = {}
+
+    def new(self, scheme, host):
+        if scheme == 'https':
+            conn = httplib.HTTPSConnection(host)
+        else:
+            conn = httplib.HTTPConnection(host)
+        conn.pwbReused = False
+        return conn
+
+    def get(self, scheme, host):
+        '''Returns an idle connection to the host, or a new one.'''
+        self.lock.acquire()
+        try:
+            idle = self.idle.get((scheme, host))
+            if idle:
+                conn = idle.pop()
+                conn.pwbReused = True
+                return conn
+        finally:
+            self.lock.release()
+        return self.new(scheme, host)
+
+    def release(self, scheme, host, conn, response):
+        '''Keeps the connection for the next request if the server allows
+        it, after reading the rest of the response.
+        '''
+        if response.will_close or response.length is None \
+           or response.length > self.maxBody:
+            conn.close()
+            return
+        try:
+            response.read()
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            return
+        self.lock.acquire()
+        try:
+            idle = self.idle.setdefault((scheme, host), [])
+            if len(idle) < self.maxIdle:
+                idle.append(conn)
+                conn = None
+        finally:
+            self.lock.release()
+        if conn is not None:
+            conn.close()
+
+    def record(self, host, seconds, success):
+        self.lock.acquire()
+        try:
+            stats = self.hosts.setdefault(host, [0, 0, 0.0, 0.0])
+            stats[0] += 1
+            if not success:
+                stats[1] += 1
+            stats[2] += seconds
+            stats[3] = max(stats[3], seconds)
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            for idle in self.idle.itervalues():
+                for conn in idle:
+                    conn.close()
+            self.idle = {}
+        finally:
+            self.lock.release()
+
+
+class LinkCheckEngine(object):
+    '''
+    Checks the URLs given to add() with a fixed number of worker threads
+    (config.max_external_links).
+
+    At most config.max_external_links_per_host URLs of a host are checked at
+    the same time, and the requests to a host start at least
+    config.external_links_host_delay seconds after each other; the workers
+    check the URLs of other hosts in the meantime. Every URL is checked only
+    once per run: if it is found on another page, the result is used for
+    that page as well. The pages are checked with HEAD requests, and loaded
+    with GET only if they seem to be dead.
+    '''
+    def __init__(self, history, HTTPignore = [], day = 7, workers = None,
+                 perHost = None, hostDelay = None):
         self.history = history
-        # identification for debugging purposes
-        self.setName((u'%s - %s' % (page.title(), url)).encode('utf-8', 'replace'))
         self.HTTPignore = HTTPignore
+        self.day = day
+        if workers is None:
+            workers = config.max_external_links
+        if perHost is None:
+            perHost = config.max_external_links_per_host
+        if hostDelay is None:
+            hostDelay = config.external_links_host_delay
+        self.perHost = perHost
+        self.hostDelay = hostDelay
+        self.connections = ConnectionPool(maxIdle = perHost)
+        self.lock = threading.Lock()
+        # don't let the generator run too far ahead of the workers
+        self.queue = Queue.Queue(2 * workers)
+        # url -> (alive, message) of the URLs which have been checked
+        self.results = {}
+        # url -> pages containing it, for the URLs which are being checked
+        self.checking = {}
+        # host -> number of workers checking URLs of the host
+        self.active = {}
+        # host -> URLs waiting for a worker of the host
+        self.waiting = {}
+        # host -> time of the next request to the host
+        self.nextRequest = {}
+        self.pending = 0
+        self.checked = 0
+        self.duplicates = 0
+        self.dead = 0
+        self.started = time.time()
+        for i in range(workers):
+            thread = threading.Thread(target = self.work,
+                                      name = 'LinkCheckEngine-%i' % i)
+            # thread dies when program terminates
+            thread.setDaemon(True)
+            thread.start()
 
-    def run(self):
-        linkChecker = LinkChecker(self.url, HTTPignore = self.HTTPignore)
+    def add(self, page, url):
+        '''Checks the URL found on the page.'''
+        self.lock.acquire()
         try:
-            ok, message = linkChecker.check()
+            self.pending += 1
+            if url in self.results:
+                self.duplicates += 1
+                result = self.results[url]
+            elif url in self.checking:
+                self.duplicates += 1
+                self.checking[url].append(page)
+                return
+            else:
+                self.checking[url] = [page]
+                result = None
+        finally:
+            self.lock.release()
+        if result is None:
+            self.queue.put(url)
+        else:
+            self.done(url, [page], result)
+
+    def work(self):
+        while True:
+            url = self.queue.get()
+            try:
+                host = urlparse.urlsplit(url)[1].lower()
+            except ValueError:
+                host = ''
+            self.lock.acquire()
+            if self.active.get(host, 0) >= self.perHost:
+                self.waiting.setdefault(host, []).append(url)
+                url = None
+            else:
+                self.active[host] = self.active.get(host, 0) + 1
+            self.lock.release()
+            # check the URLs of this host until none are waiting, so that a
+            # host never gets more workers than allowed.
+            while url is not None:
+                self.checkUrl(host, url)
+                self.lock.acquire()
+                waiting = self.waiting.get(host)
+                if waiting:
+                    url = waiting.pop(0)
+                else:
+                    url = None
+                    self.waiting.pop(host, None)
+                    self.active[host] -= 1
+                    if not self.active[host]:
+                        del self.active[host]
+                self.lock.release()
+
+    def checkUrl(self, host, url):
+        self.lock.acquire()
+        now = time.time()
+        start = max(now, self.nextRequest.get(host, 0))
+        self.nextRequest[host] = start + self.hostDelay
+        self.lock.release()
+        if start > now:
+            time.sleep(start - now)
+        try:
+            linkChecker = LinkChecker(url, HTTPignore = self.HTTPignore,
+                                      connections = self.connections)
+            result = linkChecker.check(useHEAD = True)
         except:
-            pywikibot.output('Exception while processing URL %s in page %s'
-                             % (self.url, self.page.title()))
-            raise
-        if ok:
-            if self.history.setLinkAlive(self.url):
-                pywikibot.output('*Link to %s in [[%s]] is back alive.'
-                                 % (self.url, self.page.title()))
+            pywikibot.output(u'Exception while processing URL %s' % url)
+            pywikibot.output(u''.join(
+                traceback.format_exception(*sys.exc_info())))
+            result = None
+        self.lock.acquire()
+        try:
+            pages = self.checking.pop(url)
+            if result is not None:
+                self.results[url] = result
+                self.checked += 1
+                if not result[0]:
+                    self.dead += 1
+        finally:
+            self.lock.release()
+        if result is None:
+            self.lock.acquire()
+            self.pending -= len(pages)
+            self.lock.release()
         else:
-            pywikibot.output('*[[%s]] links to %s - %s.'
-                             % (self.page.title(), self.url, message))
-            self.history.setLinkDead(self.url, message, self.page, day)
+            self.done(url, pages, result)
+
+    def done(self, url, pages, result):
+        ok, message = result
+        for page in pages:
+            try:
+                if ok:
+                    if self.history.setLinkAlive(url):
+                        pywikibot.output('*Link to %s in [[%s]] is back alive.'
+                                         % (url, page.title()))
+                else:
+                    pywikibot.output('*[[%s]] links to %s - %s.'
+                                     % (page.title(), url, message))
+                    self.history.setLinkDead(url, message, page, self.day)
+            finally:
+                self.lock.acquire()
+                self.pending -= 1
+                self.lock.release()
+
+    def statistics(self, hosts = 10):
+        '''
+        Returns lines with the throughput of the run and the latency of the
+        hosts which got the most requests.
+        '''
+        elapsed = time.time() - self.started
+        lines = [u'%i links checked, %i dead, %i duplicates in %.0f seconds '
+                 u'(%.1f links per second)'
+                 % (self.checked, self.dead, self.duplicates, elapsed,
+                    self.checked / max(elapsed, 0.001))]
+        self.connections.lock.acquire()
+        try:
+            stats = sorted(self.connections.hosts.iteritems(),
+                           key = lambda item: -item[1][0])
+        finally:
+            self.connections.lock.release()
+        for host, (requests, failed, total, longest) in stats[:hosts]:
+            lines.append(u'%s: %i requests, %i failed, %.0f ms average, '
+                         u'%.0f ms maximum'
+                         % (host, requests, failed, total * 1000 / requests,
+                            longest * 1000))
+        return lines
+
+    def close(self):
+        self.connections.close()
 
 
 class History:
@@ -673,10 +954,10 @@ class DeadLinkReportThread(threading.Thread):
 
 class WeblinkCheckerRobot:
     '''
-    Robot which will use several LinkCheckThreads at once to search for dead
-    weblinks on pages provided by the given generator.
+    Robot which will use a LinkCheckEngine to search for dead weblinks on
+    pages provided by the given generator.
     '''
-    def __init__(self, generator, HTTPignore = []):
+    def __init__(self, generator, HTTPignore = [], day = 7):
         self.generator = generator
         if config.report_dead_links_on_talk:
             #pywikibot.output("Starting talk page thread")
@@ -688,6 +969,7 @@ class WeblinkCheckerRobot:
             reportThread = None
         self.history = History(reportThread)
         self.HTTPignore = HTTPignore
+        self.engine = LinkCheckEngine(self.history, HTTPignore, day)
 
     def run(self):
         for page in self.generator:
@@ -705,16 +987,7 @@ class WeblinkCheckerRobot:
                 if ignoreR.match(url):
                     ignoreUrl = True
             if not ignoreUrl:
-                # Limit the number of threads started at the same time. Each
-                # thread will check one page, then die.
-                while threading.activeCount() >= config.max_external_links:
-                    # wait 100 ms
-                    time.sleep(0.1)
-                thread = LinkCheckThread(page, url, self.history,
-                                         self.HTTPignore)
-                # thread dies when program terminates
-                thread.setDaemon(True)
-                thread.start()
+                self.engine.add(page, url)
 
 
 def RepeatPageGenerator():
@@ -730,13 +1003,6 @@ def RepeatPageGenerator():
         page = pywikibot.Page(pywikibot.getSite(), pageTitle)
         yield page
 
-def countLinkCheckThreads():
-    i = 0
-    for thread in threading.enumerate():
-        if isinstance(thread, LinkCheckThread):
-            i += 1
-    return i
-
 def check(url):
     """Peform a check on URL"""
     c = LinkChecker(url)
@@ -790,26 +1056,29 @@ def main():
         pageNumber = max(240, config.max_external_links * 2)
         gen = pagegenerators.PreloadingGenerator(gen, pageNumber = pageNumber)
         gen = pagegenerators.RedirectFilterPageGenerator(gen)
-        bot = WeblinkCheckerRobot(gen, HTTPignore)
+        bot = WeblinkCheckerRobot(gen, HTTPignore, day)
         try:
             bot.run()
         finally:
             waitTime = 0
-            # Don't wait longer than 30 seconds for threads to finish.
-            while countLinkCheckThreads() > 0 and waitTime < 30:
+            # Don't wait longer than 30 seconds for the links to be checked.
+            while bot.engine.pending > 0 and waitTime < 30:
                 try:
                     pywikibot.output(
-                        u"Waiting for remaining %i threads to finish, please wait..." % countLinkCheckThreads())
+                        u"Waiting for remaining %i links to be checked, please wait..." % bot.engine.pending)
                     # wait 1 second
                     time.sleep(1)
                     waitTime += 1
                 except KeyboardInterrupt:
                     pywikibot.output(u'Interrupted.')
                     break
-            if countLinkCheckThreads() > 0:
-                pywikibot.output(u'Remaining %i threads will be killed.'
-                                 % countLinkCheckThreads())
+            if bot.engine.pending > 0:
+                pywikibot.output(u'Remaining %i links will not be checked.'
+                                 % bot.engine.pending)
                 # Threads will die automatically because they are daemonic.
+            bot.engine.close()
+            for line in bot.engine.statistics():
+                pywikibot.output(line)
             if bot.history.reportThread:
                 bot.history.reportThread.shutdown()
                 # wait until the report thread is shut down; the user can
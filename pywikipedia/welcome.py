@@ -188,6 +188,7 @@ from random import choice
 from string import capitalize
 import wikipedia as pywikibot
 from pywikibot import i18n
+from pywikibot.tools import MultiMatcher
 import config, query, userlib
 
 locale.setlocale(locale.LC_ALL, '')
@@ -438,6 +439,27 @@ class WelcomeBot(object):
         if not globalvar.filtBadName:
             return False
 
+        self.loadWordLists(force)
+        # remove the whitelisted words, then look for any bad word
+        text = name.lower()
+        if self._whiteMatcher.search(text):
+            keep = [True] * len(text)
+            for start, end, wname in self._whiteMatcher.finditer(text):
+                keep[start:end] = [False] * (end - start)
+            text = u''.join([c for c, k in zip(text, keep) if k])
+        match = self._blackMatcher.search(text)
+        if match: #bad name positive
+            self.bname[name] = match[2]
+            return True
+        return False
+
+    def loadWordLists(self, force = False):
+        """Load the bad word list and the whitelist and compile them into
+        matchers, unless they are loaded already."""
+        if not hasattr(self, '_blacklist') or not hasattr(self, '_whitelist') \
+           or force:
+            self._wordListRevisions = self.wordListRevisions()
+
         #initialize blacklist
         if not hasattr(self, '_blacklist') or force:
             elenco = [
@@ -452,7 +474,7 @@ class WelcomeBot(object):
                 'fellatio', 'fica ', 'ficken', 'figa', 'sfiga', 'fottere', 'fotter',
                 'fottuto', 'fuck', 'f.u.c.k.', "funkyass",
                 'gay', 'hentai.com', 'horne', 'horney', 'virgin', 'hotties', 'idiot',
-                '@alice.it', 'incest', 'jesus', 'gesu', 'gesù', 'kazzo', 'kill',
+                '@alice.it', 'incest', 'jesus', 'gesu', u'gesù', 'kazzo', 'kill',
                 'leccaculo', 'lesbian', 'lesbica', 'lesbo', 'masturbazione',
                 'masturbare', 'masturbo', 'merda', 'merdata', 'merdoso', 'mignotta',
                 'minchia', 'minkia', 'minchione', 'mona', 'nudo', 'nuda', 'nudi',
@@ -483,6 +505,8 @@ class WelcomeBot(object):
                 pywikibot.output(u'The bad word page doesn\'t exist!')
             self._blacklist = elenco + elenco_others + list_loaded
             del elenco, elenco_others, list_loaded
+            self._blackMatcher = MultiMatcher(self._blacklist,
+                                              ignoreCase = True)
 
         if not hasattr(self, '_whitelist') or force:
             #initialize whitelist
@@ -504,24 +528,29 @@ class WelcomeBot(object):
             # Join the whitelist words.
             self._whitelist = list_white + whitelist_default
             del list_white, whitelist_default
+            self._whiteMatcher = MultiMatcher(self._whitelist,
+                                              ignoreCase = True)
 
+    def wordListRevisions(self):
+        """Return the latest revision ids of the bad word and whitelist pages,
+        or None if they cannot be queried."""
+        if not self.site.has_api():
+            return None
+        titles = [pywikibot.translate(self.site, bad_pag)]
+        wtlpg = pywikibot.translate(self.site, whitelist_pg)
+        if wtlpg:
+            titles.append(wtlpg)
+        params = {
+            'action': 'query',
+            'prop': 'info',
+            'titles': titles,
+        }
         try:
-            for wname in self._whitelist:
-                if wname.lower() in str(name).lower():
-                    name = name.lower().replace(wname.lower(), '')
-                    for bname in self._blacklist:
-                        self.bname[name] = bname
-                        return bname.lower() in name.lower()
-        except UnicodeEncodeError:
-            pass
-        try:
-            for bname in self._blacklist:
-                if bname.lower() in str(name).lower(): #bad name positive
-                    self.bname[name] = bname
-                    return True
-        except UnicodeEncodeError:
-            pass
-        return False
+            data = query.GetData(params, self.site)
+            return sorted([(page['title'], page.get('lastrevid'))
+                           for page in data['query']['pages'].values()])
+        except (pywikibot.Error, KeyError):
+            return None
 
     def reportBadAccount(self, name = None, final = False):
         #Queue process
@@ -741,6 +770,13 @@ class WelcomeBot(object):
     def run(self):
         while True:
             welcomed_count = 0
+            if globalvar.filtBadName and hasattr(self, '_wordListRevisions'):
+                # rebuild the matchers if the word list pages were changed
+                # since the last round
+                revisions = self.wordListRevisions()
+                if revisions != self._wordListRevisions:
+                    pywikibot.output(u'The bad word lists have been changed.')
+                    self.loadWordLists(True)
             if globalvar.quick and self.site.has_api():
                 us = [x for x in self.parseNewUserLog()]
                 showStatus()
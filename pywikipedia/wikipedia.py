@@ -179,6 +179,185 @@ Rwatchlist = re.compile(r"<input tabindex='[\d]+' type='checkbox' "
 Rlink = re.compile(r'\[\[(?P<title>[^\]\|\[]*)(\|[^\]]*)?\]\]')
 
 
+def _parseTitle(site, title, insite, defaultNamespace):
+    """Return the site, namespace, normalized title and section of a title.
+
+    The title may have a namespace or interwiki prefix; see Page.__init__().
+
+    """
+    # Clean up the name, it can come from anywhere.
+    # Convert HTML entities to unicode
+    t = html2unicode(title)
+
+    # Convert URL-encoded characters to unicode
+    # Sometimes users copy the link to a site from one to another.
+    # Try both the source site and the destination site to decode.
+    try:
+        t = url2unicode(t, site=insite, site2=site)
+    except UnicodeDecodeError:
+        raise InvalidTitle(u'Bad page title : %s' % t)
+
+    # Normalize unicode string to a NFC (composed) format to allow
+    # proper string comparisons. According to
+    # http://svn.wikimedia.org/viewvc/mediawiki/branches/REL1_6/phase3/includes/normal/UtfNormal.php?view=markup
+    # the mediawiki code normalizes everything to NFC, not NFKC
+    # (which might result in information loss).
+    t = unicodedata.normalize('NFC', t)
+
+    if u'\ufffd' in t:
+        raise InvalidTitle("Title contains illegal char (\\uFFFD)")
+
+    # Replace underscores by spaces
+    t = t.replace(u"_", u" ")
+    # replace multiple spaces a single space
+    while u"  " in t: t = t.replace(u"  ", u" ")
+    # Strip spaces at both ends
+    t = t.strip()
+    # Remove left-to-right and right-to-left markers.
+    t = t.replace(u'\u200e', '').replace(u'\u200f', '')
+
+    if t.startswith(':'):
+        t = t[1:]
+        prefix = True
+    else:
+        prefix = False
+    namespace = defaultNamespace
+
+    #
+    # This code was adapted from Title.php : secureAndSplit()
+    #
+    # Namespace or interwiki prefix
+    while True:
+        m = reNamespace.match(t)
+        if not m:
+            # leading colon implies main namespace instead of default
+            if t.startswith(':'):
+                t = t[1:]
+                namespace = 0
+            elif prefix:
+                namespace = 0
+            else:
+                namespace = defaultNamespace
+            break
+        prefix = False
+        p = m.group(1)
+        lowerNs = p.lower()
+        ns = site.getNamespaceIndex(lowerNs)
+        if ns:
+            t = m.group(2)
+            namespace = ns
+            break
+
+        if lowerNs in site.family.langs:
+            # Interwiki link
+            t = m.group(2)
+
+            # Redundant interwiki prefix to the local wiki
+            if lowerNs == site.lang:
+                if t == '':
+                    raise Error("Can't have an empty self-link")
+            else:
+                site = getSite(lowerNs, site.family.name)
+                if t == '':
+                    t = site.mediawiki_message('Mainpage')
+
+        elif lowerNs in site.family.get_known_families(site = site):
+            familyName = site.family.get_known_families(site=site)[lowerNs]
+            if familyName == site.family.name:
+                t = m.group(2)
+            else:
+                # This page is from a different family
+                if verbose:
+                    output(u"Target link '%s' has different family '%s'" % (title, lowerNs))
+                if site.family.name in ['commons', 'meta']:
+                    #When the source wiki is commons or meta,
+                    #w:page redirects you to w:en:page
+                    otherlang = 'en'
+                else:
+                    otherlang = site.lang
+                if familyName in ['commons', 'meta']:
+                    otherlang = familyName
+                try:
+                    site = getSite(otherlang, familyName)
+                except ValueError:
+                    raise NoPage("""\
+%s is not a local page on %s, and the %s family is
+not supported by PyWikipediaBot!"""
+                      % (title, site, familyName))
+                t = m.group(2)
+        else:
+            # If there's no recognized interwiki or namespace,
+            # then let the colon expression be part of the title.
+            break
+
+    if not t:
+        raise InvalidTitle(u"Invalid title '%s'" % title )
+
+    sectionStart = t.find(u'#')
+    # But maybe there are magic words like {{#time|}}
+    # TODO: recognize magic word and templates inside links
+    # see http://la.wikipedia.org/w/index.php?title=997_Priska&diff=prev&oldid=1038880
+    if sectionStart > 0:
+        # Categories does not have sections.
+        if namespace == 14:
+            raise InvalidTitle(u"Invalid section in category '%s'" % t)
+        else:
+            t, sec = t.split(u'#', 1)
+            section = sec.lstrip() or None
+            t = t.rstrip()
+    elif sectionStart == 0:
+        raise InvalidTitle(u"Invalid title starting with a #: '%s'" % t)
+    else:
+        section = None
+
+    if t:
+        if not site.nocapitalize:
+            t = t[:1].upper() + t[1:]
+
+    # reassemble the title from its parts
+    if namespace != 0:
+        t = u'%s:%s' % (site.namespace(namespace), t)
+    if section:
+        t += u'#' + section
+
+    return site, namespace, t, section
+
+# title parsing results, see Page.__init__()
+from pywikibot.tools import LRUCache
+if config.page_title_cache_size > 0:
+    _titleCache = LRUCache(config.page_title_cache_size)
+else:
+    _titleCache = None
+# (site, title) -> Page, see Page.__new__()
+if config.page_intern_pool:
+    _pagePool = weakref.WeakValueDictionary()
+else:
+    _pagePool = None
+
+def _cachedTitle(site, title, insite, defaultNamespace):
+    """Return _parseTitle(site, title, insite, defaultNamespace), cached."""
+    if _titleCache is None:
+        return _parseTitle(site, title, insite, defaultNamespace)
+    key = (site, insite, title, defaultNamespace)
+    parsed = _titleCache.get(key)
+    if parsed is None:
+        parsed = _parseTitle(site, title, insite, defaultNamespace)
+        _titleCache.put(key, parsed)
+    return parsed
+
+def _pooledPage(site, title=None, insite=None, defaultNamespace=0):
+    """Return the Page from _pagePool for these arguments, or None."""
+    if site is None or isinstance(site, basestring):
+        site = getSite(site)
+    try:
+        parsed = _cachedTitle(site, title, insite or site, defaultNamespace)
+    except Error:
+        # let Page.__init__ raise it
+        return None
+    return _pagePool.get((parsed[0], parsed[2]))
+
+
+
 # Page objects (defined here) represent the page itself, including its contents.
 class Page(object):
     """Page: A MediaWiki page
@@ -270,10 +449,23 @@ class Page(object):
           even reload it if it has been loaded before
 
     """
+    def __new__(cls, *args, **kwargs):
+        # With config.page_intern_pool, a Page which is still in use is
+        # returned instead of a new one with the same site and title, so that
+        # the contents loaded for it are shared.
+        if _pagePool is not None and cls is Page and args:
+            page = _pooledPage(*args, **kwargs)
+            if page is not None:
+                return page
+        return object.__new__(cls)
+
     def __init__(self, site, title, insite=None, defaultNamespace=0):
         """Instantiate a Page object.
 
         """
+        if '_interned' in self.__dict__:
+            # an existing Page from the pool, see __new__
+            return
         try:
             # if _editrestriction is True, it means that the page has been found
             # to have an edit restriction, but we do not know yet whether the
@@ -282,147 +474,15 @@ class Page(object):
 
             if site is None or isinstance(site, basestring):
                 site = getSite(site)
-            self._site = site
 
             if not insite:
                 insite = site
 
-            # Clean up the name, it can come from anywhere.
-            # Convert HTML entities to unicode
-            t = html2unicode(title)
-
-            # Convert URL-encoded characters to unicode
-            # Sometimes users copy the link to a site from one to another.
-            # Try both the source site and the destination site to decode.
-            try:
-                t = url2unicode(t, site=insite, site2=site)
-            except UnicodeDecodeError:
-                raise InvalidTitle(u'Bad page title : %s' % t)
-
-            # Normalize unicode string to a NFC (composed) format to allow
-            # proper string comparisons. According to
-            # http://svn.wikimedia.org/viewvc/mediawiki/branches/REL1_6/phase3/includes/normal/UtfNormal.php?view=markup
-            # the mediawiki code normalizes everything to NFC, not NFKC
-            # (which might result in information loss).
-            t = unicodedata.normalize('NFC', t)
-
-            if u'\ufffd' in t:
-                raise InvalidTitle("Title contains illegal char (\\uFFFD)")
-
-            # Replace underscores by spaces
-            t = t.replace(u"_", u" ")
-            # replace multiple spaces a single space
-            while u"  " in t: t = t.replace(u"  ", u" ")
-            # Strip spaces at both ends
-            t = t.strip()
-            # Remove left-to-right and right-to-left markers.
-            t = t.replace(u'\u200e', '').replace(u'\u200f', '')
-
-            if t.startswith(':'):
-                t = t[1:]
-                prefix = True
-            else:
-                prefix = False
-            self._namespace = defaultNamespace
-
-            #
-            # This code was adapted from Title.php : secureAndSplit()
-            #
-            # Namespace or interwiki prefix
-            while True:
-                m = reNamespace.match(t)
-                if not m:
-                    # leading colon implies main namespace instead of default
-                    if t.startswith(':'):
-                        t = t[1:]
-                        self._namespace = 0
-                    elif prefix:
-                        self._namespace = 0
-                    else:
-                        self._namespace = defaultNamespace
-                    break
-                prefix = False
-                p = m.group(1)
-                lowerNs = p.lower()
-                ns = self._site.getNamespaceIndex(lowerNs)
-                if ns:
-                    t = m.group(2)
-                    self._namespace = ns
-                    break
-
-                if lowerNs in self._site.family.langs.keys():
-                    # Interwiki link
-                    t = m.group(2)
-
-                    # Redundant interwiki prefix to the local wiki
-                    if lowerNs == self._site.lang:
-                        if t == '':
-                            raise Error("Can't have an empty self-link")
-                    else:
-                        self._site = getSite(lowerNs, self._site.family.name)
-                        if t == '':
-                            t = self._site.mediawiki_message('Mainpage')
-
-                elif lowerNs in self._site.family.get_known_families(site = self._site):
-                    if self._site.family.get_known_families(site = self._site)[lowerNs] == self._site.family.name:
-                        t = m.group(2)
-                    else:
-                        # This page is from a different family
-                        if verbose:
-                            output(u"Target link '%s' has different family '%s'" % (title, lowerNs))
-                        if self._site.family.name in ['commons', 'meta']:
-                            #When the source wiki is commons or meta,
-                            #w:page redirects you to w:en:page
-                            otherlang = 'en'
-                        else:
-                            otherlang = self._site.lang
-                        familyName = self._site.family.get_known_families(site=self._site)[lowerNs]
-                        if familyName in ['commons', 'meta']:
-                            otherlang = familyName
-                        try:
-                            self._site = getSite(otherlang, familyName)
-                        except ValueError:
-                            raise NoPage("""\
-%s is not a local page on %s, and the %s family is
-not supported by PyWikipediaBot!"""
-                              % (title, self._site, familyName))
-                        t = m.group(2)
-                else:
-                    # If there's no recognized interwiki or namespace,
-                    # then let the colon expression be part of the title.
-                    break
-
-            if not t:
-                raise InvalidTitle(u"Invalid title '%s'" % title )
-
-            sectionStart = t.find(u'#')
-            # But maybe there are magic words like {{#time|}}
-            # TODO: recognize magic word and templates inside links
-            # see http://la.wikipedia.org/w/index.php?title=997_Priska&diff=prev&oldid=1038880
-            if sectionStart > 0:
-                # Categories does not have sections.
-                if self._namespace == 14:
-                    raise InvalidTitle(u"Invalid section in category '%s'" % t)
-                else:
-                    t, sec = t.split(u'#', 1)
-                    self._section = sec.lstrip() or None
-                    t = t.rstrip()
-            elif sectionStart == 0:
-                raise InvalidTitle(u"Invalid title starting with a #: '%s'" % t)
-            else:
-                self._section = None
-
-            if t:
-                if not self._site.nocapitalize:
-                    t = t[:1].upper() + t[1:]
-
-            # reassemble the title from its parts
-            if self._namespace != 0:
-                t = u'%s:%s' % (self._site.namespace(self._namespace), t)
-            if self._section:
-                t += u'#' + self._section
-
-            self._title = t
+            # Parsing the title is the costly part of creating a Page, and
+            # generators often create Pages for the same titles again.
+            (self._site, self._namespace,
+             self._title, self._section) = _cachedTitle(site, title, insite,
+                                                        defaultNamespace)
             self.editRestriction = None
             self.moveRestriction = None
             self._permalink = None
@@ -434,6 +494,9 @@ not supported by PyWikipediaBot!"""
             # For the Flagged Revisions MediaWiki extension
             self._revisionId = None
             self._deletedRevs = None
+            if _pagePool is not None and type(self) is Page:
+                self._interned = True
+                _pagePool[(self._site, self._title)] = self
         except NoSuchSite:
             raise
         except:
@@ -790,26 +853,35 @@ not supported by PyWikipediaBot!"""
         if expandtemplates:
             params[u'rvexpandtemplates'] = u''
 
+        store = None
+        if not oldid and not expandtemplates:
+            store = contentStore()
         if throttle:
-            get_throttle()
+            get_throttle(site=self.site())
         textareaFound = False
-        # retrying loop is done by query.GetData
-        data = query.GetData(params, self.site(), sysop=sysop)
-        if 'error' in data:
-            raise RuntimeError("API query error: %s" % data)
-        if not 'pages' in data['query']:
-            raise RuntimeError("API query error, no pages found: %s" % data)
-        pageInfo = data['query']['pages'].values()[0]
-        if data['query']['pages'].keys()[0] == "-1":
-            if 'missing' in pageInfo:
-                raise NoPage(self.site(), unicode(self),
-"Page does not exist. In rare cases, if you are certain the page does exist, look into overriding family.RversionTab")
-            elif 'invalid' in pageInfo:
-                raise BadTitle('BadTitle: %s' % self)
-        elif 'revisions' in pageInfo: #valid Title
-            lastRev = pageInfo['revisions'][0]
-            if isinstance(lastRev['*'], basestring):
+        lastRev = None
+        if store is not None:
+            # ask for the latest revision id only; the text is taken from
+            # the store if it has that revision
+            infoParams = params.copy()
+            infoParams['prop'] = ['info']
+            del infoParams['rvprop'], infoParams['rvlimit']
+            pageInfo = self._queryPageInfo(infoParams, sysop)
+            if 'lastrevid' in pageInfo:
+                lastRev = store.get(self.site(), pageInfo['title'],
+                                    pageInfo['lastrevid'])
+            if lastRev is not None:
                 textareaFound = True
+            elif throttle:
+                get_throttle(site=self.site())
+        if lastRev is None:
+            pageInfo = self._queryPageInfo(params, sysop)
+            if 'revisions' in pageInfo: #valid Title
+                lastRev = pageInfo['revisions'][0]
+                if isinstance(lastRev['*'], basestring):
+                    textareaFound = True
+                    if store is not None:
+                        store.put(self.site(), pageInfo['title'], lastRev)
         # I got page date with 'revisions' in pageInfo but
         # lastRev['*'] = False instead of the content. The Page itself was
         # deleted but there was not 'missing' in pageInfo as expected
@@ -870,6 +942,27 @@ not supported by PyWikipediaBot!"""
                 raise SectionError # Page has no section by this name
         return pagetext
 
+    def _queryPageInfo(self, params, sysop):
+        """Query the API for this page and return its part of the result.
+
+        Raise NoPage if the page does not exist.
+
+        """
+        # retrying loop is done by query.GetData
+        data = query.GetData(params, self.site(), sysop=sysop)
+        if 'error' in data:
+            raise RuntimeError("API query error: %s" % data)
+        if not 'pages' in data['query']:
+            raise RuntimeError("API query error, no pages found: %s" % data)
+        pageInfo = data['query']['pages'].values()[0]
+        if data['query']['pages'].keys()[0] == "-1":
+            if 'missing' in pageInfo:
+                raise NoPage(self.site(), unicode(self),
+"Page does not exist. In rare cases, if you are certain the page does exist, look into overriding family.RversionTab")
+            elif 'invalid' in pageInfo:
+                raise BadTitle('BadTitle: %s' % self)
+        return pageInfo
+
     def _getEditPageOld(self, get_redirect=False, throttle=True, sysop=False,
                      oldid=None, change_edit_time=True):
         """Get the contents of the Page via the edit page."""
@@ -882,7 +975,7 @@ not supported by PyWikipediaBot!"""
         # Make sure Brion doesn't get angry by waiting if the last time a page
         # was retrieved was not long enough ago.
         if throttle:
-            get_throttle()
+            get_throttle(site=self.site())
         textareaFound = False
         retry_idle_time = 1
         while not textareaFound:
@@ -1070,7 +1163,7 @@ not supported by PyWikipediaBot!"""
             u'prop'   : u'sections',
         }
 
-        pywikibot.get_throttle()
+        pywikibot.get_throttle(site=self.site())
         pywikibot.output(u"Reading section info from %s via API..." % self.title(asLink=True))
 
         result = query.GetData(params, self.site())
@@ -1180,7 +1273,7 @@ not supported by PyWikipediaBot!"""
                 u'rvsection' : section[u'index'],
             }
 
-            pywikibot.get_throttle()
+            pywikibot.get_throttle(site=self.site())
             pywikibot.output(u"  Reading section %s from %s via API..." % (section[u'index'], self.title(asLink=True)))
 
             result = query.GetData(params, self.site())
@@ -1786,7 +1879,7 @@ not supported by PyWikipediaBot!"""
         refPages = set()
         while path:
             output(u'Getting references to %s' % self.title(asLink=True))
-            get_throttle()
+            get_throttle(site=self.site())
             txt = self.site().getUrl(path)
             body = BeautifulSoup(txt,
                                  convertEntities=BeautifulSoup.HTML_ENTITIES,
@@ -1943,32 +2036,32 @@ not supported by PyWikipediaBot!"""
 
     def put_async(self, newtext,
                   comment=None, watchArticle=None, minorEdit=True, force=False,
-                  callback=None):
+                  callback=None, resultCallback=None):
         """Put page on queue to be saved to wiki asynchronously.
 
         Asynchronous version of put (takes the same arguments), which places
-        pages on a queue to be saved by a daemon thread. All arguments  are
-        the same as for .put(), except --
+        pages on a queue to be saved by daemon threads, see
+        pywikibot.putqueue. All arguments  are the same as for .put(),
+        except --
 
         callback: a callable object that will be called after the page put
                   operation; this object must take two arguments:
                   (1) a Page object, and (2) an exception instance, which
                   will be None if the page was saved successfully.
+        resultCallback: a callable object that will be called after the page
+                  put operation with one argument, a putqueue.PutRequest
+                  which has the page, the error and the timing of the save.
 
         The callback is intended to be used by bots that need to keep track
         of which saves were successful.
 
+        If the page is put again before this save has been started, only the
+        last text is saved, and both callbacks are called after that.
+
         """
-        try:
-            page_put_queue.mutex.acquire()
-            try:
-                _putthread.start()
-            except (AssertionError, RuntimeError):
-                pass
-        finally:
-            page_put_queue.mutex.release()
-        page_put_queue.put((self, newtext, comment, watchArticle, minorEdit,
-                            force, callback))
+        page_put_queue.put(putqueue.PutRequest(self, newtext, comment,
+                                               watchArticle, minorEdit, force,
+                                               callback, resultCallback))
 
     def put(self, newtext, comment=None, watchArticle=None, minorEdit=True,
             force=False, sysop=False, botflag=True, maxTries=-1):
@@ -2153,7 +2246,7 @@ u'Page %s is semi-protected. Getting edit page to find out if we are allowed to
             # Check whether we are not too quickly after the previous
             # putPage, and wait a bit until the interval is acceptable
             if not dblagged:
-                put_throttle()
+                put_throttle(site=self.site())
             # Which web-site host are we submitting to?
             if newPage:
                 output(u'Creating page %s via API' % self.title(asLink=True))
@@ -2234,7 +2327,8 @@ u'Page %s is semi-protected. Getting edit page to find out if we are allowed to
                     timelag = int(lag.group("lag"))
                     output(u"Pausing %d seconds due to database server lag." % min(timelag,300))
                     dblagged = True
-                    time.sleep(min(timelag,300))
+                    # let the other requests to the server wait, too
+                    put_throttle.backoff(min(timelag, 300), self.site())
                     continue
                 elif errorCode == 'editconflict':
                     # 'editconflict':"Edit conflict detected",
@@ -2386,7 +2480,7 @@ u'Page %s is semi-protected. Getting edit page to find out if we are allowed to
             # Check whether we are not too quickly after the previous
             # putPage, and wait a bit until the interval is acceptable
             if not dblagged:
-                put_throttle()
+                put_throttle(site=self.site())
             # Which web-site host are we submitting to?
             if newPage:
                 output(u'Creating page %s' % self.title(asLink=True))
@@ -2403,7 +2497,7 @@ u'Page %s is semi-protected. Getting edit page to find out if we are allowed to
                             output(data, newline=False)
                         output(u"Pausing %d seconds due to database server lag." % wait)
                         dblagged = True
-                        time.sleep(wait)
+                        put_throttle.backoff(wait, self.site())
                         wait = min(wait*2, 300)
                         continue
                     # Squid error 503
@@ -3113,7 +3207,7 @@ u'Page %s is semi-protected. Getting edit page to find out if we are allowed to
                 'action': 'submit',
                 'pages': self.title()
             }
-            get_throttle(requestsize = 10)
+            get_throttle(requestsize=10, site=self.site())
             now = time.time()
             response, data = self.site().postForm(address, predata)
             data = data.encode(self.site().encoding())
@@ -3236,7 +3330,7 @@ u'Page %s is semi-protected. Getting edit page to find out if we are allowed to
         self.site().checkBlocks(sysop = sysop)
 
         if throttle:
-            put_throttle()
+            put_throttle(site=self.site())
         if reason is None:
             pywikibot.output(u'Moving %s to [[%s]].'
                              % (self.title(asLink=True), newtitle))
@@ -3309,7 +3403,7 @@ u'Page %s is semi-protected. Getting edit page to find out if we are allowed to
         self.site().checkBlocks(sysop = sysop)
 
         if throttle:
-            put_throttle()
+            put_throttle(site=self.site())
         if reason is None:
             reason = input(u'Please enter a reason for the move:')
         if self.isTalkPage():
@@ -3431,7 +3525,7 @@ u'Page %s is semi-protected. Getting edit page to find out if we are allowed to
         self.site().checkBlocks(sysop = True)
 
         if throttle:
-            put_throttle()
+            put_throttle(site=self.site())
         if reason is None:
             output(u'Deleting %s.' % (self.title(asLink=True)))
             reason = input(u'Please enter a reason for the deletion:')
@@ -3650,7 +3744,7 @@ u'Page %s is semi-protected. Getting edit page to find out if we are allowed to
             comment = input(u'Please enter a reason for the undeletion:')
 
         if throttle:
-            put_throttle()
+            put_throttle(site=self.site())
 
         if self.site().has_api() and self.site().versionnumber() >= 12:
             params = {
@@ -3726,7 +3820,7 @@ u'Page %s is semi-protected. Getting edit page to find out if we are allowed to
         else:
             editcreate, move = editcreate.lower(), move.lower()
         if throttle:
-            put_throttle()
+            put_throttle(site=self.site())
         if reason is None:
             reason = input(
               u'Please enter a reason for the change of the protection level:')
@@ -3987,7 +4081,7 @@ u'Page %s is semi-protected. Getting edit page to find out if we are allowed to
             u'titles'    : self.title(),
         }
 
-        pywikibot.get_throttle()
+        pywikibot.get_throttle(site=self.site())
         pywikibot.output(u"Purging page cache for %s." % self.title(asLink=True))
 
         result = query.GetData(params, self.site())
@@ -4097,7 +4191,7 @@ class DataPage(Page):
             # Check whether we are not too quickly after the previous
             # putPage, and wait a bit until the interval is acceptable
             if not dblagged:
-                put_throttle()
+                put_throttle(site=self.site())
             # Which web-site host are we submitting to?
             if newPage:
                 output(u'Creating page %s via API' % self)
@@ -4201,7 +4295,7 @@ class DataPage(Page):
             # Check whether we are not too quickly after the previous
             # putPage, and wait a bit until the interval is acceptable
             if not dblagged:
-                put_throttle()
+                put_throttle(site=self.site())
             output(u'Creating page %s via API' % self._originTitle)
             params['createonly'] = 1
             try:
@@ -4929,6 +5023,39 @@ class _GetAll(object):
                 self.pages.append(page)
             elif verbose:
                 output(u"BUGWARNING: %s already done!" % page.title(asLink=True))
+        # sectionFreeTitle -> the requested pages with that title; there
+        # might be duplicates in the pages list
+        self._index = {}
+        for page in self.pages:
+            self._index.setdefault(page.sectionFreeTitle(), []).append(page)
+        self.store = None
+        if site.has_api() and site.versionnumber() >= 12:
+            self.store = contentStore()
+        # titles of the pages which were taken from the store
+        self._stored = set()
+
+    def _pagesFor(self, title):
+        """Return the requested pages which have the title the wiki sent."""
+        pages = self._index.get(title)
+        if pages is None:
+            # The wiki sends normalized titles, which are the keys of the
+            # index unless a page was requested with another spelling.
+            pages = self._index.get(Page(self.site, title).sectionFreeTitle(),
+                                    [])
+        return pages
+
+    def _normalize(self, normalized):
+        """Rename the requested pages as the API has normalized them."""
+        for item in normalized:
+            pages = self._index.pop(item['from'], None)
+            if pages is None:
+                continue
+            for page in pages:
+                if page.section():
+                    page._title = u'%s#%s' % (item['to'], page.section())
+                else:
+                    page._title = item['to']
+            self._index.setdefault(item['to'], []).extend(pages)
 
     def sleep(self):
         time.sleep(self.sleeptime)
@@ -4937,7 +5064,52 @@ class _GetAll(object):
         elif self.sleeptime < 360:
             self.sleeptime += 60
 
+    def loadStored(self):
+        """Take the pages whose latest revision is in the content store
+        from there, and leave only the others to be loaded from the wiki.
+
+        """
+        params = {
+            'action': 'query',
+            'prop': 'info',
+            'titles': [page.sectionFreeTitle() for page in self.pages],
+            'inprop': ['protection'],
+        }
+        if self.throttle:
+            get_throttle(site=self.site)
+        data = query.GetData(params, self.site)
+        if 'error' in data or 'pages' not in data.get('query', {}):
+            # load all pages from the wiki
+            return
+        if 'normalized' in data['query']:
+            self._normalize(data['query']['normalized'])
+        for info in data['query']['pages'].itervalues():
+            if 'lastrevid' not in info:
+                # missing or invalid
+                continue
+            record = self.store.get(self.site, info['title'], info['lastrevid'])
+            if record is None:
+                continue
+            editRestriction = ''
+            moveRestriction = ''
+            for restr in info['protection']:
+                if restr['type'] == 'edit':
+                    editRestriction = restr['level']
+                elif restr['type'] == 'move':
+                    moveRestriction = restr['level']
+            self._stored.add(info['title'])
+            self.oneDone(xmlreader.XmlEntry(
+                info['title'], info['ns'], info['pageid'], record['*'],
+                record.get('user'), 'anon' in record,
+                str(parsetime2stamp(record['timestamp'])), editRestriction,
+                moveRestriction, record['revid'], record['comment'],
+                'redirect' in info))
+        self.pages = [page for page in self.pages
+                      if page.sectionFreeTitle() not in self._stored]
+
     def run(self):
+        if self.pages and self.store is not None:
+            self.loadStored()
         if self.pages:
             # Sometimes query does not contains revisions
             if  self.site.has_api() and debug:
@@ -4960,7 +5132,7 @@ class _GetAll(object):
 
                 self.headerDoneApi(data['query'])
                 if 'normalized' in data['query']:
-                    self._norm = dict([(x['from'],x['to']) for x in data['query']['normalized']])
+                    self._normalize(data['query']['normalized'])
                 for vals in data['query']['pages'].values():
                     self.oneDoneApi(vals)
             else: #read pages via Special:Export
@@ -5023,60 +5195,67 @@ class _GetAll(object):
         moveRestriction = entry.moveRestriction
         revisionId = entry.revisionid
 
-        page = Page(self.site, title)
-        successful = False
-        for page2 in self.pages:
-            if page2.sectionFreeTitle() == page.sectionFreeTitle():
-                if not (hasattr(page2,'_contents') or \
-                        hasattr(page2, '_getexception')) or self.force:
-                    page2.editRestriction = entry.editRestriction
-                    page2.moveRestriction = entry.moveRestriction
-                    if editRestriction == 'autoconfirmed':
-                        page2._editrestriction = True
-                    page2._permalink = entry.revisionid
-                    page2._userName = username
-                    page2._ipedit = ipedit
-                    page2._revisionId = revisionId
-                    page2._editTime = timestamp
-                    page2._versionhistory = [
-                        (revisionId,
-                         time.strftime("%Y-%m-%dT%H:%M:%SZ",
-                                       time.strptime(str(timestamp),
-                                                     "%Y%m%d%H%M%S")),
-                         username, entry.comment)]
-                    section = page2.section()
-                    # Store the content
-                    page2._contents = text
-                    m = self.site.redirectRegex().match(text)
-                    if m:
-                        ## output(u"%s is a redirect" % page2.title(asLink=True))
-                        redirectto = m.group(1)
-                        if section and not "#" in redirectto:
-                            redirectto += "#" + section
-                        page2._getexception = IsRedirectPage
-                        page2._redirarg = redirectto
-
-                    # This is used for checking deletion conflict.
-                    # Use the data loading time.
-                    page2._startTime = time.strftime('%Y%m%d%H%M%S',
-                                                     time.gmtime())
-                    if section:
-                        m = re.search("=+[ ']*%s[ ']*=+" % re.escape(section), text)
-                        if not m:
-                            try:
-                                page2._getexception
-                                output(u"WARNING: Section not found: %s" % page2)
-                            except AttributeError:
-                                # There is no exception yet
-                                page2._getexception = SectionError
-                successful = True
-                # Note that there is no break here. The reason is that there
-                # might be duplicates in the pages list.
-        if not successful:
-            output(u"BUG>> title %s (%s) not found in list" % (title, page))
+        pages = self._pagesFor(title)
+        if not pages:
+            output(u"BUG>> title %s not found in list" % title)
             output(u'Expected one of: %s'
                    % u', '.join([unicode(page2) for page2 in self.pages]))
             raise PageNotFound
+        if self.store is not None and revisionId and \
+           title not in self._stored:
+            record = {'revid': revisionId, 'comment': entry.comment,
+                      'timestamp': time.strftime(
+                          "%Y-%m-%dT%H:%M:%SZ",
+                          time.strptime(str(timestamp), "%Y%m%d%H%M%S")),
+                      '*': text}
+            if username is not None:
+                record['user'] = username
+            if ipedit:
+                record['anon'] = u''
+            self.store.put(self.site, title, record)
+        for page2 in pages:
+            if not (hasattr(page2,'_contents') or \
+                    hasattr(page2, '_getexception')) or self.force:
+                page2.editRestriction = entry.editRestriction
+                page2.moveRestriction = entry.moveRestriction
+                if editRestriction == 'autoconfirmed':
+                    page2._editrestriction = True
+                page2._permalink = entry.revisionid
+                page2._userName = username
+                page2._ipedit = ipedit
+                page2._revisionId = revisionId
+                page2._editTime = timestamp
+                page2._versionhistory = [
+                    (revisionId,
+                     time.strftime("%Y-%m-%dT%H:%M:%SZ",
+                                   time.strptime(str(timestamp),
+                                                 "%Y%m%d%H%M%S")),
+                     username, entry.comment)]
+                section = page2.section()
+                # Store the content
+                page2._contents = text
+                m = self.site.redirectRegex().match(text)
+                if m:
+                    ## output(u"%s is a redirect" % page2.title(asLink=True))
+                    redirectto = m.group(1)
+                    if section and not "#" in redirectto:
+                        redirectto += "#" + section
+                    page2._getexception = IsRedirectPage
+                    page2._redirarg = redirectto
+
+                # This is used for checking deletion conflict.
+                # Use the data loading time.
+                page2._startTime = time.strftime('%Y%m%d%H%M%S',
+                                                 time.gmtime())
+                if section:
+                    m = re.search("=+[ ']*%s[ ']*=+" % re.escape(section), text)
+                    if not m:
+                        try:
+                            page2._getexception
+                            output(u"WARNING: Section not found: %s" % page2)
+                        except AttributeError:
+                            # There is no exception yet
+                            page2._getexception = SectionError
 
     def headerDone(self, header):
         # Verify version
@@ -5149,7 +5328,7 @@ class _GetAll(object):
         if curonly:
             predata['curonly'] = 'True'
         # Slow ourselves down
-        get_throttle(requestsize = len(self.pages))
+        get_throttle(requestsize=len(self.pages), site=self.site)
         # Now make the actual request to the server
         now = time.time()
         response, data = self.site.postForm(address, predata)
@@ -5182,70 +5361,65 @@ class _GetAll(object):
                 elif revs['type'] == 'move':
                     moveRestriction = revs['level']
 
-        page = Page(self.site, title)
-        successful = False
-        for page2 in self.pages:
-            if hasattr(self, '_norm') and page2.sectionFreeTitle() in self._norm:
-                page2._title = self._norm[page2.sectionFreeTitle()]
-
-            if page2.sectionFreeTitle() == page.sectionFreeTitle():
-                if 'missing' in data:
-                    page2._getexception = NoPage
-                    successful = True
-                    break
-
-                if 'invalid' in data:
-                    page2._getexception = BadTitle
-                    successful = True
-                    break
-
-                if not (hasattr(page2,'_contents') or hasattr(page2,'_getexception')) or self.force:
-                    page2.editRestriction = editRestriction
-                    page2.moveRestriction = moveRestriction
-                    if editRestriction == 'autoconfirmed':
-                        page2._editrestriction = True
-                    page2._permalink = revisionId
-                    if rev:
-                        page2._userName = username
-                        page2._ipedit = ipedit
-                        page2._editTime = timestamp
-                        page2._contents = text
-                    else:
-                        raise KeyError(
-                            u'BUG?>>: Last revision of [[%s]] not found'
-                            % title)
-                    page2._revisionId = revisionId
-                    section = page2.section()
-                    if 'redirect' in data:
-                        ## output(u"%s is a redirect" % page2.title(asLink=True))
-                        m = self.site.redirectRegex().match(text)
-                        redirectto = m.group(1)
-                        if section and not "#" in redirectto:
-                            redirectto += "#" + section
-                        page2._getexception = IsRedirectPage
-                        page2._redirarg = redirectto
-
-                    # This is used for checking deletion conflict.
-                    # Use the data loading time.
-                    page2._startTime = time.strftime('%Y%m%d%H%M%S', time.gmtime())
-                    if section:
-                        m = re.search("=+[ ']*%s[ ']*=+" % re.escape(section), text)
-                        if not m:
-                            try:
-                                page2._getexception
-                                output(u"WARNING: Section not found: %s"
-                                       % page2)
-                            except AttributeError:
-                                # There is no exception yet
-                                page2._getexception = SectionError
-                successful = True
-                # Note that there is no break here. The reason is that there
-                # might be duplicates in the pages list.
-        if not successful:
-            output(u"BUG>> title %s (%s) not found in list" % (title, page))
+        pages = self._pagesFor(title)
+        if not pages:
+            output(u"BUG>> title %s not found in list" % title)
             output(u'Expected one of: %s'
                    % u', '.join([unicode(page2) for page2 in self.pages]))
             raise PageNotFound
+        if self.store is not None and \
+           not ('missing' in data or 'invalid' in data):
+            record = rev[0].copy()
+            record['revid'] = revisionId
+            self.store.put(self.site, title, record)
+        for page2 in pages:
+            if 'missing' in data:
+                page2._getexception = NoPage
+                continue
+
+            if 'invalid' in data:
+                page2._getexception = BadTitle
+                continue
+
+            if not (hasattr(page2,'_contents') or hasattr(page2,'_getexception')) or self.force:
+                page2.editRestriction = editRestriction
+                page2.moveRestriction = moveRestriction
+                if editRestriction == 'autoconfirmed':
+                    page2._editrestriction = True
+                page2._permalink = revisionId
+                if rev:
+                    page2._userName = username
+                    page2._ipedit = ipedit
+                    page2._editTime = timestamp
+                    page2._contents = text
+                else:
+                    raise KeyError(
+                        u'BUG?>>: Last revision of [[%s]] not found'
+                        % title)
+                page2._revisionId = revisionId
+                section = page2.section()
+                if 'redirect' in data:
+                    ## output(u"%s is a redirect" % page2.title(asLink=True))
+                    m = self.site.redirectRegex().match(text)
+                    redirectto = m.group(1)
+                    if section and not "#" in redirectto:
+                        redirectto += "#" + section
+                    page2._getexception = IsRedirectPage
+                    page2._redirarg = redirectto
+
+                # This is used for checking deletion conflict.
+                # Use the data loading time.
+                page2._startTime = time.strftime('%Y%m%d%H%M%S', time.gmtime())
+                if section:
+                    m = re.search("=+[ ']*%s[ ']*=+" % re.escape(section), text)
+                    if not m:
+                        try:
+                            page2._getexception
+                            output(u"WARNING: Section not found: %s"
+                                   % page2)
+                        except AttributeError:
+                            # There is no exception yet
+                            page2._getexception = SectionError
 
     def headerDoneApi(self, header):
         p = re.compile('^MediaWiki (.+)$')
@@ -5311,7 +5485,7 @@ class _GetAll(object):
         }
 
         # Slow ourselves down
-        get_throttle(requestsize = len(self.pages))
+        get_throttle(requestsize=len(self.pages), site=self.site)
         # Now make the actual request to the server
         now = time.time()
 
@@ -5345,7 +5519,7 @@ def getall(site, pages, throttle=True, force=False):
                 output(u'Getting pages %d - %d of %d...' % (pagg + 1, pagg + limit, len(pages)))
                 _GetAll(site, k, throttle, force).run()
                 pages[pagg:pagg + limit] = k
-            get_throttle(requestsize = len(pages) / 10) # one time to retrieve is 7.7 sec.
+            get_throttle(requestsize=len(pages) / 10, site=site) # one time to retrieve is 7.7 sec.
     else:
         _GetAll(site, pages, throttle, force).run()
 
@@ -5926,7 +6100,13 @@ class Site(object):
         return '%s:%s' % (self.family.name, self.code)
 
     def __hash__(self):
-        return hash(repr(self))
+        # Sites are keys of many dictionaries, e.g. the title cache of Page;
+        # family and code do not change, so neither does the hash.
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash(repr(self))
+            return self._hash
 
     def linktrail(self):
         """Return regex for trailing chars displayed as part of a link.
@@ -6370,6 +6550,16 @@ sysopnames['%s']['%s']='name' to your user-config.py"""
             except KeyboardInterrupt:
                 raise
             except urllib2.HTTPError, e:
+                retryAfter = parseRetryAfter(e.info().get('retry-after'))
+                if e.code in [429, 503] and retryAfter is not None \
+                   and config.retry_on_fail \
+                   and retry_attempt < config.maxretries:
+                    # the server tells us when to try again
+                    retry_attempt += 1
+                    output(u'HTTPError: %s %s. Retrying in %i seconds...'
+                           % (e.code, e.msg, retryAfter))
+                    get_throttle.backoff(retryAfter, self)
+                    continue
                 if e.code in [401, 404]:
                     raise PageNotFound(u'Page %s could not be retrieved. Check your family file ?' % url)
                 # just check for HTTP Status 500 (Internal Server Error)?
@@ -7018,7 +7208,7 @@ sysopnames['%s']['%s']='name' to your user-config.py"""
             throttle = True
             path = self.search_address(urllib.quote_plus(key.encode('utf-8')),
                                        n=number, ns=namespaces)
-            get_throttle()
+            get_throttle(site=self)
             html = self.getUrl(path)
             entryR = re.compile(ur'<li><a href=".+?" title="(?P<title>.+?)">.+?</a>',
                                 re.DOTALL)
@@ -7158,7 +7348,7 @@ sysopnames['%s']['%s']='name' to your user-config.py"""
             while True:
                 path = self.newpages_address(n=number, namespace=namespace)
                 # The throttling is important here, so always enabled.
-                get_throttle()
+                get_throttle(site=self)
                 html = self.getUrl(path)
 
                 entryR = re.compile('<li[^>]*>(?P<date>.+?) \S*?<a href=".+?"'
@@ -7194,7 +7384,7 @@ sysopnames['%s']['%s']='name' to your user-config.py"""
         entryR = re.compile(ur'<li>\(<a href=".+?" title=".+?">.+?</a>\) .<a href=".+?" title="(?P<title>.+?)">.+?</a> .\[(?P<length>[\d.,]+).*?\]</li>', re.UNICODE)
 
         while True:
-            get_throttle()
+            get_throttle(site=self)
             html = self.getUrl(path)
             for m in entryR.finditer(html):
                 title = m.group('title')
@@ -7214,7 +7404,7 @@ sysopnames['%s']['%s']='name' to your user-config.py"""
         entryR = re.compile(ur'<li>\(<a href=".+?" title=".+?">.+?</a>\) .<a href=".+?" title="(?P<title>.+?)">.+?</a> .\[(?P<length>[\d.,]+).*?\]</li>', re.UNICODE)
 
         while True:
-            get_throttle()
+            get_throttle(site=self)
             html = self.getUrl(path)
 
             for m in entryR.finditer(html):
@@ -7234,7 +7424,7 @@ sysopnames['%s']['%s']='name' to your user-config.py"""
         seen = set()
         while True:
             path = self.categories_address(n=number)
-            get_throttle()
+            get_throttle(site=self)
             html = self.getUrl(path)
             entryR = re.compile(
                 '<li><a href=".+?" title="(?P<title>.+?)">.+?</a>.*?</li>')
@@ -7252,7 +7442,7 @@ sysopnames['%s']['%s']='name' to your user-config.py"""
         seen = set()
         while True:
             path = self.deadendpages_address(n=number)
-            get_throttle()
+            get_throttle(site=self)
             html = self.getUrl(path)
             entryR = re.compile(
                 '<li><a href=".+?" title="(?P<title>.+?)">.+?</a></li>')
@@ -7434,14 +7624,10 @@ sysopnames['%s']['%s']='name' to your user-config.py"""
 
         seen = set()
         while True:
-            data = query.GetData(params, self)
-            if 'error' in data:
-                raise RuntimeError('%s' % data['error'])
-            try:
-                rcData = data['query']['recentchanges']
-            except KeyError:
-                raise ServerError("The APIs don't return data, the site may be down")
-
+            # the first number changes are loaded, in several requests if
+            # number is higher than the limit of the API
+            rcData = query.QueryIterator(self, params, 'recentchanges',
+                                         'rclimit', limit=int(number))
             for i in rcData:
                 if i['pageid'] not in seen:
                     seen.add(i['pageid'])
@@ -7688,29 +7874,9 @@ sysopnames['%s']['%s']='name' to your user-config.py"""
         elif includeredirects == 'only':
             params['apfilterredir'] = 'redirects'
 
-        while True:
-            if throttle:
-                get_throttle()
-            data = query.GetData(params, self)
-            if verbose:
-                output('DEBUG: allpages>>> data.keys() %s' % data.keys())
-            if 'warnings' in data:
-                warning = data['warnings']['allpages']['*']
-                raise RuntimeError("API query warning: %s" % warning)
-            if 'error' in data:
-                raise RuntimeError("API query error: %s" % data)
-            if not 'allpages' in data['query']:
-                raise RuntimeError("API query error, no pages found: %s" % data)
-            count = 0
-            for p in data['query']['allpages']:
-                count += 1
-                yield Page(self, p['title'])
-                if count >= config.special_page_limit:
-                    break
-            if 'query-continue' in data and count < params['aplimit']:
-                params.update(data['query-continue']['allpages'])
-            else:
-                break
+        for p in query.QueryIterator(self, params, 'allpages', 'aplimit',
+                                     throttle=throttle, raiseWarnings=True):
+            yield Page(self, p['title'])
 
     def _allpagesOld(self, start='!', namespace=0, includeredirects=True,
                  throttle=True):
@@ -9113,45 +9279,36 @@ def inputChoice(question, answers, hotkeys, default = None):
     return data
 
 
-page_put_queue = Queue.Queue(config.max_queue_size)
-def async_put():
-    """Daemon; take pages from the queue and try to save them on the wiki."""
-    while True:
-        (page, newtext, comment, watchArticle,
-                 minorEdit, force, callback) = page_put_queue.get()
-        if page is None:
-            # an explicit end-of-Queue marker is needed for compatibility
-            # with Python 2.4; in 2.5, we could use the Queue's task_done()
-            # and join() methods
-            return
+from pywikibot import putqueue
+if config.put_async_journal:
+    _putjournal = putqueue.PutJournal(putqueue.journalFilename())
+else:
+    _putjournal = None
+page_put_queue = putqueue.PutQueue(config.max_queue_size,
+                                   config.put_async_workers, _putjournal)
+
+# the store of page contents (see pywikibot/contentcache.py), which is opened
+# when it is first used
+_contentStore = None
+_contentStoreLock = threading.Lock()
+
+def contentStore():
+    """Return the ContentStore of page contents, or None if
+    config.page_content_cache is not set.
+
+    """
+    global _contentStore
+    if _contentStore is None and config.page_content_cache:
+        _contentStoreLock.acquire()
         try:
-            page.put(newtext, comment, watchArticle, minorEdit, force)
-            error = None
-        except Exception, error:
-            pass
-        if callback is not None:
-            callback(page, error)
-            # if callback is provided, it is responsible for exception handling
-            continue
-        if isinstance(error, SpamfilterError):
-            output(u"Saving page %s prevented by spam filter: %s"
-                   % (page, error.url))
-        elif isinstance(error, PageNotSaved):
-            output(u"Saving page %s failed: %s" % (page, error))
-        elif isinstance(error, LockedPage):
-            output(u"Page %s is locked; not saved." % page)
-        elif isinstance(error, NoUsername):
-            output(u"Page %s not saved; sysop privileges required." % page)
-        elif error is not None:
-            tb = traceback.format_exception(*sys.exc_info())
-            output(u"Saving page %s failed:\n%s" % (page, "".join(tb)))
-
-_putthread = threading.Thread(target=async_put)
-# identification for debugging purposes
-_putthread.setName('Put-Thread')
-_putthread.setDaemon(True)
-## Don't start the queue if it is not necessary.
-#_putthread.start()
+            if _contentStore is None:
+                from pywikibot import contentcache
+                _contentStore = contentcache.ContentStore(
+                    config.datafilepath('cache', 'page-contents.db'),
+                    config.page_content_cache_size * 1048576)
+        finally:
+            _contentStoreLock.release()
+    return _contentStore
 
 def stopme():
     """This should be run when a bot does not interact with the Wiki, or
@@ -9168,21 +9325,21 @@ def _flush():
     """
     def remaining():
         import datetime
-        remainingPages = page_put_queue.qsize() - 1
-            # -1 because we added a None element to stop the queue
+        # the sites are saved in parallel, each at the rate of put_throttle
+        sizes = page_put_queue.siteSizes()
+        remainingPages = sum(sizes.values())
         remainingSeconds = datetime.timedelta(
-            seconds=(remainingPages * put_throttle.getDelay(True)))
+            seconds=(max(sizes.values() or [0]) * put_throttle.getDelay(True)))
         return (remainingPages, remainingSeconds)
 
-    page_put_queue.put((None, None, None, None, None, None, None))
-
-    if page_put_queue.qsize() > 1:
+    if page_put_queue.qsize() > 0:
         output(u'Waiting for %i pages to be put. Estimated time remaining: %s'
                % remaining())
 
-    while(_putthread.isAlive()):
+    while True:
         try:
-            _putthread.join(1)
+            if page_put_queue.join(1):
+                break
         except KeyboardInterrupt:
             answer = inputChoice(u"""\
 There are %i pages remaining in the queue. Estimated time remaining: %s
@@ -9195,11 +9352,30 @@ Really exit?"""
         get_throttle.drop()
     except NameError:
         pass
+    if verbose and _titleCache is not None:
+        output(u'Page title cache: %s' % _titleCache.statistics())
+    if _contentStore is not None:
+        if verbose:
+            output(u'Page content cache: %s' % _contentStore.statistics())
+        _contentStore.close()
+    if verbose:
+        for throttle in (get_throttle, put_throttle):
+            if throttle.stats:
+                output(throttle.statistics())
+    if verbose and connectionPool:
+        stats = connectionPool.stats
+        output(u'HTTP connections: %(requests)i requests, %(created)i '
+               u'connections opened, %(reused)i reused, %(discarded)i '
+               u'discarded, %(retried)i requests retried' % stats)
+    if connectionPool:
+        connectionPool.clear()
     if config.use_diskcache and not config.use_api:
+        import diskcache
         for site in _sites.itervalues():
-            if site._mediawiki_messages:
+            if isinstance(site._mediawiki_messages,
+                          diskcache.CachedReadOnlyDictI):
                 try:
-                    site._mediawiki_messages.delete()
+                    site._mediawiki_messages.close()
                 except OSError:
                     pass
 
@@ -9280,7 +9456,17 @@ if os.path.isfile(COOKIEFILE):
 cookieProcessor = urllib2.HTTPCookieProcessor(cj)
 
 
-MyURLopener = urllib2.build_opener(U2RedirectHandler)
+if config.http_keepalive:
+    from pywikibot.comms import keepalive
+    # Persistent connections, shared by all requests through MyURLopener
+    connectionPool = keepalive.ConnectionPool(config.http_pool_size,
+                                              config.http_idle_timeout)
+    MyURLopener = urllib2.build_opener(U2RedirectHandler,
+                                       keepalive.HTTPHandler(connectionPool),
+                                       keepalive.HTTPSHandler(connectionPool))
+else:
+    connectionPool = None
+    MyURLopener = urllib2.build_opener(U2RedirectHandler)
 
 if config.proxy['host']:
     proxyHandler = urllib2.ProxyHandler({'http':'http://%s/' % config.proxy['host'] })
@@ -14,6 +14,12 @@ For fastest processing, XmlDump uses the cElementTree library if available
 (this comes included with Python 2.5, and can be downloaded from
 http://www.effbot.org/ for earlier versions). If not found, it falls back
 to the older method using regular expressions.
+
+Wikimedia's multistream .bz2 dumps can be read from any block with the
+help of their index file, see MultistreamIndex.
+
+The XmlDumpScanner class applies a function to all entries of a dump in
+several worker processes, e.g. to search a large dump on all CPU cores.
 """
 #
 # (C) Pywikipedia bot team, 2005-2012
@@ -25,8 +31,14 @@ __version__='$Id: xmlreader.py 10259 2012-05-27 18:15:12Z xqt $'
 
 import threading
 import xml.sax
+import xml.sax.saxutils
 import codecs, re
+import bz2
+import collections
+import os
+import signal
 import wikipedia as pywikibot
+from pywikibot.tools import itergroup
 
 try:
     from xml.etree.cElementTree import iterparse
@@ -58,19 +70,33 @@ def parseRestrictions(restrictions):
     return editRestriction, moveRestriction
 
 
-class XmlEntry:
+class XmlEntry(object):
     """
     Represents a page.
+
+    To keep the millions of entries of a full-history dump small, XmlEntry
+    has no instance dictionary. Fields which were not read from the dump
+    (see the fields parameter of XmlDump) are None. The text of an entry
+    read by XmlDump is only taken from its <text> element when it is first
+    accessed; until then the entry keeps that element, which takes more
+    memory than the text itself.
     """
+    __slots__ = ('title', 'ns', 'id', '_text', 'username', 'ipedit',
+                 'timestamp', 'editRestriction', 'moveRestriction',
+                 'revisionid', 'comment', 'isredirect', '_textElement')
+
     def __init__(self, title, ns, id, text, username, ipedit, timestamp,
-                 editRestriction, moveRestriction, revisionid, comment,
-                 redirect):
+                 editRestriction, moveRestriction, revisionid, comment=None,
+                 redirect=False):
         # TODO: there are more tags we can read.
         self.title = title
         self.ns = ns
-        self.id =id
-        self.text = text
-        self.username = username.strip()
+        self.id = id
+        self._text = text
+        self._textElement = None
+        if username is not None:
+            username = username.strip()
+        self.username = username
         self.ipedit = ipedit
         self.timestamp = timestamp
         self.editRestriction = editRestriction
@@ -79,6 +105,28 @@ class XmlEntry:
         self.comment = comment
         self.isredirect = redirect
 
+    def _getText(self):
+        element = self._textElement
+        if element is not None:
+            self._text = element.text or u''
+            self._textElement = None
+        return self._text
+
+    def _setText(self, text):
+        self._text = text
+        self._textElement = None
+
+    text = property(_getText, _setText)
+
+    def __getstate__(self):
+        # pickle the text, not the element it is read from
+        self._getText()
+        return tuple([getattr(self, name) for name in self.__slots__])
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
 
 class XmlHeaderEntry:
     """
@@ -247,6 +295,251 @@ class MediaWikiXmlHandler(xml.sax.handler.ContentHandler):
                 self.namespace += data
 
 
+def _streamEnded(decompressor):
+    """Return True if decompressor has reached the end of its bz2 stream."""
+    try:
+        decompressor.decompress('')
+    except EOFError:
+        return True
+    return False
+
+
+def _iterStreams(f, start=0, end=None, chunksize=1024 * 1024):
+    """
+    Decompress the concatenated bz2 streams in file f from byte offset start
+    up to end (or the end of the file); start must be the beginning of a
+    stream.
+
+    Yields (offset, data) tuples, where offset is the byte offset of the
+    stream which data was decompressed from.
+    """
+    f.seek(start)
+    pos = start
+    streamStart = start
+    decompressor = bz2.BZ2Decompressor()
+    while end is None or pos < end:
+        if end is None:
+            raw = f.read(chunksize)
+        else:
+            raw = f.read(min(chunksize, end - pos))
+        if not raw:
+            break
+        pos += len(raw)
+        while raw:
+            if _streamEnded(decompressor):
+                # the previous stream ended exactly at the end of a chunk
+                decompressor = bz2.BZ2Decompressor()
+                streamStart = pos - len(raw)
+            data = decompressor.decompress(raw)
+            if data:
+                yield streamStart, data
+            raw = decompressor.unused_data
+            if raw:
+                decompressor = bz2.BZ2Decompressor()
+                streamStart = pos - len(raw)
+
+
+class MultistreamBZ2File(object):
+    """
+    Read-only file-like object for the decompressed contents of some byte
+    ranges of a multistream bz2 file.
+
+    ranges is a list of (start, end) byte offsets, end may be None for the
+    end of the file. Every range must start and end at stream boundaries.
+    If the contents do not end with a closing </mediawiki> tag, one is
+    added, so that the result is a well-formed XML dump.
+    """
+    def __init__(self, filename, ranges=[(0, None)]):
+        self.file = open(filename, 'rb')
+        self.ranges = ranges
+        self._pieces = self._iterPieces()
+        # the current piece and how much of it has been read
+        self._piece = ''
+        self._pos = 0
+
+    def _iterPieces(self):
+        tail = ''
+        for start, end in self.ranges:
+            for offset, data in _iterStreams(self.file, start, end):
+                tail = (tail + data)[-32:]
+                yield data
+        if '</mediawiki>' not in tail:
+            yield '</mediawiki>\n'
+
+    def read(self, size=-1):
+        # only the returned bytes are copied, never the rest of a piece
+        chunks = []
+        while size != 0:
+            if self._pos == len(self._piece):
+                try:
+                    self._piece = self._pieces.next()
+                except StopIteration:
+                    break
+                self._pos = 0
+                continue
+            end = len(self._piece)
+            if size > 0:
+                end = min(end, self._pos + size)
+                size -= end - self._pos
+            chunks.append(self._piece[self._pos:end])
+            self._pos = end
+        return ''.join(chunks)
+
+    def close(self):
+        self.file.close()
+
+
+class MultistreamIndex(object):
+    """
+    The index of a Wikimedia multistream .bz2 dump.
+
+    The dump consists of bz2 streams which can be decompressed separately:
+    one with the <siteinfo> header, then blocks of (usually 100) pages. The
+    index file has one "offset:pageid:title" line per page, where offset is
+    the byte offset of the page's block in the dump. Blocks are numbered
+    from 0 in the order of the dump.
+
+    The index file may be compressed with bz2 (as downloaded) or not. If
+    there is no index, build() can create one from the dump.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        # byte offset and first title of each block, loaded on first use
+        self._offsets = None
+        self._firstTitles = None
+
+    @staticmethod
+    def indexFilename(dumpFilename):
+        """
+        Return the filename of the index of a multistream dump as named by
+        Wikimedia, e.g. xxwiki-20130101-pages-articles-multistream-index.txt.bz2
+        for xxwiki-20130101-pages-articles-multistream.xml.bz2, or None if
+        there is no such file.
+        """
+        if not dumpFilename.endswith('.xml.bz2'):
+            return None
+        base = dumpFilename[:-len('.xml.bz2')]
+        for filename in (base + '-index.txt.bz2', base + '-index.txt'):
+            if os.path.exists(filename):
+                return filename
+        return None
+
+    @staticmethod
+    def build(dumpFilename, indexFilename):
+        """Write the index of the multistream dump dumpFilename."""
+        Rpage = re.compile(r'<page>\s*<title>(.*?)</title>.*?<id>(\d+)</id>',
+                           re.DOTALL)
+        f = open(dumpFilename, 'rb')
+        out = open(indexFilename, 'wb')
+        try:
+            current = None
+            text = ''
+            for offset, data in _iterStreams(f):
+                if offset != current:
+                    text = ''
+                    current = offset
+                text += data
+                # write the complete pages of the stream, keep the rest
+                end = text.rfind('</page>')
+                if end == -1:
+                    continue
+                for m in Rpage.finditer(text, 0, end):
+                    title = xml.sax.saxutils.unescape(m.group(1),
+                                                      {'&quot;': '"'})
+                    out.write('%d:%s:%s\n' % (offset, m.group(2), title))
+                text = text[end:]
+        finally:
+            out.close()
+            f.close()
+
+    def _lines(self):
+        """Yield (offset, pageid, title) for each line of the index."""
+        f = open(self.filename, 'rb')
+        try:
+            if self.filename.endswith('.bz2'):
+                chunks = (data for offset, data in _iterStreams(f))
+            else:
+                chunks = iter(lambda: f.read(1024 * 1024), '')
+            rest = ''
+            for chunk in chunks:
+                lines = (rest + chunk).split('\n')
+                rest = lines.pop()
+                for line in lines:
+                    offset, pageid, title = line.split(':', 2)
+                    yield int(offset), pageid, title.decode('utf-8')
+            if rest:
+                offset, pageid, title = rest.split(':', 2)
+                yield int(offset), pageid, title.decode('utf-8')
+        finally:
+            f.close()
+
+    def _load(self):
+        if self._offsets is not None:
+            return
+        self._offsets = []
+        self._firstTitles = []
+        for offset, pageid, title in self._lines():
+            if not self._offsets or offset != self._offsets[-1]:
+                self._offsets.append(offset)
+                self._firstTitles.append(title)
+
+    def __len__(self):
+        """Return the number of blocks."""
+        self._load()
+        return len(self._offsets)
+
+    def headerEnd(self):
+        """Return the byte offset of the first block."""
+        self._load()
+        return self._offsets[0]
+
+    def block(self, title):
+        """Return the number of the block containing title, or None."""
+        # a single pass over the index, without keeping its titles
+        block = -1
+        previous = None
+        for offset, pageid, pageTitle in self._lines():
+            if offset != previous:
+                block += 1
+                previous = offset
+            if pageTitle == title:
+                return block
+        return None
+
+    def firstTitle(self, block):
+        """Return the title of the first page of block."""
+        self._load()
+        return self._firstTitles[block]
+
+    def byteRange(self, first, last):
+        """
+        Return the (start, end) byte offsets of blocks first to last
+        (inclusive, None for the last block of the dump); end is None if
+        last is the last block.
+        """
+        self._load()
+        if last is None:
+            last = len(self._offsets) - 1
+        if last + 1 < len(self._offsets):
+            return self._offsets[first], self._offsets[last + 1]
+        return self._offsets[first], None
+
+    def blockRanges(self, count):
+        """
+        Split the blocks into count disjoint ranges of about the same size.
+
+        Returns a list of (first, last) tuples, e.g. for parallel workers.
+        """
+        size = len(self)
+        ranges = []
+        for i in range(count):
+            first = size * i // count
+            last = size * (i + 1) // count - 1
+            if first <= last:
+                ranges.append((first, last))
+        return ranges
+
+
 class XmlParserThread(threading.Thread):
     """
     This XML parser will run as a single thread. This allows the XmlDump
@@ -277,13 +570,48 @@ class XmlDump(object):
         Only available for cElementTree version:
         If True, parse all revisions instead of only the latest one.
         Default: False.
+    @param index: the filename of the index of a multistream .bz2 dump, or a
+        MultistreamIndex. By default, an index file next to the dump is
+        used if it exists (see MultistreamIndex.indexFilename).
+    @param start: skip all pages before the one with this title. With an
+        index, reading starts directly at the block of that page.
+    @param blocks: (first, last) tuple; only read these blocks of a
+        multistream dump (requires an index). last may be None to read up
+        to the end of the dump.
+    @param fields: the names of the XmlEntry fields to read, e.g.
+        ('title', 'ns', 'isredirect'); with cElementTree, the other fields
+        are None. Default: all fields. The title is always read.
     """
-    def __init__(self, filename, allrevisions=False):
+    # the fields of XmlEntry read from <page> and from <revision>
+    pageFields = ('title', 'ns', 'id', 'isredirect', 'editRestriction',
+                  'moveRestriction')
+    revisionFields = ('text', 'username', 'ipedit', 'timestamp',
+                      'revisionid', 'comment')
+
+    def __init__(self, filename, allrevisions=False, index=None, start=None,
+                 blocks=None, fields=None):
         self.filename = filename
+        self.allrevisions = allrevisions
+        if fields is None:
+            fields = self.pageFields + self.revisionFields
+        for field in fields:
+            if field not in self.pageFields + self.revisionFields:
+                raise ValueError(u'Unknown XmlEntry field %s' % field)
+        self.fields = frozenset(fields)
         if allrevisions:
             self._parse = self._parse_all
         else:
             self._parse = self._parse_only_latest
+        if index is None:
+            index = MultistreamIndex.indexFilename(filename)
+        if isinstance(index, basestring):
+            index = MultistreamIndex(index)
+        self.index = index
+        self.start = start
+        self.blocks = blocks
+        if blocks is not None and index is None:
+            raise ValueError(u'Reading blocks of %s requires an index'
+                             % filename)
 
     def parse(self):
         """Return a generator that will yield XmlEntry objects"""
@@ -292,14 +620,44 @@ class XmlDump(object):
             pywikibot.output(
 u'''WARNING: cElementTree not found. Using slower fallback solution.
 Consider installing the python-celementtree package.''')
-            return self.regex_parse()
+            parser = self.regex_parse()
         else:
-            return self.new_parse()
+            parser = self.new_parse()
+        if self.start:
+            return self._skip(parser)
+        return parser
+
+    def _skip(self, parser):
+        """Skip the entries before the one titled self.start"""
+        skipping = True
+        for entry in parser:
+            if skipping:
+                if entry.title != self.start:
+                    continue
+                skipping = False
+            yield entry
+
+    def _byteRanges(self):
+        """Return the byte ranges of the multistream dump to read"""
+        if self.blocks is not None:
+            first, last = self.blocks
+        elif self.start:
+            first = self.index.block(self.start)
+            if first is None:
+                pywikibot.output(u'WARNING: %s not found in %s'
+                                 % (self.start, self.index.filename))
+                return [(0, None)]
+            last = len(self.index) - 1
+        else:
+            return [(0, None)]
+        return [(0, self.index.headerEnd()),
+                self.index.byteRange(first, last)]
 
     def new_parse(self):
         """Generator using cElementTree iterparse function"""
-        if self.filename.endswith('.bz2'):
-            import bz2
+        if self.filename.endswith('.bz2') and self.index is not None:
+            source = MultistreamBZ2File(self.filename, self._byteRanges())
+        elif self.filename.endswith('.bz2'):
             source = bz2.BZ2File(self.filename)
         elif self.filename.endswith('.gz'):
             import gzip
@@ -320,6 +678,7 @@ Consider installing the python-celementtree package.''')
         for event, elem in context:
             if event == "start-ns" and elem[0] == "":
                 self.uri = elem[1]
+                self._setTags()
                 continue
             if event == "start" and self.root is None:
                 self.root = elem
@@ -327,57 +686,77 @@ Consider installing the python-celementtree package.''')
             for rev in self._parse(event, elem):
                 yield rev
 
+    def _setTags(self):
+        """Qualify the tag names used by the parser with self.uri"""
+        for tag in ('page', 'revision', 'title', 'ns', 'id', 'restrictions',
+                    'redirect', 'timestamp', 'comment', 'contributor', 'ip',
+                    'username', 'text'):
+            setattr(self, '_%sTag' % tag, '{%s}%s' % (self.uri, tag))
+
     def _parse_only_latest(self, event, elem):
         """Parser that yields only the latest revision"""
-        if event == "end" and elem.tag == "{%s}page" % self.uri:
+        if event == "end" and elem.tag == self._pageTag:
             self._headers(elem)
-            revision = elem.find("{%s}revision" % self.uri)
+            revision = elem.find(self._revisionTag)
             yield self._create_revision(revision)
             elem.clear()
             self.root.clear()
 
     def _parse_all(self, event, elem):
         """Parser that yields all revisions"""
-        if event == "start" and elem.tag == "{%s}page" % self.uri:
+        if event == "start" and elem.tag == self._pageTag:
+            self._page = elem
             self._headers(elem)
-        if event == "end" and elem.tag == "{%s}revision" % self.uri:
+        if event == "end" and elem.tag == self._revisionTag:
             yield self._create_revision(elem)
-            elem.clear()
+            # Drop the revision from the page instead of clearing it, as its
+            # entry may not have read its text yet.
+            self._page.remove(elem)
             self.root.clear()
 
     def _headers(self, elem):
-        self.title = elem.findtext("{%s}title" % self.uri)
-        self.ns = elem.findtext("{%s}ns" % self.uri)
-        self.pageid = elem.findtext("{%s}id" % self.uri)
-        self.restrictions = elem.findtext("{%s}restrictions" % self.uri)
-        self.isredirect = elem.findtext("{%s}redirect" % self.uri) is not None
-        self.editRestriction, self.moveRestriction \
-                              = parseRestrictions(self.restrictions)
-
+        fields = self.fields
+        self.title = elem.findtext(self._titleTag)
+        self.ns = self.pageid = self.isredirect = None
+        self.editRestriction = self.moveRestriction = None
+        if 'ns' in fields:
+            self.ns = elem.findtext(self._nsTag)
+        if 'id' in fields:
+            self.pageid = elem.findtext(self._idTag)
+        if 'isredirect' in fields:
+            self.isredirect = elem.find(self._redirectTag) is not None
+        if 'editRestriction' in fields or 'moveRestriction' in fields:
+            self.editRestriction, self.moveRestriction \
+                = parseRestrictions(elem.findtext(self._restrictionsTag))
 
     def _create_revision(self, revision):
         """Creates a Single revision"""
-        revisionid = revision.findtext("{%s}id" % self.uri)
-        timestamp = revision.findtext("{%s}timestamp" % self.uri)
-        comment = revision.findtext("{%s}comment" % self.uri)
-        contributor = revision.find("{%s}contributor" % self.uri)
-        ipeditor = contributor.findtext("{%s}ip" % self.uri)
-        username = ipeditor or contributor.findtext("{%s}username" % self.uri)
-        # could get comment, minor as well
-        text = revision.findtext("{%s}text" % self.uri)
-        return XmlEntry(title=self.title,
-                        ns=self.ns,
-                        id=self.pageid,
-                        text=text or u'',
-                        username=username or u'', #username might be deleted
-                        ipedit=bool(ipeditor),
-                        timestamp=timestamp,
-                        editRestriction=self.editRestriction,
-                        moveRestriction=self.moveRestriction,
-                        revisionid=revisionid,
-                        comment=comment,
-                        redirect=self.isredirect
-                       )
+        fields = self.fields
+        entry = XmlEntry(self.title, self.ns, self.pageid, None, None, None,
+                         None, self.editRestriction, self.moveRestriction,
+                         None, None, self.isredirect)
+        if 'revisionid' in fields:
+            entry.revisionid = revision.findtext(self._idTag)
+        if 'timestamp' in fields:
+            entry.timestamp = revision.findtext(self._timestampTag)
+        if 'comment' in fields:
+            entry.comment = revision.findtext(self._commentTag)
+        if 'username' in fields or 'ipedit' in fields:
+            contributor = revision.find(self._contributorTag)
+            ipeditor = contributor.findtext(self._ipTag)
+            username = ipeditor or contributor.findtext(self._usernameTag)
+            if 'username' in fields:
+                # username might be deleted
+                entry.username = (username or u'').strip()
+            if 'ipedit' in fields:
+                entry.ipedit = bool(ipeditor)
+        # could get minor as well
+        if 'text' in fields:
+            # read lazily by XmlEntry.text
+            entry._textElement = revision.find(self._textTag)
+            if entry._textElement is None:
+                entry._text = u''
+        return entry
 
     def regex_parse(self):
         """
@@ -449,3 +828,186 @@ Consider installing the python-celementtree package.''')
                                    moveRestriction=moveRestriction,
                                    revisionid=m.group('revisionid')
                                   )
+
+
+# The function applied by a worker process of XmlDumpScanner, and the dump
+# it reads blocks of. They are set by _initScanWorker, so that they are only
+# transferred once per process.
+_scanFunction = None
+_scanDump = None
+
+
+def _initScanWorker(function, dump=None):
+    global _scanFunction, _scanDump
+    _scanFunction = function
+    _scanDump = dump
+    # Let the main process handle Ctrl-C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _scanChunk(chunk):
+    return [(entry.title, _scanFunction(entry)) for entry in chunk]
+
+
+def _scanBlocks(task):
+    first, last, start = task
+    dump = XmlDump(_scanDump.filename, _scanDump.allrevisions,
+                   _scanDump.index, start, (first, last), _scanDump.fields)
+    return [(entry.title, _scanFunction(entry)) for entry in dump.parse()]
+
+
+class TextFilter(object):
+    """
+    A picklable function for XmlDumpScanner which returns the title of
+    every entry whose text is matched by one of the regexes, else None.
+    """
+    def __init__(self, regexes):
+        self.regexes = [re.compile(regex) for regex in regexes]
+
+    def __call__(self, entry):
+        for regex in self.regexes:
+            if regex.search(entry.text):
+                return entry.title
+        return None
+
+
+class XmlDumpScanner(object):
+    """
+    Applies a function to all entries of an XML dump in several processes.
+
+    The dump is read in this process and sent in chunks of chunksize
+    entries to a pool of worker processes, which call function(entry) for
+    every entry. If the dump is a multistream .bz2 dump with an index,
+    each worker instead reads and parses blocksPerTask blocks of the dump
+    by itself. Iterating over the scanner yields the results which are
+    not None, in dump order if ordered is True, else in the order in which
+    the chunks are done. At most two chunks per process are in progress at
+    the same time.
+
+    function must be picklable if the platform does not fork (Windows),
+    e.g. a module-level function or an instance of a module-level class;
+    its results must always be picklable.
+
+    @param processes: number of worker processes; default: the number of
+        CPUs
+    @param start: skip all entries before the one with this title
+        (see -xmlstart)
+    @param allrevisions, index, fields: see XmlDump
+
+    If the iteration is interrupted, resumeTitle() returns the title from
+    which the scan should be restarted (with start) so that no result is
+    lost.
+    """
+    def __init__(self, filename, function, processes=None, ordered=True,
+                 start=None, chunksize=100, allrevisions=False, index=None,
+                 blocksPerTask=10, fields=None):
+        self.dump = XmlDump(filename, allrevisions, index, start,
+                            fields=fields)
+        self.function = function
+        if processes is None:
+            import multiprocessing
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+        self.ordered = ordered
+        self.start = start
+        self.chunksize = chunksize
+        self.blocksPerTask = blocksPerTask
+        # workers read blocks of a multistream dump themselves
+        self._blockMode = self.dump.index is not None \
+                          and filename.endswith('.bz2')
+        # number of entries read from the dump
+        self.count = 0
+        # tasks sent to the workers: deque of
+        # (number, title of the first entry, AsyncResult)
+        self._pending = collections.deque()
+        # number and titles of the task whose results are being yielded,
+        # and the index of the next title to yield
+        self._current = None
+
+    def _entries(self):
+        for entry in self.dump.parse():
+            self.count += 1
+            yield entry
+
+    def _tasks(self, pool):
+        """Yield (first title, AsyncResult) for the tasks sent to pool."""
+        if not self._blockMode:
+            for chunk in itergroup(self._entries(), self.chunksize):
+                yield chunk[0].title, pool.apply_async(_scanChunk, (chunk,))
+            return
+        index = self.dump.index
+        first = 0
+        start = None
+        if self.start:
+            first = index.block(self.start)
+            if first is None:
+                raise pywikibot.Error(u'%s not found in %s'
+                                      % (self.start, index.filename))
+            start = self.start
+        for block in range(first, len(index), self.blocksPerTask):
+            last = min(block + self.blocksPerTask, len(index)) - 1
+            yield (start or index.firstTitle(block),
+                   pool.apply_async(_scanBlocks, ((block, last, start),)))
+            start = None
+
+    def __iter__(self):
+        import multiprocessing
+        pool = multiprocessing.Pool(self.processes, _initScanWorker,
+                                    (self.function, self.dump))
+        try:
+            number = 0
+            for title, asyncResult in self._tasks(pool):
+                self._pending.append((number, title, asyncResult))
+                number += 1
+                while len(self._pending) >= 2 * self.processes:
+                    for result in self._results():
+                        yield result
+            while self._pending:
+                for result in self._results():
+                    yield result
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        pool.join()
+
+    def _results(self):
+        """Wait for a task to be done and yield its results."""
+        while True:
+            if self.ordered:
+                done = self._pending[0]
+            else:
+                done = None
+                for item in self._pending:
+                    if item[2].ready():
+                        done = item
+                        break
+            if done is not None and done[2].ready():
+                break
+            # wait with a timeout, so that KeyboardInterrupt gets through
+            self._pending[0][2].wait(0.25)
+        self._pending.remove(done)
+        number, title, asyncResult = done
+        results = asyncResult.get()
+        if self._blockMode:
+            self.count += len(results)
+        self._current = [number, [title for title, result in results], 0]
+        for title, result in results:
+            if result is not None:
+                yield result
+            self._current[2] += 1
+        self._current = None
+
+    def resumeTitle(self):
+        """Return the title to restart an interrupted scan with, or None."""
+        candidates = []
+        if self._current is not None:
+            number, titles, index = self._current
+            if index < len(titles):
+                candidates.append((number, titles[index]))
+        if self._pending:
+            number, title, asyncResult = self._pending[0]
+            candidates.append((number, title))
+        if not candidates:
+            return None
+        return min(candidates)[1]